@@ -2,7 +2,7 @@ import os
 from types import resolve_bases
 from dotenv import load_dotenv
 
-from flask import Flask, render_template, redirect, url_for, flash, request, jsonify, send_from_directory, Response, session
+from flask import Flask, render_template, redirect, url_for, flash, request, jsonify, send_from_directory, send_file, Response, session
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
@@ -13,10 +13,15 @@ from models import db, User
 from datetime import datetime, timedelta
 
 import base64
+import io
 import subprocess
 import random
 import time
 import re
+import csv
+import shutil
+import tempfile
+import zipfile
 
 
 # We are importing all the required functions from the following files inorder to make a huge app file?
@@ -25,6 +30,9 @@ import re
 from paperGuidesDB import *
 from config import *
 from logHandler import getCustomLogger
+from httpCache import conditionalPage, reloadableSources
+from thumbnails import queueThumbnails, getThumbnails, thumbnailKey
+from bulkImport import ZipSource, readManifest, importJobs
 
 # Load environment variables from .env file
 
@@ -52,7 +60,39 @@ logger = getCustomLogger(__name__)
 
 # path for the config
 configPath = './configs/config.json'
-config = loadConfig(configPath)
+
+# Most ratings accepted by one /rate request, a generated paper has questionsToGenerate of them
+maxRatingsPerRequest = 100
+
+# Subjects offered in the question generator
+generatorSubjects = ["Mathematics (9709)", "Physics (9702)", "Chemistry (9701)", "Biology (9700)"]
+
+
+def deriveSiteLookups(config):
+    """Lookups the routes need from config.json, computed once per config version"""
+    topicsBySubject = {
+        (board, subject["name"]): subject.get("topics", ())
+        for board, boardData in config.items()
+        for subject in boardData["subjects"]
+    }
+
+    generatorConfig = {board: dict(boardData) for board, boardData in config.items()}
+    generatorConfig["A Levels"]["subjects"] = [
+        subject for subject in config["A Levels"]["subjects"] if subject["name"] in generatorSubjects
+    ]
+
+    return {
+        "topicsBySubject": topicsBySubject,
+        "generatorJson": htmlsafe_json_dumps(generatorConfig)
+    }
+
+
+# Parsed once and reloaded only when the file changes, routes call siteConfig.get()
+siteConfig = ConfigService(configPath, deriveSiteLookups)
+reloadableSources.append(siteConfig.modifiedOn)
+
+# Papers admins upload are approved by the ingest queue once their files are stored, render them then
+paperApprovedListeners.append(queueThumbnails)
 
 
 # Initialize Flask-Login
@@ -73,6 +113,7 @@ def load_user(user_id):
     return User.query.get(int(user_id))
 
 @app.route('/')
+@conditionalPage()
 def index():
     logger.info(f'Home page accessed IP: {getClientIp()}')
     return render_template('index.html')
@@ -95,19 +136,20 @@ forgive me for this shit code.
 """
 
 @app.route('/levels')
+@conditionalPage()
 def getLevels():
     logger.info(f'Levels page accessed IP: {getClientIp()}')
-    config = loadConfig(configPath)
-    return render_template('levels.html',config=config, mode = "papers" )
+    return render_template('levels.html',config=siteConfig.get().data, mode = "papers" )
 
 @app.route('/subjects/<level>')
+@conditionalPage()
 def getLevelSubjects(level):
     logger.info(f'Subjects page accessed for level {level} IP: {getClientIp()}')
-    config = loadConfig(configPath)
-    return render_template('subject.html', config = config, level = level, mode = "papers")
+    return render_template('subject.html', config = siteConfig.get().data, level = level, mode = "papers")
 
 
 @app.route('/subjects/<level>/<subject_name>')
+@conditionalPage()
 def getSubjectYears(level, subject_name):
     logger.info(f'Years page accessed for level {level}, subject {subject_name} IP: {getClientIp()}')
     years = getYears(level,subject_name)
@@ -115,13 +157,15 @@ def getSubjectYears(level, subject_name):
 
 
 @app.route('/subjects/<level>/<subject_name>/<year>')
+@conditionalPage()
 def getSubjectQuestions(level ,subject_name, year):
     logger.info(f'Questions page accessed for level {level}, subject {subject_name}, year {year} IP: {getClientIp()}')
     question_name = getQuestions(level, subject_name, year)
-    return render_template('questions.html', questions_name = question_name, subject_name = subject_name ,year = year, config = config, level = level )
+    return render_template('questions.html', questions_name = question_name, subject_name = subject_name ,year = year, config = siteConfig.get().data, level = level )
 
 
 @app.route('/subjects/<level>/<subject_name>/<year>/<path:file_data>')
+@conditionalPage(versionKeys=("contentVersion", "thumbnailVersion"))
 def renderSubjectQuestion(level, subject_name, year, file_data):
     # Log the request
     logger.info(f'Question rendered for level {level}, subject {subject_name}, year {year}, file {file_data} IP: {getClientIp()}')
@@ -206,17 +250,19 @@ def renderSubjectQuestion(level, subject_name, year, file_data):
             f"{subject_name} Paper {component} {full_year}."
         )
 
-        # Render question
+        # Render question, the files themselves are fetched from /files/<uuid>/...
         question = renderQuestion(level, subject_name, full_year, component)
         
         # Return template with all necessary data
         return render_template(
             'qp.html',
-            question=question[0],
-            solution=question[1],
             file_data=file_data,
-            id=question[2],
-            config=config,
+            id=question[0],
+            question_hash=question[1],
+            solution_hash=question[2],
+            question_thumbnails=getThumbnails(question[1]),
+            solution_thumbnails=getThumbnails(question[2]),
+            config=siteConfig.get().data,
             keywords=", ".join(unique_keywords),
             meta_description=meta_description,
             subject_code=subject_code,
@@ -230,53 +276,52 @@ def renderSubjectQuestion(level, subject_name, year, file_data):
 
 
 @app.route('/topicals')
+@conditionalPage()
 def modelQuestions():
     logger.info(f'Topicals page accessed IP: {getClientIp()}')
-    config = loadConfig(configPath)
-    return render_template('levels.html',config=config, mode = "topicals" )
+    return render_template('levels.html',config=siteConfig.get().data, mode = "topicals" )
 
 @app.route('/topicals/<level>')
+@conditionalPage()
 def getLevelSubjectsForTopicals(level):
     logger.info(f'Subjects page accessed for level {level} IP: {getClientIp()}')
-    config = loadConfig(configPath)
-    return render_template('subject.html', config = config, level = level, mode = "topicals")
+    return render_template('subject.html', config = siteConfig.get().data, level = level, mode = "topicals")
 
 @app.route('/topicals/<level>/<subject_name>')
+@conditionalPage()
 def getTopicals(level, subject_name):
     logger.info(f'Topicals page accessed for level {level}, subject {subject_name} IP: {getClientIp()}')
     files = getTopicalFiles(level,subject_name)
-    config = loadConfig(configPath)
 
-    if level in ["A level", "AS level"]:
+    if normalizeLevel(level) == LEVEL_A_LEVEL:
         level = "A Levels"
     else:
         level = "NEB"
 
-    subjects = config[level]["subjects"]
-
-    for subject in subjects:
-        if subject["name"] == subject_name:
-            topics = subject["topics"]
-            break
+    topics = siteConfig.get()["topicsBySubject"].get((level, subject_name), ())
 
     return render_template('topicals.html', subject_name = subject_name, level = level, topics = topics, files = files)
 
 @app.route('/topicals/<level>/<subject_name>/<uuid>')
+@conditionalPage(versionKeys=("contentVersion", "thumbnailVersion"))
 def renderTopical(level ,subject_name, uuid):
     logger.info(f'Topical  page accessed for subject {subject_name}, uuid {uuid} IP: {getClientIp()}')
 
     question = renderTopcial(uuid)
-    return render_template('qp.html', question=question[0], solution= question[1], file_data = f"Topical question paper for {subject_name} and topic: {question[3]}",  id=question[2], config=config)
+    return render_template('qp.html', file_data = f"Topical question paper for {subject_name} and topic: {question[1]}",  id=question[0], config=siteConfig.get().data,
+                           question_hash=question[2], solution_hash=question[3],
+                           question_thumbnails=getThumbnails(question[2]), solution_thumbnails=getThumbnails(question[3]))
 
 
 @app.route('/view-pdf/<type>/<uuid>')
+@conditionalPage()
 def viewPdf(type, uuid):
     logger.info(f'{type}: {uuid} rendered in full screen. IP: {getClientIp()}')
 
-    paper = get_paper(uuid)
+    paper = get_paper(uuid, includeFiles=False)
 
     if paper == None:
-        paper = get_topical(uuid)
+        paper = get_topical(uuid, includeFiles=False)
 
         if type == "solution":
             title = f'{paper["subject"]} MS'
@@ -289,8 +334,8 @@ def viewPdf(type, uuid):
             subjectCodeMatch = re.search(r"\d+", paper["subject"])
             subjectCode = subjectCodeMatch.group(0) if subjectCodeMatch else paper["subject"]
 
-            yearStr = str(paper["year"])
-            session = "MJ" if "May / June" in yearStr else "ON" if "Oct / Nov" in yearStr else "FM"
+            yearStr = str(paper["yearNumber"] or paper["year"])
+            session = {"may-june": "MJ", "oct-nov": "ON", "specimen": "SP"}.get(paper["session"], "FM")
 
 
             if type == "solution":
@@ -306,17 +351,91 @@ def viewPdf(type, uuid):
     if paper == None:
         return render_template('404.html'), 404
 
-    if type == "question":
-        return render_template('qp-full.html', question=paper["questionFile"], title=title), 200
-    elif type == "solution":
-        return render_template('qp-full.html', question=paper["solutionFile"], title=title), 200
+    if type in ["question", "solution"]:
+        return render_template('qp-full.html', file_url=url_for('serveFile', uuid=uuid, fileType=type), title=title), 200
     else:
         return redirect(url_for('index')), 304
 
 
+# Serves the actual PDF / image so pages only carry a link to it instead of the whole file
+
+@app.route('/files/<uuid>/<fileType>')
+def serveFile(uuid, fileType):
+    reference = getFileReference(uuid, fileType)
+    if reference is None:
+        return render_template('404.html'), 404
+
+    isAdmin = current_user.is_authenticated and current_user.role == 'admin'
+    if not reference["approved"] and not isAdmin:
+        logger.warning(f'Unapproved {fileType} file {uuid} requested IP: {getClientIp()}')
+        return render_template('404.html'), 404
+
+    # Approved files are cached for a month. Files still waiting for approval are revalidated on
+    # every request so a browser doesn't keep one after it is rejected or relabelled.
+    maxAge = 60 * 60 * 24 * 30 if reference["approved"] else 0
+
+    # Clients accepting the stored encoding get the blob as it is. Range requests (PDF viewers)
+    # get the decoded file, their byte offsets are meant for it.
+    acceptedEncodings = {value for value, quality in request.accept_encodings if quality > 0} if request.range is None else set()
+    encoded = getEncodedFile(reference, acceptedEncodings)
+
+    if encoded is not None:
+        source, mimetype, contentEncoding = encoded
+        response = send_file(
+            source,
+            mimetype=mimetype,
+            conditional=True,
+            etag=f'{reference["hash"]}.{contentEncoding}',
+            max_age=maxAge
+        )
+        response.headers['Content-Encoding'] = contentEncoding
+    else:
+        path = getCachedFilePath(reference)
+        if path is None:
+            logger.error(f'{fileType} file {uuid} is missing from storage')
+            return render_template('404.html'), 404
+
+        # send_file answers Range and If-None-Match requests against the strong content hash ETag.
+        # It resolves relative paths against the app folder, the storage paths are relative to the working directory.
+        response = send_file(
+            os.path.abspath(path),
+            mimetype=detectMimeType(path),
+            conditional=True,
+            etag=reference["hash"],
+            max_age=maxAge
+        )
+    response.vary.add('Accept-Encoding')
+    if not reference["approved"]:
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+    return response
+
+
+# WebP page renders, the url holds the content hash so they can be cached for good
+
+@app.route('/thumbnails/<contentHash>/<int:page>/<int:width>.webp')
+def serveThumbnail(contentHash, page, width):
+    key = thumbnailKey(contentHash, page, width)
+    data = blobStore.get(key)
+    if data is None:
+        return render_template('404.html'), 404
+
+    response = send_file(
+        io.BytesIO(data),
+        mimetype='image/webp',
+        conditional=True,
+        etag=key,
+        max_age=60 * 60 * 24 * 365
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
 # Reders the about page. Duh
 
 @app.route('/about')
+@conditionalPage()
 def about():
     logger.info(f'About page accessed IP: {getClientIp()}')
     return render_template('about.html')
@@ -327,66 +446,87 @@ def about():
 
 @app.route('/question-generator')
 def questionGenerator():
-    allowedSubjects = ["Mathematics (9709)", "Physics (9702)", "Chemistry (9701)", "Biology (9700)"]
     logger.info(f'Question generator page accessed IP: {getClientIp()}')
 
-    config = loadConfig(configPath)
-
-    # Filter subjects for A Levels
-    config["A Levels"]["subjects"] = [
-        subject for subject in config["A Levels"]["subjects"] if subject["name"] in allowedSubjects
-    ]
-
-    return render_template('question-generator.html', config=config)
+    # A Levels subjects are already filtered down to generatorSubjects
+    return render_template('question-generator.html', config_json=siteConfig.get()["generatorJson"])
 
 
 # This route displays the questions the uppper route genetated a diffrent page and route
+# The form POST picks a seed and redirects to a GET url, so a generated paper can be reopened and shared
+generatorFields = ['board', 'subject', 'level', 'topic', 'difficulty', 'component', 'mode', 'topicQuota', 'difficultyQuota', 'minScore', 'maxScore', 'order']
+
+def parseQuotas(text):
+    """Turn "Waves=5, Forces=3" into {"Waves": 5, "Forces": 3}, malformed entries are ignored"""
+    quotas = {}
+    for entry in (text or "").split(","):
+        name, _, count = entry.rpartition("=")
+        if name.strip() and count.strip().isdigit():
+            quotas[name.strip()] = int(count)
+    return quotas
+
 @app.route('/question-gen', methods=['POST', 'GET'])
 def questionGen():
     logger.info(f'Question generation initiated IP: {getClientIp()}')
     if request.method == 'POST':
-        try:
-            # Extract form data
-            board = request.form.get('board')
-            subject = request.form.get('subject')
-            level = request.form.get('level')
-            topics = request.form.getlist('topic')
-            difficulties = request.form.getlist('difficulty')
-            components = request.form.getlist('component')
-
-            # Handle ALL selections
-            if 'ALL' in topics:
-                topics = 'ALL'
-            else:
-                topics = [topic for topic in topics]
-
-            if 'ALL' in difficulties:
-                difficulties = 'ALL'
-            else:
-                difficulties = [difficulty for difficulty in difficulties]
-
-            if 'ALL' in components:
-                components = 'ALL'
-            else:
-                components = [component for component in components]
-
-            # Get questions
-            rows = getQuestionsForGen(board, subject, level, topics, components, difficulties)
-
-            count = countQuestions(subject, level)
-            return render_template('qpgen.html', rows=rows, count = count)
-        except Exception as e:
-            logger.error(f'Error in question generation: {str(e)} IP: {getClientIp()}')
-            return redirect(url_for('questionGenerator'))
-    else:
+        params = {field: request.form.getlist(field) for field in generatorFields}
+        return redirect(url_for('questionGen', **params, seed=random.randrange(2 ** 32)), 303)
+
+    if not request.args.get('board'):
+        return redirect(url_for('questionGenerator'))
+
+    try:
+        # Extract form data
+        board = request.args.get('board')
+        subject = request.args.get('subject')
+        level = request.args.get('level')
+        topics = request.args.getlist('topic')
+        difficulties = request.args.getlist('difficulty')
+        components = request.args.getlist('component')
+        seed = request.args.get('seed', type=int)
+        mode = request.args.get('mode', 'random')
+
+        # Handle ALL selections
+        if 'ALL' in topics:
+            topics = 'ALL'
+        else:
+            topics = [topic for topic in topics]
+
+        if 'ALL' in difficulties:
+            difficulties = 'ALL'
+        else:
+            difficulties = [difficulty for difficulty in difficulties]
+
+        if 'ALL' in components:
+            components = 'ALL'
+        else:
+            components = [component for component in components]
+
+        # Get questions
+        rows = getQuestionsForGen(
+            board, subject, level, topics, components, difficulties, seed=seed, mode=mode,
+            topicQuotas=parseQuotas(request.args.get('topicQuota')),
+            difficultyQuotas=parseQuotas(request.args.get('difficultyQuota')),
+            minScore=request.args.get('minScore', type=float),
+            maxScore=request.args.get('maxScore', type=float),
+            order=request.args.get('order', 'random')
+        )
+
+        # Same filters with a fresh seed
+        params = {field: request.args.getlist(field) for field in generatorFields}
+        regenerate_url = url_for('questionGen', **params, seed=random.randrange(2 ** 32))
+
+        count = countQuestions(subject, level)
+        return render_template('qpgen.html', rows=rows, count = count, regenerate_url = regenerate_url)
+    except Exception as e:
+        logger.error(f'Error in question generation: {str(e)} IP: {getClientIp()}')
         return redirect(url_for('questionGenerator'))
 
 
 @app.route('/submit')
 def submit():
     logger.info(f'Submit page accessed IP: {getClientIp()}')
-    config = loadConfig(configPath)
-    return render_template('submit.html', config = config, year = int(datetime.now().year))
+    return render_template('submit.html', config_json = siteConfig.get().json, year = int(datetime.now().year))
 
 @app.route('/submitQuestion', methods=['POST'])
 @login_required
@@ -419,13 +559,17 @@ def submitQuestion():
     difficulty = request.form.get('difficulty')
     level = request.form.get('level')
     component = request.form.get('component')
-    questionFile = request.files['questionFile'].read()
-    solutionFile = request.files['solutionFile'].read()
+    # Passed on as file objects, spoolUploads streams them to disk
+    questionFile = request.files['questionFile']
+    solutionFile = request.files['solutionFile']
 
 
-    if insertQuestion(board, subject, topic, difficulty, level, component, questionFile, solutionFile, current_user.username, getClientIp()):
+    result, inserted = insertQuestion(board, subject, topic, difficulty, level, component, questionFile, solutionFile, current_user.username, getClientIp())
+    if result:
         logger.info(f'Question submitted successfully IP: {getClientIp()}')
         return redirect(url_for('index'))
+    elif inserted:
+        return duplicateSubmission('question', inserted)
     else:
         logger.error(f'Error occurred while submitting question IP: {getClientIp()}')
         return "Error occurred while submitting question", 500
@@ -458,6 +602,7 @@ def submitPaper():
 
 
     logger.info(f'Paper submission initiated IP: {getClientIp()}')
+    result = None
     try:
         board = request.form.get('board')
         subject = request.form.get('subject')
@@ -465,42 +610,35 @@ def submitPaper():
         session = request.form.get('session')
         level = request.form.get('level')
         component = request.form.get('component')
-        questionFile = request.files['questionFile'].read()
-        solutionFile = request.files['solutionFile'].read()
+        questionFile = request.files['questionFile']
+        solutionFile = request.files['solutionFile']
         paper_type = request.form.get('paper_type')
         topic = request.form.get('topic')
 
 
-        # Format year with session for A Levels
-        if board == "A Levels" and session:
-            # Convert session values to display format
-            session_display = {
-                "specimen": "Specimen",
-                "feb-mar": "Feb / Mar",
-                "may-june": "May / June",
-                "oct-nov": "Oct / Nov"
-            }
-            formatted_year = f"{year} ({session_display.get(session, session)})"
-        else:
-            formatted_year = year
+        # Only A Levels papers belong to an exam session
+        if board != "A Levels":
+            session = None
 
         if paper_type == 'yearly':
             if not year:
                 raise ValueError("Year is required for yearly papers")
-            result , uuid= insertPaper(board, subject, formatted_year, level, component, questionFile, solutionFile, current_user.username, getClientIp())
+            # Admin uploads are approved as soon as their files are stored, without holding up the request
+            approveBy = current_user.username if current_user.role == 'admin' else None
+            result, inserted = insertPaper(board, subject, year, level, component, questionFile, solutionFile, current_user.username, getClientIp(), session=session, approveBy=approveBy)
         elif paper_type == 'topical':
-            result, uuidStr = insertTopical(board, subject, topic, questionFile, solutionFile, current_user.username, getClientIp())
+            result, inserted = insertTopical(board, subject, topic, questionFile, solutionFile, current_user.username, getClientIp())
         else:
             raise ValueError(f"Invalid paper type: {paper_type}")
 
+        if not result and inserted:
+            return duplicateSubmission('paper', inserted)
+
         if result:
             logger.info(f'Paper submitted successfully, Type: {paper_type} IP: {getClientIp()}')
 
         if result and paper_type == 'yearly':
             logger.info(f'Paper submitted successfully IP: {getClientIp()}')
-            if current_user.role == 'admin':
-                if approvePaper(uuid)[1] == 400:
-                    return redirect(f'admin/paper/{uuid}')
             return redirect(url_for('submit'))
 
     except Exception as e:
@@ -511,6 +649,15 @@ def submitPaper():
         if result:
             return redirect(url_for('submit'))
 
+def duplicateSubmission(kind, duplicate):
+    # Nothing was stored, point the submitter at the existing copy of the file
+    label = ", ".join(str(duplicate[column]) for column in duplicate if column not in ('uuid', 'approved', 'fileState') and duplicate[column])
+    where = "is already on the site" if duplicate['approved'] else "is already waiting for approval"
+    logger.warning(f'Duplicate {kind} submission of {duplicate["uuid"]} IP: {getClientIp()}')
+    if current_user.role == 'admin':
+        label += f" (UUID {duplicate['uuid']})"
+    return render_template('error.html', error_title = f"This {kind} was already submitted", error_message = f"The same file {where} as {label}."), 409
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
@@ -662,20 +809,41 @@ def changePassword():
         return redirect(url_for('profile'))
 
 
-# @app.route('/rate/<question_UUID>/<int:rating>', methods = ['POST'])
-# @login_required
-# def rate(question_UUID, rating):
-#     try:
-#         user = current_user.id
-#         if giveRating(user, question_UUID, rating):
-#             logger.info(f'User {user} rated question {question_UUID} with {rating} IP: {getClientIp()}')
-#             return True
-#         else:
-#             logger.warning(f'Failed to rate question {question_UUID} IP: {getClientIp()}')
-#             return False
-#     except Exception as e:
-#         logger.error(f'Error in rating: {str(e)} IP: {getClientIp()}')
-#         return False
+@app.route('/rate/<question_UUID>/<int:rating>', methods = ['POST'])
+@login_required
+def rate(question_UUID, rating):
+    user = current_user.id
+    if rating not in ratingColumns:
+        return jsonify({"error": "Ratings go from 1 to 5"}), 400
+
+    # Written by the rating queue within RATING_FLUSH_INTERVAL seconds
+    ratingQueue.put(user, [(question_UUID, rating)])
+    logger.info(f'User {user} rated question {question_UUID} with {rating} IP: {getClientIp()}')
+    return jsonify({"success": "Your rating was recorded"}), 202
+
+
+# Rates a whole generated paper at once, body {"ratings": [{"uuid": ..., "rating": 1-5}, ...]}
+@app.route('/rate', methods = ['POST'])
+@login_required
+def rateMany():
+    user = current_user.id
+    data = request.get_json(silent=True) or {}
+    ratings = data.get("ratings")
+
+    if not isinstance(ratings, list) or not ratings or len(ratings) > maxRatingsPerRequest:
+        return jsonify({"error": f"Send between 1 and {maxRatingsPerRequest} ratings"}), 400
+
+    try:
+        pairs = [(str(item["uuid"]), int(item["rating"])) for item in ratings]
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"error": "Every rating needs a uuid and a rating"}), 400
+
+    if any(rating not in ratingColumns for _, rating in pairs):
+        return jsonify({"error": "Ratings go from 1 to 5"}), 400
+
+    queued = ratingQueue.put(user, pairs)
+    logger.info(f'User {user} rated {queued} questions IP: {getClientIp()}')
+    return jsonify({"queued": queued}), 202
 
 
 
@@ -730,7 +898,9 @@ def adminShowQuestion(uuid):
 
     try:
         logger.info(f'Question page addessed for paper {uuid} By: {current_user.username} with role: {current_user.role} IP: ' + str(getClientIp()))
-        return render_template('admin-question.html', question=get_question(uuid))
+        question = get_question(uuid, includeFiles=False)
+        return render_template('admin-question.html', question=question,
+                               duplicate=findDuplicateFile('questions', question['questionHash'], exclude=uuid) if question else None)
     except Exception as e:
         logger.warning("Error retrieving question: " + str(e))
 
@@ -742,7 +912,9 @@ def adminShowPaper(uuid):
         return redirect(url_for('index'))
     try:
         logger.info(f'Paper page addessed for paper {uuid} By: {current_user.username} with role: {current_user.role} IP: ' + str(getClientIp()))
-        return render_template('admin-paper.html', paper=get_paper(uuid))
+        paper = get_paper(uuid, includeFiles=False)
+        return render_template('admin-paper.html', paper=paper,
+                               duplicate=findDuplicateFile('papers', paper['questionHash'], exclude=uuid) if paper else None)
     except Exception as e:
         logger.warning("Error retrieving paper: " + str(e))
 
@@ -754,7 +926,9 @@ def adminShowTopical(uuid):
         return redirect(url_for('index'))
     try:
         logger.info(f'Topical page addessed for paper {uuid} By: {current_user.username} with role: {current_user.role} IP: ' + str(getClientIp()))
-        return render_template('admin-topical.html', topical=get_topical(uuid))
+        topical = get_topical(uuid, includeFiles=False)
+        return render_template('admin-topical.html', topical=topical,
+                               duplicate=findDuplicateFile('topicals', topical['questionHash'], exclude=uuid) if topical else None)
     except Exception as e:
         logger.warning("Error retrieving paper: " + str(e))
 
@@ -809,7 +983,9 @@ def getNewData():
                     "level": question["level"],
                     "component": question["component"],
                     "submittedBy": question["submittedBy"],
-                    "submittedOn": question["submitDate"]
+                    "submittedOn": question["submitDate"],
+                    "fileState": question["fileState"],
+                    "duplicateOf": duplicateOf('questions', question)
                 })
 
             for paper in papers:
@@ -822,7 +998,9 @@ def getNewData():
                     "level": paper["level"],
                     "component": paper["component"],
                     "submittedBy": paper["submittedBy"],
-                    "submittedOn": paper["submitDate"]
+                    "submittedOn": paper["submitDate"],
+                    "fileState": paper["fileState"],
+                    "duplicateOf": duplicateOf('papers', paper)
                 })
 
             for topical in topicals:
@@ -831,7 +1009,9 @@ def getNewData():
                     "uuid": topical["uuid"],
                     "subject": topical["subject"],
                     "submittedBy": topical["submittedBy"],
-                    "submittedOn": topical["submitDate"]
+                    "submittedOn": topical["submitDate"],
+                    "fileState": topical["fileState"],
+                    "duplicateOf": duplicateOf('topicals', topical)
                 })
 
             return jsonify(data)
@@ -839,6 +1019,11 @@ def getNewData():
         logger.error(f'Error processing getNewData: {e}')
         return jsonify({"error": "An error occurred while processing the request."}),
 
+def duplicateOf(table, row):
+    # UUID of another submission with the same question file, shown on the admin cards
+    duplicate = findDuplicateFile(table, row["questionHash"], exclude=row["uuid"])
+    return duplicate["uuid"] if duplicate else None
+
 @app.route('/approve_question/<uuid>' , methods=["POST"])
 @login_required
 def approve(uuid):
@@ -863,6 +1048,7 @@ def approvePaper(uuid):
 
     if approve_paper(current_user.username, uuid):
         logger.info(f"Paper {uuid} was approved by {current_user.username}")
+        queueThumbnails(uuid)
         # Returning plain text for success with a 200 status
         return f"Paper {uuid} was approved by {current_user.username}", 200
     else:
@@ -880,6 +1066,7 @@ def approveTopical(uuid):
 
     if approve_topical(current_user.username, uuid):
         logger.info(f"Topcial {uuid} was approved by {current_user.username}")
+        queueThumbnails(uuid)
         # Returning plain text for success with a 200 status
         return f"Topcial {uuid} was approved by {current_user.username}", 200
     else:
@@ -964,6 +1151,80 @@ def give_admin(username):
         return False
 
 
+@app.route('/admin/metrics')
+@login_required
+def adminMetrics():
+    if current_user.role != 'admin':
+        logger.warning(f'Admin page / endpoint is trying to be accessed by a non-admin IP: {getClientIp()}')
+        return redirect(url_for('index'))
+
+    return jsonify({
+        "dbPool": pool.stats(),
+        "catalogCache": catalogCache.stats(),
+        "questionIndex": questionIndex.stats(),
+        "ratingQueue": ratingQueue.stats(),
+        "ingestQueue": ingestQueue.stats()
+    })
+
+@app.route('/admin/import', methods=['POST'])
+@login_required
+def adminImport():
+    """
+    Bulk import papers from a ZIP (form field archive) and a manifest, see bulkImport.py.
+
+    The manifest is the optional manifest file field, otherwise manifest.csv / manifest.json
+    inside the ZIP. approve=1 approves every paper that is not a duplicate.
+
+    The archive and the manifest are checked here, the import runs on an importJobs thread.
+    Answers 202 with the job id and the url of adminImportStatus.
+    """
+    if current_user.role != 'admin':
+        logger.warning(f'Admin page / endpoint is trying to be accessed by a non-admin IP: {getClientIp()}')
+        return jsonify({"error": "Administrator privileges required"}), 403
+
+    archive = request.files.get('archive')
+    if not archive:
+        return jsonify({"error": "No archive uploaded"}), 400
+
+    # The upload is closed with the request, the import thread reads a copy of it
+    archiveCopy = tempfile.TemporaryFile()
+    shutil.copyfileobj(archive.stream, archiveCopy)
+    try:
+        source = ZipSource(archiveCopy)
+    except zipfile.BadZipFile:
+        archiveCopy.close()
+        return jsonify({"error": "The archive is not a ZIP file"}), 400
+
+    try:
+        manifest = request.files.get('manifest')
+        entries = readManifest(manifest.stream, manifest.filename) if manifest else source.manifest()
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        source.close()
+        return jsonify({"error": f"Invalid manifest: {e}"}), 400
+    if entries is None:
+        source.close()
+        return jsonify({"error": "No manifest uploaded or found in the archive"}), 400
+
+    jobId = importJobs.start(source, entries, current_user.username, getClientIp(),
+                             approve=request.form.get('approve') in ('1', 'true', 'on'))
+    logger.info(f'Bulk import {jobId} of {len(entries)} papers started by {current_user.username} IP: {getClientIp()}')
+    return jsonify({"job": jobId, "status": url_for('adminImportStatus', jobId=jobId)}), 202
+
+
+@app.route('/admin/import/<jobId>')
+@login_required
+def adminImportStatus(jobId):
+    """State of a bulk import started at /admin/import, with its summary and results once it is finished"""
+    if current_user.role != 'admin':
+        logger.warning(f'Admin page / endpoint is trying to be accessed by a non-admin IP: {getClientIp()}')
+        return jsonify({"error": "Administrator privileges required"}), 403
+
+    job = importJobs.get(jobId)
+    if job is None:
+        return jsonify({"error": "No such import"}), 404
+    return jsonify(job)
+
+
 @app.template_filter('b64encode')
 def b64encode_filter(s):
     return base64.b64encode(s).decode('utf-8') if s else ''
@@ -974,11 +1235,18 @@ def robotsTxt():
     return send_from_directory(app.static_folder, 'robots.txt')
 
 @app.route('/stats')
+@conditionalPage(versionKeys=("contentVersion", "submissionVersion"))
 def stats():
-    statsData = getStat(config)
+    statsData = getStat(siteConfig.get().data)
     logger.info(f'Stats page accessed IP: {getClientIp()}')
     return render_template('stats-page.html', statsData=statsData)
 
+# Polled by stats-page.js, unchanged numbers are answered with 304
+@app.route('/stats/data')
+@conditionalPage(maxAge=15, sharedMaxAge=15, versionKeys=("contentVersion", "submissionVersion"))
+def statsData():
+    return jsonify(getStat(siteConfig.get().data))
+
 
 
 
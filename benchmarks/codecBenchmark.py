@@ -0,0 +1,121 @@
+"""
+Measure every available codec on the files the site actually stores.
+
+Decodes a sample of the files in the blob store (or reads the files of a directory with --path)
+and reports, per codec and level, the compression ratio and the encode / decode throughput.
+The "as is" column counts the files new uploads would store uncompressed under
+STORAGE_MIN_SAVING, since that codec and level barely shrinks them.
+
+    python benchmarks/codecBenchmark.py --files 200
+    python benchmarks/codecBenchmark.py --path ./samples
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from paperGuidesDB import pool, blobStore, blobKey, storageMinSaving, mimeTypeFromHeader
+from fileCodecs import getCodec, availableCodecs, codecClasses
+from logHandler import getCustomLogger
+
+logger = getCustomLogger(__name__)
+
+
+def loadStoredCorpus(count, seed=None):
+    """Decode a random sample of the files in the blob store, returns (mimetype, bytes) pairs"""
+    with pool.connection() as connection:
+        references = set()
+        for table in ("papers", "topicals", "questions"):
+            for fileType in ("question", "solution"):
+                references.update(connection.execute(f'''
+                    SELECT {fileType}Hash, {fileType}Codec FROM {table}
+                    WHERE {fileType}Hash IS NOT NULL AND fileState = 'ready'
+                '''))
+
+    references = sorted(references)
+    random.Random(seed).shuffle(references)
+
+    corpus = []
+    for contentHash, codec in references[:count]:
+        storedData = blobStore.get(blobKey(contentHash, codec))
+        if storedData is None:
+            logger.warning(f"{contentHash} is missing from the blob store")
+            continue
+        data = getCodec(codec).decompress(storedData)
+        corpus.append((mimeTypeFromHeader(data[:12]), data))
+    return corpus
+
+
+def loadDirectoryCorpus(path, count):
+    corpus = []
+    for name in sorted(os.listdir(path))[:count]:
+        with open(os.path.join(path, name), "rb") as file:
+            data = file.read()
+        corpus.append((mimeTypeFromHeader(data[:12]), data))
+    return corpus
+
+
+def measureCodec(codec, corpus):
+    """Compress and decompress every file once, returns ratio, MB/s each way and files kept as they are"""
+    rawBytes = storedBytes = 0
+    encodeSeconds = decodeSeconds = 0.0
+    keptAsIs = 0
+
+    for _, data in corpus:
+        started = time.perf_counter()
+        compressed = codec.compress(data)
+        encodeSeconds += time.perf_counter() - started
+
+        started = time.perf_counter()
+        decoded = codec.decompress(compressed)
+        decodeSeconds += time.perf_counter() - started
+        if decoded != data:
+            raise RuntimeError(f"{codec.name} level {codec.level} did not round trip")
+
+        rawBytes += len(data)
+        storedBytes += len(compressed)
+        if len(compressed) > len(data) * (1 - storageMinSaving):
+            keptAsIs += 1
+
+    megabytes = rawBytes / 1024 / 1024
+    return (
+        storedBytes / rawBytes if rawBytes else 0.0,
+        megabytes / encodeSeconds if encodeSeconds else 0.0,
+        megabytes / decodeSeconds if decodeSeconds else 0.0,
+        keptAsIs
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compression ratio and throughput of the storage codecs")
+    parser.add_argument("--files", type=int, default=100, help="Files sampled from the blob store")
+    parser.add_argument("--path", help="Benchmark the files of this directory instead")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the blob store sample")
+    parser.add_argument("--codec", action="append", choices=list(codecClasses), help="Only measure this codec (repeatable)")
+    args = parser.parse_args()
+
+    corpus = loadDirectoryCorpus(args.path, args.files) if args.path else loadStoredCorpus(args.files, args.seed)
+    if not corpus:
+        print("No files to benchmark")
+        sys.exit(1)
+
+    mimetypes = {}
+    for mimetype, data in corpus:
+        mimetypes[mimetype] = mimetypes.get(mimetype, 0) + 1
+    print(f"{len(corpus)} files, {sum(len(data) for _, data in corpus) / 1024 / 1024:.1f} MB "
+          f"({', '.join(f'{count} {mimetype}' for mimetype, count in sorted(mimetypes.items()))})")
+    print(f"{'codec':<8}{'level':>6}{'ratio':>8}{'enc MB/s':>10}{'dec MB/s':>10}{'as is':>7}")
+
+    for name in availableCodecs():
+        if name == "none" or (args.codec and name not in args.codec):
+            continue
+        for level in codecClasses[name].levels:
+            ratio, encodeSpeed, decodeSpeed, keptAsIs = measureCodec(getCodec(name, level), corpus)
+            print(f"{name:<8}{level:>6}{ratio:>8.3f}{encodeSpeed:>10.1f}{decodeSpeed:>10.1f}{keptAsIs:>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,299 @@
+"""
+Compare getStat with the COUNT(*) per board / level / subject version it replaced.
+
+Builds a synthetic database (100k rows by default) in a temporary directory, checks that both
+versions return the same stats and reports the queries issued and the latency of each. getStat
+reads the stats_counters table, the time to recount that from scratch is reported as well.
+
+    python benchmarks/statsBenchmark.py --rows 100000 --runs 5
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import paperGuidesDB
+from dbPool import ConnectionPool
+from config import loadConfig
+from logHandler import getCustomLogger
+
+logger = getCustomLogger(__name__)
+
+
+def legacyGetStat(pool, config):
+    """getStat before the GROUP BY rewrite, one COUNT(*) per board, level, subject and table"""
+    try:
+        with pool.connection() as connection:
+            db = connection.cursor()
+
+            stats = {
+                "overall": {
+                    "questions": {
+                        "approved": 0,
+                        "unapproved": 0
+                    },
+                    "papers": {
+                        "approved": 0,
+                        "unapproved": 0
+                    },
+                    "topicals":{
+                        "approved": 0,
+                        "unapproved": 0
+                    }
+                },
+                "byBoard": {}
+            }
+
+            for boardName, boardConfig in config.items():
+                boardStats = {
+                    "levels": {},
+                    "subjects": {}
+                }
+                stats["byBoard"][boardName] = boardStats
+
+                for level in boardConfig["levels"]:
+                    # Normalize A-level variations
+                    normalized_level = level
+                    if level.lower() in ["a level", "as level", "a-level", "as-level"]:
+                        normalized_level = "A level"  # Use this as the standard key
+                
+                    if normalized_level not in boardStats["levels"]:
+                        boardStats["levels"][normalized_level] = {
+                            "approvedQuestions": 0,
+                            "unapprovedQuestions": 0,
+                            "subjects": {}
+                        }
+
+                    # For A-levels, combine both A and AS level counts
+                    if level.lower() in ["a level", "as level", "a-level", "as-level"]:
+                        approved_count = db.execute(
+                            "SELECT COUNT(*) FROM questions WHERE (level = ? OR level = ? OR level = ? OR level = ?) AND approved = ?",
+                            ("A level", "AS level", "A Level", "AS Level", True)
+                        ).fetchone()[0]
+                        unapproved_count = db.execute(
+                            "SELECT COUNT(*) FROM questions WHERE (level = ? OR level = ? OR level = ? OR level = ?) AND approved = ?",
+                            ("A level", "AS level", "A Level", "AS Level", False)
+                        ).fetchone()[0]
+                    
+                        boardStats["levels"][normalized_level]["approvedQuestions"] += approved_count
+                        boardStats["levels"][normalized_level]["unapprovedQuestions"] += unapproved_count
+
+                        # Handle subjects for A-levels
+                        for subject in boardConfig["subjects"]:
+                            subjectName = subject["name"]
+                            if subjectName not in boardStats["levels"][normalized_level]["subjects"]:
+                                boardStats["levels"][normalized_level]["subjects"][subjectName] = {
+                                    "approved": 0,
+                                    "unapproved": 0,
+                                    "approvedPapers": 0,
+                                    "unapprovedPapers": 0,
+                                    "approvedTopicals": 0,
+                                    "unapprovedTopicals": 0
+                                }
+                        
+                            # Combine A and AS level counts for each subject
+                            approved = db.execute(
+                                "SELECT COUNT(*) FROM questions WHERE (level = ? OR level = ? OR level = ? OR level = ?) AND subject = ? AND approved = ?",
+                                ("A level", "AS level", "A Level", "AS Level", subjectName, True)
+                            ).fetchone()[0]
+                            unapproved = db.execute(
+                                "SELECT COUNT(*) FROM questions WHERE (level = ? OR level = ? OR level = ? OR level = ?) AND subject = ? AND approved = ?",
+                                ("A level", "AS level", "A Level", "AS Level", subjectName, False)
+                            ).fetchone()[0]
+                        
+                            approved_papers = db.execute(
+                                "SELECT COUNT(*) FROM papers WHERE (level = ? OR level = ? OR level = ? OR level = ?) AND subject = ? AND approved = ?",
+                                ("A level", "AS level", "A Level", "AS Level", subjectName, True)
+                            ).fetchone()[0]
+                            unapproved_papers = db.execute(
+                                "SELECT COUNT(*) FROM papers WHERE (level = ? OR level = ? OR level = ? OR level = ?) AND subject = ? AND approved = ?",
+                                ("A level", "AS level", "A Level", "AS Level", subjectName, False)
+                            ).fetchone()[0]
+
+                            approved_topicals = db.execute(
+                                "SELECT COUNT(*) FROM topicals WHERE subject = ? AND approved = ?",
+                                (subjectName, True)
+                            ).fetchone()[0]
+
+                            unapproved_topicals = db.execute(
+                                "SELECT COUNT(*) FROM topicals WHERE subject = ? AND approved = ?",
+                                (subjectName, False)
+                            ).fetchone()[0]
+                            boardStats["levels"][normalized_level]["subjects"][subjectName].update({
+                                "approved": approved,
+                                "unapproved": unapproved,
+                                "approvedPapers": approved_papers,
+                                "unapprovedPapers": unapproved_papers,
+                                "approvedTopicals": approved_topicals,
+                                "unapprovedTopicals": unapproved_topicals
+                            })
+
+                    else:
+                        # Handle non-A-level statistics as before
+                        boardStats["levels"][normalized_level]["approvedQuestions"] = db.execute(
+                            "SELECT COUNT(*) FROM questions WHERE level = ? AND approved = ?",
+                            (level, True)
+                        ).fetchone()[0]
+                        boardStats["levels"][normalized_level]["unapprovedQuestions"] = db.execute(
+                            "SELECT COUNT(*) FROM questions WHERE level = ? AND approved = ?",
+                            (level, False)
+                        ).fetchone()[0]
+
+                        for subject in boardConfig["subjects"]:
+                            subjectName = subject["name"]
+                            boardStats["levels"][normalized_level]["subjects"][subjectName] = {
+                                "approved": db.execute(
+                                    "SELECT COUNT(*) FROM questions WHERE level = ? AND subject = ? AND approved = ?",
+                                    (level, subjectName, True)
+                                ).fetchone()[0],
+                                "unapproved": db.execute(
+                                    "SELECT COUNT(*) FROM questions WHERE level = ? AND subject = ? AND approved = ?",
+                                    (level, subjectName, False)
+                                ).fetchone()[0],
+                                "approvedPapers": db.execute(
+                                    "SELECT COUNT(*) FROM papers WHERE level = ? AND subject = ? AND approved = ?",
+                                    (level, subjectName, True)
+                                ).fetchone()[0],
+                                "unapprovedPapers": db.execute(
+                                    "SELECT COUNT(*) FROM papers WHERE level = ? AND subject = ? AND approved = ?",
+                                    (level, subjectName, False)
+                                ).fetchone()[0]
+                            }
+
+            # Update overall stats
+            stats["overall"]["questions"]["approved"] = db.execute(
+                "SELECT COUNT(*) FROM questions WHERE approved = ?", (True,)
+            ).fetchone()[0]
+            stats["overall"]["questions"]["unapproved"] = db.execute(
+                "SELECT COUNT(*) FROM questions WHERE approved = ?", (False,)
+            ).fetchone()[0]
+            stats["overall"]["papers"]["approved"] = db.execute(
+                "SELECT COUNT(*) FROM papers WHERE approved = ?", (True,)
+            ).fetchone()[0]
+            stats["overall"]["papers"]["unapproved"] = db.execute(
+                "SELECT COUNT(*) FROM papers WHERE approved = ?", (False,)
+            ).fetchone()[0]
+            stats["overall"]["topicals"]["approved"] = db.execute(
+                "SELECT COUNT(*) FROM topicals WHERE approved = ?", (True,)
+            ).fetchone()[0]
+            stats["overall"]["topicals"]["unapproved"] = db.execute(
+                "SELECT COUNT(*) FROM topicals WHERE approved = ?", (False,)
+            ).fetchone()[0]
+            return stats
+
+    except sqlite3.Error as e:
+        logger.error(f"Error gathering stats: {e}")
+        return {"error": "Failed to retrieve stats"}
+
+
+def fillDatabase(pool, config, rows, seed=0):
+    """Spread rows over questions (60%), papers (30%) and topicals (10%) of every board, level and subject"""
+    generator = random.Random(seed)
+    boards = [
+        (board, boardConfig["levels"] + ["A Level", "AS Level"] if board == "A Levels" else boardConfig["levels"],
+         [subject["name"] for subject in boardConfig["subjects"]])
+        for board, boardConfig in config.items()
+    ]
+
+    def pick():
+        board, levels, subjects = generator.choice(boards)
+        return board, generator.choice(levels), generator.choice(subjects), int(generator.random() < 0.8)
+
+    with pool.connection() as connection:
+        questions = []
+        for _ in range(int(rows * 0.6)):
+            board, level, subject, approved = pick()
+            questions.append((str(uuid.uuid4()), board, level, subject, approved))
+        connection.executemany(
+            "INSERT INTO questions (uuid, board, level, subject, approved) VALUES (?, ?, ?, ?, ?)", questions
+        )
+
+        papers = []
+        for _ in range(int(rows * 0.3)):
+            board, level, subject, approved = pick()
+            papers.append((str(uuid.uuid4()), board, level, subject, approved, "2020"))
+        connection.executemany(
+            "INSERT INTO papers (uuid, board, level, subject, approved, year) VALUES (?, ?, ?, ?, ?, ?)", papers
+        )
+
+        topicals = []
+        for _ in range(rows - len(questions) - len(papers)):
+            board, _, subject, approved = pick()
+            topicals.append((str(uuid.uuid4()), board, subject, approved))
+        connection.executemany(
+            "INSERT INTO topicals (uuid, board, subject, approved) VALUES (?, ?, ?, ?)", topicals
+        )
+        connection.commit()
+
+
+def measure(pool, function, runs):
+    """Run function `runs` times, returning (result, queries per run, latencies in ms)"""
+    statements = []
+    with pool.connection() as connection:
+        connection.set_trace_callback(statements.append)
+
+    latencies = []
+    result = None
+    for _ in range(runs):
+        statements.clear()
+        started = time.perf_counter()
+        result = function()
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    with pool.connection() as connection:
+        connection.set_trace_callback(None)
+
+    # The pool pings connections on checkout, that is not the function's query
+    queries = len([statement for statement in statements if statement.strip() != "SELECT 1"])
+    return result, queries, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark getStat against the per subject COUNT(*) version")
+    parser.add_argument("--rows", type=int, default=100000, help="Synthetic rows over questions, papers and topicals")
+    parser.add_argument("--runs", type=int, default=5, help="Timed runs of each version")
+    parser.add_argument("--config", default="./configs/config.json", help="Site config the stats are built for")
+    args = parser.parse_args()
+
+    config = loadConfig(args.config)
+
+    with tempfile.TemporaryDirectory() as directory:
+        # One connection, so the trace callback sees every statement
+        pool = ConnectionPool(os.path.join(directory, "bench.db"), size=1)
+        paperGuidesDB.pool = pool
+        paperGuidesDB.createDatabase()
+        fillDatabase(pool, config, args.rows)
+
+        # The rows went in behind the level keys' and counters' back
+        with pool.connection() as connection:
+            for table in ("questions", "papers", "topicals"):
+                paperGuidesDB.fillLevelKeys(connection, table)
+            connection.commit()
+        _, rebuildQueries, rebuildLatencies = measure(pool, paperGuidesDB.rebuildStatsCounters, args.runs)
+
+        legacy, legacyQueries, legacyLatencies = measure(pool, lambda: legacyGetStat(pool, config), args.runs)
+        current, currentQueries, currentLatencies = measure(pool, lambda: paperGuidesDB.getStat(config), args.runs)
+        pool.close()
+
+    if json.dumps(legacy, sort_keys=True) != json.dumps(current, sort_keys=True):
+        print("MISMATCH: getStat differs from the legacy version")
+        sys.exit(1)
+
+    print(f"{args.rows} rows, {args.runs} runs, results identical")
+    print(f"{'':<10}{'queries':>10}{'median ms':>12}{'min ms':>10}")
+    for name, queries, latencies in (("legacy", legacyQueries, legacyLatencies), ("getStat", currentQueries, currentLatencies),
+                                     ("rebuild", rebuildQueries, rebuildLatencies)):
+        print(f"{name:<10}{queries:>10}{statistics.median(latencies):>12.1f}{min(latencies):>10.1f}")
+    print(f"speedup   {statistics.median(legacyLatencies) / statistics.median(currentLatencies):.1f}x")
+
+
+if __name__ == '__main__':
+    main()
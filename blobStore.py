@@ -0,0 +1,207 @@
+import os
+import shutil
+import tempfile
+
+from logHandler import getCustomLogger
+
+logger = getCustomLogger(__name__)
+
+
+class BlobStore:
+    """
+    Content-addressed storage for the compressed question / solution files.
+
+    Blobs are keyed by the SHA-256 of the original file (the same hash getHash returns),
+    so uploading the same file twice stores it once. Backends only need to implement
+    the methods below.
+    """
+
+    def put(self, key, data):
+        """Store data under key, does nothing if the key already exists"""
+        raise NotImplementedError
+
+    def putFile(self, key, path):
+        """
+        Store the contents of the file at path under key, consuming the file.
+
+        Backends override this to move or stream the file instead of reading it into memory.
+        """
+        with open(path, "rb") as source:
+            stored = self.put(key, source.read())
+        os.remove(path)
+        return stored
+
+    def get(self, key):
+        """Return the stored bytes or None if the key is unknown"""
+        raise NotImplementedError
+
+    def exists(self, key):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def keys(self):
+        """Iterate over every stored key, used for garbage collection"""
+        raise NotImplementedError
+
+
+class LocalBlobStore(BlobStore):
+    """
+    Stores blobs on the local filesystem.
+
+    Files fan out over two directory levels (ab/cd/abcd...) so no single directory
+    ends up with hundreds of thousands of entries.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def put(self, key, data):
+        path = self.path(key)
+        if os.path.exists(path):
+            return False
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temporary file first so readers never see a half written blob
+        fd, tempPath = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as blob:
+                blob.write(data)
+            os.replace(tempPath, path)
+        except Exception:
+            if os.path.exists(tempPath):
+                os.remove(tempPath)
+            raise
+        return True
+
+    def putFile(self, key, path):
+        target = self.path(key)
+        if os.path.exists(target):
+            os.remove(path)
+            return False
+
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+
+        # A rename when the file is on the same filesystem, a copy otherwise. Either way it
+        # arrives under a temporary name so readers never see a half written blob.
+        tempPath = os.path.join(os.path.dirname(target), f".tmp-{os.path.basename(path)}")
+        try:
+            shutil.move(path, tempPath)
+            os.replace(tempPath, target)
+        except Exception:
+            if os.path.exists(tempPath):
+                os.remove(tempPath)
+            raise
+        return True
+
+    def get(self, key):
+        try:
+            with open(self.path(key), "rb") as blob:
+                return blob.read()
+        except FileNotFoundError:
+            return None
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def keys(self):
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                if not name.startswith(".tmp-"):
+                    yield name
+
+
+class S3BlobStore(BlobStore):
+    """
+    Stores blobs in an S3 compatible bucket, e.g. a local MinIO instance.
+
+    Needs boto3, which is only imported when this backend is selected.
+    """
+
+    def __init__(self, bucket, endpointUrl=None, prefix="blobs/"):
+        try:
+            import boto3
+            from botocore.exceptions import ClientError
+        except ImportError:
+            raise RuntimeError("The S3 blob store needs boto3, install it with `pip install boto3`")
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self.ClientError = ClientError
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpointUrl,
+            aws_access_key_id=os.getenv("S3_ACCESS_KEY"),
+            aws_secret_access_key=os.getenv("S3_SECRET_KEY")
+        )
+
+    def objectKey(self, key):
+        return f"{self.prefix}{key[:2]}/{key}"
+
+    def put(self, key, data):
+        if self.exists(key):
+            return False
+        self.client.put_object(Bucket=self.bucket, Key=self.objectKey(key), Body=data)
+        return True
+
+    def putFile(self, key, path):
+        try:
+            if self.exists(key):
+                return False
+            # upload_file streams the file, in parts when it is large
+            self.client.upload_file(path, self.bucket, self.objectKey(key))
+            return True
+        finally:
+            os.remove(path)
+
+    def get(self, key):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self.objectKey(key))["Body"].read()
+        except self.ClientError:
+            return None
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.objectKey(key))
+            return True
+        except self.ClientError:
+            return False
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self.objectKey(key))
+        return True
+
+    def keys(self):
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for item in page.get("Contents", []):
+                yield item["Key"].rsplit("/", 1)[-1]
+
+
+def getBlobStore():
+    """
+    Build the blob store selected by the BLOB_STORE environment variable.
+
+    BLOB_STORE=local (default) keeps blobs under BLOB_STORE_PATH,
+    BLOB_STORE=s3 uses S3_BUCKET at S3_ENDPOINT_URL.
+    """
+    backend = os.getenv("BLOB_STORE", "local").lower()
+
+    if backend == "s3":
+        logger.info(f"Using S3 blob store bucket {os.getenv('S3_BUCKET')}")
+        return S3BlobStore(os.getenv("S3_BUCKET"), os.getenv("S3_ENDPOINT_URL"))
+
+    return LocalBlobStore(os.getenv("BLOB_STORE_PATH", "./instance/blobs"))
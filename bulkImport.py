@@ -0,0 +1,377 @@
+"""
+Load a whole exam season at once.
+
+The papers come from a ZIP or a directory, described by a manifest with one row per paper:
+question and solution (file paths inside the ZIP / directory), board, subject, year, session,
+component and level. A manifest.csv or manifest.json at the root is used unless one is given.
+
+    python bulkImport.py season.zip --user admin --approve
+    python bulkImport.py ./may-june-2024 --manifest papers.csv --report results.json
+
+The files are hashed and spooled by a pool of threads, the rows are inserted batchSize at a
+time in one transaction each and ingestQueue compresses the files as usual. With --approve the
+import waits for the files and approves every paper that is not a duplicate in one transaction.
+A question paper that was submitted before, or earlier in the manifest, is not inserted. The
+same import is served to admins at POST /admin/import, which runs it on an importJobs thread.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from paperGuidesDB import insertPapers, approvePapers, spoolUploads, waitForFiles, findDuplicateFile, discardSpooled, ingestQueue, paperSessions
+from thumbnails import queueThumbnails
+from logHandler import getCustomLogger
+
+logger = getCustomLogger(__name__)
+
+manifestNames = ("manifest.csv", "manifest.json")
+manifestFields = ("question", "solution", "board", "subject", "year", "session", "component", "level")
+requiredFields = ("question", "solution", "board", "subject", "year", "component", "level")
+
+
+class ZipSource:
+    """Files of an uploaded or local ZIP, paths are the member names"""
+
+    def __init__(self, file):
+        self.file = file
+        self.archive = zipfile.ZipFile(file)
+        self.names = set(self.archive.namelist())
+
+    def exists(self, name):
+        return name in self.names
+
+    def open(self, name):
+        return self.archive.open(name)
+
+    def manifest(self):
+        for name in manifestNames:
+            if self.exists(name):
+                with self.open(name) as file:
+                    return readManifest(file, name)
+        return None
+
+    def close(self):
+        self.archive.close()
+        # ZipFile leaves a file object it was given open, e.g. the copy of an upload
+        if hasattr(self.file, 'close'):
+            self.file.close()
+
+
+class DirectorySource:
+    """Files below a directory, paths are relative to it and may not leave it"""
+
+    def __init__(self, path):
+        self.root = os.path.realpath(path)
+
+    def _path(self, name):
+        path = os.path.realpath(os.path.join(self.root, name))
+        if os.path.commonpath([self.root, path]) != self.root:
+            raise ValueError(f"{name} is outside of the import directory")
+        return path
+
+    def exists(self, name):
+        try:
+            return os.path.isfile(self._path(name))
+        except ValueError:
+            return False
+
+    def open(self, name):
+        return open(self._path(name), 'rb')
+
+    def manifest(self):
+        for name in manifestNames:
+            if self.exists(name):
+                with self.open(name) as file:
+                    return readManifest(file, name)
+        return None
+
+    def close(self):
+        pass
+
+
+def openSource(path):
+    """ZipSource or DirectorySource for a path on disk"""
+    if os.path.isdir(path):
+        return DirectorySource(path)
+    return ZipSource(path)
+
+
+def readManifest(file, name):
+    """
+    Parse a CSV (with a header row) or JSON (a list of objects) manifest.
+
+    Returns:
+        list: One dict per paper with the manifestFields, missing fields are None
+    """
+    if name.lower().endswith(".json"):
+        rows = json.load(file)
+        if not isinstance(rows, list):
+            raise ValueError("A JSON manifest must be a list of papers")
+    else:
+        rows = list(csv.DictReader(io.TextIOWrapper(file, encoding="utf-8-sig", newline="")))
+
+    entries = []
+    for row in rows:
+        row = {str(key).strip().lower(): value for key, value in row.items() if key is not None}
+        entries.append({
+            field: str(row[field]).strip() if row.get(field) not in (None, "") else None
+            for field in manifestFields
+        })
+    return entries
+
+
+def parseSession(session):
+    # Sessions are given as their key (may-june) or their label (May / June)
+    if not session:
+        return None
+    compact = session.lower().replace(" ", "")
+    return next((key for key, label in paperSessions.items()
+                 if compact in (key, label.lower().replace(" ", ""))), None)
+
+
+def checkEntry(source, entry):
+    """Error message for a manifest row that can't be imported, None when it is fine"""
+    missing = [field for field in requiredFields if not entry[field]]
+    if missing:
+        return f"missing {', '.join(missing)}"
+    for field in ("question", "solution"):
+        if not source.exists(entry[field]):
+            return f"{field} file {entry[field]} not found"
+    if entry["session"] and not parseSession(entry["session"]):
+        return f"unknown session {entry['session']}"
+    return None
+
+
+def spoolEntry(source, entry):
+    with source.open(entry["question"]) as question, source.open(entry["solution"]) as solution:
+        stored, spooled = spoolUploads(question, solution)
+
+    return {
+        "board": entry["board"],
+        "subject": entry["subject"],
+        "year": entry["year"],
+        # Only A Levels papers belong to an exam session
+        "session": parseSession(entry["session"]) if entry["board"] == "A Levels" else None,
+        "level": entry["level"],
+        "component": entry["component"],
+        "stored": stored,
+        "spooled": spooled
+    }
+
+
+def importPapers(source, entries, user, ip, approve=False, workers=4, batchSize=50, waitTimeout=600):
+    """
+    Insert the papers of a manifest, optionally approving them.
+
+    Args:
+        source: ZipSource or DirectorySource the manifest paths point into
+        entries: Rows from readManifest
+        user: Username the papers are submitted (and approved) by
+        ip: Recorded as submittedFrom
+        approve: Approve the papers once their files are stored
+        workers: Threads hashing and spooling files
+        batchSize: Papers inserted per transaction
+        waitTimeout: Seconds to wait for ingestQueue, for all the papers together, before leaving
+                     the ones still processing unapproved
+
+    Returns:
+        list: One dict per manifest row with row, question, solution, status, uuid and error.
+              status is submitted, approved, duplicate, processing, failed, invalid or error,
+              a duplicate question paper has no uuid and its error names the existing copy
+    """
+    results = [{
+        "row": index + 1,
+        "question": entry["question"],
+        "solution": entry["solution"],
+        "status": None,
+        "uuid": None,
+        "error": None
+    } for index, entry in enumerate(entries)]
+
+    valid = []
+    for result, entry in zip(results, entries):
+        result["error"] = checkEntry(source, entry)
+        if result["error"]:
+            result["status"] = "invalid"
+        else:
+            valid.append((result, entry))
+
+    # Question paper hash -> manifest row it was first seen in
+    seen = {}
+    with ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="bulk-import") as executor:
+        for start in range(0, len(valid), batchSize):
+            batch = valid[start:start + batchSize]
+            futures = [executor.submit(spoolEntry, source, entry) for _, entry in batch]
+
+            papers, rejected = [], []
+            for (result, entry), future in zip(batch, futures):
+                try:
+                    paper = future.result()
+                except Exception as e:
+                    logger.error(f"Error reading {entry['question']} / {entry['solution']}: {e}")
+                    result["status"], result["error"] = "error", str(e)
+                    continue
+
+                questionHash = paper["stored"][0][0]
+                duplicate = findDuplicateFile('papers', questionHash)
+                if duplicate or questionHash in seen:
+                    result["status"] = "duplicate"
+                    result["error"] = f"same question paper as {duplicate['uuid'] if duplicate else 'row ' + str(seen[questionHash])}"
+                    rejected.append(paper["spooled"])
+                    continue
+                seen[questionHash] = result["row"]
+                papers.append((result, paper))
+
+            uuids = insertPapers([paper for _, paper in papers], user, ip) if papers else []
+            for (result, _), uuidStr in zip(papers, uuids or []):
+                result["status"], result["uuid"] = "submitted", uuidStr
+            if uuids is None:
+                for result, _ in papers:
+                    result["status"], result["error"] = "error", "database error, batch rolled back"
+
+            # After the insert, so files shared with a paper of this batch are kept
+            for spooled in rejected:
+                discardSpooled(spooled)
+
+    submitted = [result for result in results if result["status"] == "submitted"]
+    if approve and submitted:
+        # ingestQueue works through the files in parallel, by the time the first paper is
+        # ready most of the others are too. One deadline covers them all.
+        deadline = time.monotonic() + waitTimeout
+        for result in submitted:
+            waitForFiles('papers', result["uuid"], timeout=max(deadline - time.monotonic(), 0))
+
+        approved = approvePapers(user, [result["uuid"] for result in submitted])
+        for result in submitted:
+            if approved is None:
+                result["error"] = "database error while approving"
+                continue
+            result["status"] = approved.get(result["uuid"], "submitted")
+            if result["status"] == "approved":
+                queueThumbnails(result["uuid"])
+
+    counts = summarize(results)
+    logger.info(f"Bulk import by {user}: " + ", ".join(f"{count} {status}" for status, count in counts.items()))
+    return results
+
+
+def summarize(results):
+    """Number of manifest rows per status"""
+    counts = {}
+    for result in results:
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+    return counts
+
+
+class ImportJobs:
+    """
+    Bulk imports running on background threads, for /admin/import.
+
+    An import can take longer than a proxy waits for a response, so the request only checks the
+    archive and the manifest and hands them to start(). The last keep jobs are kept in memory,
+    get() returns their state and, once they are finished, their results.
+    """
+
+    def __init__(self, keep=20):
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+
+    def start(self, source, entries, user, ip, approve=False):
+        """Run importPapers on a new thread, source is closed when it is done. Returns the job id"""
+        jobId = uuid.uuid4().hex
+        job = {
+            "job": jobId,
+            "user": user,
+            "state": "running",
+            "rows": len(entries),
+            "startedAt": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            "finishedAt": None,
+            "summary": None,
+            "results": None,
+            "error": None
+        }
+        with self._lock:
+            self._jobs[jobId] = job
+            finished = [key for key, value in self._jobs.items() if value["state"] != "running"]
+            for key in finished[:max(len(self._jobs) - self.keep, 0)]:
+                del self._jobs[key]
+
+        threading.Thread(
+            target=self._run, args=(job, source, entries, user, ip, approve),
+            name=f"bulk-import-{jobId[:8]}", daemon=True
+        ).start()
+        return jobId
+
+    def _run(self, job, source, entries, user, ip, approve):
+        try:
+            results = importPapers(source, entries, user, ip, approve=approve)
+            update = {"state": "finished", "summary": summarize(results), "results": results}
+        except Exception as e:
+            logger.error(f"Bulk import {job['job']} by {user} failed: {e}")
+            update = {"state": "failed", "error": str(e)}
+        finally:
+            source.close()
+
+        with self._lock:
+            job.update(update, finishedAt=datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+
+    def get(self, jobId):
+        """Copy of a job's state, None for an unknown (or forgotten) job"""
+        with self._lock:
+            job = self._jobs.get(jobId)
+            return dict(job) if job else None
+
+
+importJobs = ImportJobs()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Import a season of papers from a ZIP or directory and a manifest")
+    parser.add_argument("path", help="ZIP file or directory holding the papers")
+    parser.add_argument("--manifest", help="CSV or JSON manifest, defaults to manifest.csv / manifest.json inside path")
+    parser.add_argument("--user", required=True, help="Username recorded as submitter (and approver)")
+    parser.add_argument("--approve", action="store_true", help="Approve the papers that are not duplicates")
+    parser.add_argument("--workers", type=int, default=4, help="Threads hashing and spooling files")
+    parser.add_argument("--batch-size", type=int, default=50, help="Papers inserted per transaction")
+    parser.add_argument("--report", help="Write the per-file results to this JSON file")
+    args = parser.parse_args()
+
+    source = openSource(args.path)
+    try:
+        if args.manifest:
+            with open(args.manifest, 'rb') as file:
+                entries = readManifest(file, args.manifest)
+        else:
+            entries = source.manifest()
+        if entries is None:
+            print(f"No manifest given and none of {', '.join(manifestNames)} found in {args.path}")
+            sys.exit(1)
+
+        results = importPapers(source, entries, args.user, "cli", approve=args.approve,
+                               workers=args.workers, batchSize=args.batch_size)
+    finally:
+        source.close()
+
+    # Files still being compressed would otherwise be left processing
+    ingestQueue.wait()
+
+    for result in results:
+        if result["status"] not in ("submitted", "approved"):
+            print(f"row {result['row']}: {result['status']} {result['error'] or ''}".rstrip())
+    print(", ".join(f"{count} {status}" for status, count in summarize(results).items()))
+
+    if args.report:
+        with open(args.report, 'w') as file:
+            json.dump(results, file, indent=2)
+    sys.exit(0 if all(result["status"] in ("submitted", "approved", "duplicate") for result in results) else 1)
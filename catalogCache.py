@@ -0,0 +1,168 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from logHandler import getCustomLogger
+
+logger = getCustomLogger(__name__)
+
+
+class CatalogCache:
+    """
+    A bounded LRU cache with a TTL for the browse lookups (years, components, topical lists).
+
+    Entries are keyed by (table, function, level, subject, year) so an approval or delete can
+    drop exactly the entries for the subject it touched. Every worker process has its own cache,
+    so each entry also remembers the version of its table it was loaded at. An approve / delete
+    in another worker bumps that version and the entry is a miss from then on.
+
+    Reading the version is a database query, so a table's version is trusted for versionInterval
+    seconds before it is read again. Changes made by another worker show up within that interval,
+    changes made by this one right away (invalidate forgets the version it read).
+    """
+
+    def __init__(self, maxSize=1024, ttl=300, versionFunction=None, versionInterval=1.0):
+        """
+        Args:
+            maxSize: Entries kept before the least recently used are evicted
+            ttl: Seconds an entry is served at most
+            versionFunction: Returns the current version of a table, None when it can't be read
+            versionInterval: Seconds a version read is reused for, 0 reads it on every lookup
+        """
+        self.maxSize = maxSize
+        self.ttl = ttl
+        self.versionFunction = versionFunction
+        self.versionInterval = versionInterval
+
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.counters = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0,
+            "staleVersions": 0,
+            "versionReads": 0
+        }
+
+    def currentVersion(self, table):
+        """Version of a table, read again once the last read is versionInterval seconds old"""
+        if not self.versionFunction:
+            return None
+
+        now = time.monotonic()
+        with self._lock:
+            known = self._versions.get(table)
+        if known is not None and now - known[1] < self.versionInterval:
+            return known[0]
+
+        version = self.versionFunction(table)
+        with self._lock:
+            self.counters["versionReads"] += 1
+            if version is not None:
+                self._versions[table] = (version, now)
+        return version
+
+    def get(self, key, version=None):
+        """Return (True, value) on a hit and (False, None) on a miss, entries of another version miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.counters["misses"] += 1
+                return False, None
+
+            value, expiresAt, entryVersion = entry
+            if expiresAt < time.monotonic():
+                del self._entries[key]
+                self.counters["expirations"] += 1
+                self.counters["misses"] += 1
+                return False, None
+            if entryVersion != version:
+                del self._entries[key]
+                self.counters["staleVersions"] += 1
+                self.counters["misses"] += 1
+                return False, None
+
+            self._entries.move_to_end(key)
+            self.counters["hits"] += 1
+            return True, value
+
+    def set(self, key, value, version=None):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl, version)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxSize:
+                self._entries.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    def invalidate(self, table, subject, year=None):
+        """
+        Drop the cached lookups over `table` for one subject, in this process.
+
+        Other processes notice the change through the content version the write bumps.
+
+        When a year is given only that year's listings (and the year independent ones,
+        like the list of years itself) are dropped.
+        """
+        year = str(year)[:4] if year else None
+        with self._lock:
+            stale = [
+                key for key in self._entries
+                if key[0] == table and key[3] == subject
+                and (year is None or key[4] is None or key[4] == year)
+            ]
+            for key in stale:
+                del self._entries[key]
+            # The write bumped the table's version, read it again instead of tagging new entries with the old one
+            self._versions.pop(table, None)
+            self.counters["invalidations"] += len(stale)
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+
+    def memoize(self, keyFunction):
+        """
+        Cache a lookup function.
+
+        keyFunction receives the same arguments and returns (table, level, subject, year).
+        None results mean a database error and are never cached, nor is anything while the
+        content version can't be read.
+        """
+        def decorator(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                table, level, subject, year = keyFunction(*args, **kwargs)
+                key = (table, function.__name__, level, subject, str(year)[:4] if year else None)
+
+                # Read before the lookup, a change made while it runs leaves the entry stale
+                version = self.currentVersion(table)
+                if self.versionFunction and version is None:
+                    return function(*args, **kwargs)
+
+                hit, value = self.get(key, version)
+                if hit:
+                    return value
+
+                value = function(*args, **kwargs)
+                if value is not None:
+                    self.set(key, value, version)
+                return value
+            return wrapper
+        return decorator
+
+    def stats(self):
+        """Return a snapshot of the cache counters"""
+        with self._lock:
+            snapshot = dict(self.counters)
+            snapshot["size"] = len(self._entries)
+        snapshot["maxSize"] = self.maxSize
+        snapshot["ttl"] = self.ttl
+        lookups = snapshot["hits"] + snapshot["misses"]
+        snapshot["hitRatio"] = round(snapshot["hits"] / lookups, 4) if lookups else 0.0
+        return snapshot
@@ -1,7 +1,112 @@
-import json 
+import json
+import os
+import threading
+import time
+
+from jinja2.utils import htmlsafe_json_dumps
+
+from logHandler import getCustomLogger
+
+logger = getCustomLogger(__name__)
 
 
 def loadConfig(PATH):
     with open(PATH, 'r') as config:
         config = json.load(config)
-    return config
\ No newline at end of file
+    return config
+
+
+class FrozenDict(dict):
+    """A dict that refuses changes, so a shared config snapshot cannot be edited by one request for all others"""
+
+    def _readOnly(self, *args, **kwargs):
+        raise TypeError("Config snapshots are read-only")
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _readOnly
+
+
+def freeze(value):
+    """Recursively turn dicts into FrozenDicts and lists into tuples"""
+    if isinstance(value, dict):
+        return FrozenDict((key, freeze(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+class ConfigSnapshot:
+    """
+    One parsed version of a config file.
+
+    data is the frozen config, json the same config ready to drop into a template and
+    lookups whatever the service's derive function precomputed from it.
+    """
+
+    def __init__(self, data, derive=None):
+        self.data = freeze(data)
+        self.json = htmlsafe_json_dumps(data)
+        self.lookups = derive(self.data) if derive else {}
+
+    def __getitem__(self, key):
+        return self.lookups[key]
+
+
+class ConfigService:
+    """
+    Hands out the current snapshot of a JSON config file.
+
+    The file is stat'ed at most once every checkInterval seconds and only parsed again
+    when its modification time or size changed, so routes can call get() on every request.
+    A broken edit is logged and the previous snapshot stays in use.
+    """
+
+    def __init__(self, path, derive=None, checkInterval=1.0):
+        self.path = path
+        self.derive = derive
+        self.checkInterval = checkInterval
+
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._signature = None
+        self._checkedAt = 0.0
+        self.reloads = 0
+
+    def _load(self):
+        stat = os.stat(self.path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature == self._signature:
+            return
+
+        try:
+            snapshot = ConfigSnapshot(loadConfig(self.path), self.derive)
+        except (ValueError, KeyError, TypeError) as e:
+            if self._snapshot is None:
+                raise
+            logger.error(f"Keeping the previous {self.path}, the new one failed to load: {e}")
+            self._signature = signature
+            return
+
+        self._snapshot = snapshot
+        self._signature = signature
+        self.reloads += 1
+        logger.info(f"Loaded config {self.path}")
+
+    def get(self):
+        """Return the current ConfigSnapshot"""
+        now = time.monotonic()
+        if self._snapshot is None or now - self._checkedAt >= self.checkInterval:
+            with self._lock:
+                if self._snapshot is None or now - self._checkedAt >= self.checkInterval:
+                    try:
+                        self._load()
+                    except FileNotFoundError:
+                        if self._snapshot is None:
+                            raise
+                        logger.error(f"Config {self.path} disappeared, keeping the previous one")
+                    self._checkedAt = now
+        return self._snapshot
+
+    def modifiedOn(self):
+        """Modification time of the loaded file in seconds, checked like get()"""
+        self.get()
+        return self._signature[0] / 1e9 if self._signature else 0.0
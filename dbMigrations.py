@@ -0,0 +1,527 @@
+import argparse
+import hashlib
+import sqlite3
+import time
+import zlib
+
+from paperGuidesDB import pool, blobStore, blobKey, storageMinSaving, createDatabase, rebuildCatalog, rebuildStatsCounters, fillLevelKeys, resumeIngestion, parseYear, loadStoredFile, STORAGE_BASE64, STORAGE_BLOB, STORAGE_BLOBSTORE
+from fileCodecs import getCodec, codecClasses
+from thumbnails import thumbnailKey, generateThumbnails
+from logHandler import getCustomLogger
+
+logger = getCustomLogger(__name__)
+
+# Tables that keep a questionFile / solutionFile pair
+fileTables = ["papers", "questions", "topicals"]
+
+# The lookups that run on every page view, none of them may scan a whole table
+hotQueries = {
+    "paper by uuid": ("SELECT * FROM papers WHERE uuid = ?", ("",)),
+    "question by uuid": ("SELECT * FROM questions WHERE uuid = ?", ("",)),
+    "topical by uuid": ("SELECT * FROM topicals WHERE uuid = ?", ("",)),
+    "catalog years": ("SELECT DISTINCT yearNumber FROM catalog WHERE kind = 'paper' AND levelKey = ? AND subject = ? ORDER BY yearNumber DESC", ("", "")),
+    "catalog components": ("SELECT component, year FROM catalog WHERE kind = 'paper' AND levelKey = ? AND subject = ? AND yearNumber = ? ORDER BY component ASC", ("", "", 0)),
+    "catalog topicals": ("SELECT uuid, topic FROM catalog WHERE kind = 'topical' AND levelKey = ? AND subject = ?", ("", "")),
+    "render paper": ("SELECT uuid FROM papers WHERE levelKey = ? AND subject = ? AND year = ? AND component = ? AND approved = 1", ("", "", "", "")),
+    "duplicate paper": ("SELECT * FROM papers WHERE levelKey = ? AND subject = ? AND approved = True AND year = ? AND component = ? AND board = ?", ("", "", "", "", "")),
+    "components by year": ("SELECT component FROM papers WHERE subject = ? AND year = ?", ("", "")),
+    "count questions": ("SELECT COUNT(*) FROM questions WHERE levelKey = ? AND subject = ? AND approved = 1", ("", "")),
+    "count papers": ("SELECT COUNT(*) FROM papers WHERE levelKey = ? AND subject = ? AND approved = 1", ("", "")),
+    "question generator": ("SELECT id FROM questions WHERE board = ? AND subject = ? AND levelKey = ? AND approved = 1", ("", "", "")),
+    "unapproved papers": ("SELECT uuid FROM papers WHERE approved = False", ()),
+    "questions by score": ("SELECT id FROM questions WHERE board = ? AND subject = ? AND levelKey = ? AND approved = 1 AND ratingScore BETWEEN ? AND ?", ("", "", "", 1, 5)),
+    "existing rating": ("SELECT rating FROM ratings WHERE user_id = ? AND question_UUID = ?", ("", "")),
+    "stats counter": ("SELECT count FROM stats_counters WHERE tableName = ? AND board = ? AND level = ? AND subject = ? AND approved = ?", ("", "", "", "", 0)),
+    "content version": ("SELECT key, value FROM meta WHERE key IN (?, ?)", ("", "")),
+    "duplicate file": ("SELECT uuid FROM papers WHERE questionHash = ? AND uuid != ? ORDER BY approved DESC, id LIMIT 1", ("", "")),
+    "file referenced": ("SELECT 1 FROM papers WHERE questionHash = ? OR solutionHash = ? LIMIT 1", ("", ""))
+}
+
+
+def migrateBlobStorage(batchSize=100, pause=0.0, tables=None):
+    """
+    Convert base64 TEXT files to raw BLOBs in small batches.
+
+    Each batch is its own short transaction so the site keeps serving while this runs.
+    Progress lives in the rows themselves (storageVersion), so an interrupted run simply
+    picks up where it stopped the next time it is started.
+
+    Args:
+        batchSize: Rows converted per transaction
+        pause: Seconds to sleep between batches to leave room for other writers
+        tables: Tables to migrate, defaults to every table holding files
+
+    Returns:
+        dict: Number of rows converted per table
+    """
+    converted = {}
+
+    for table in tables or fileTables:
+        converted[table] = 0
+        lastId = 0
+
+        while True:
+            with pool.connection() as connection:
+                rows = connection.execute(f'''
+                    SELECT id, questionFile, solutionFile
+                    FROM {table}
+                    WHERE id > ?
+                    AND (storageVersion IS NULL OR storageVersion = ?)
+                    ORDER BY id
+                    LIMIT ?
+                ''', (lastId, STORAGE_BASE64, batchSize)).fetchall()
+
+                if not rows:
+                    break
+
+                for rowId, questionFile, solutionFile in rows:
+                    # The storageVersion check keeps a row from being converted twice if another run got there first
+                    connection.execute(f'''
+                        UPDATE {table}
+                        SET questionFile = ?, solutionFile = ?, storageVersion = ?
+                        WHERE id = ? AND (storageVersion IS NULL OR storageVersion = ?)
+                    ''', (loadStoredFile(questionFile), loadStoredFile(solutionFile), STORAGE_BLOB, rowId, STORAGE_BASE64))
+
+                connection.commit()
+
+            lastId = rows[-1][0]
+            converted[table] += len(rows)
+            logger.info(f"Converted {converted[table]} rows in {table} to BLOB storage (last id {lastId})")
+
+            if pause:
+                time.sleep(pause)
+
+    return converted
+
+
+def migrateBlobStore(batchSize=50, pause=0.0, tables=None):
+    """
+    Move inline files (base64 TEXT or BLOB) out of the database into the blob store.
+
+    Works like migrateBlobStorage: small batches, one transaction each, resumable.
+    The blob is written before the row is updated, so a crash in between only leaves
+    an unreferenced blob behind which `gc-blobs` cleans up. Run `vacuum` afterwards
+    to actually shrink the database file.
+
+    Returns:
+        dict: Number of rows moved per table
+    """
+    moved = {}
+
+    for table in tables or fileTables:
+        moved[table] = 0
+        lastId = 0
+
+        while True:
+            with pool.connection() as connection:
+                rows = connection.execute(f'''
+                    SELECT id, questionFile, solutionFile, storageVersion
+                    FROM {table}
+                    WHERE id > ?
+                    AND (storageVersion IS NULL OR storageVersion != ?)
+                    ORDER BY id
+                    LIMIT ?
+                ''', (lastId, STORAGE_BLOBSTORE, batchSize)).fetchall()
+
+                if not rows:
+                    break
+
+                for rowId, questionFile, solutionFile, storageVersion in rows:
+                    references = []
+                    for storedData in (questionFile, solutionFile):
+                        compressedData = loadStoredFile(storedData)
+                        if compressedData is None:
+                            references.extend([None, None])
+                            continue
+                        originalData = zlib.decompress(compressedData)
+                        contentHash = hashlib.sha256(originalData).hexdigest()
+                        # The compressed bytes are already what the store keeps, no need to compress again
+                        blobStore.put(contentHash, compressedData)
+                        references.extend([contentHash, len(originalData)])
+
+                    questionHash, questionSize, solutionHash, solutionSize = references
+                    connection.execute(f'''
+                        UPDATE {table}
+                        SET questionFile = NULL, solutionFile = NULL,
+                            questionHash = ?, solutionHash = ?, questionSize = ?, solutionSize = ?,
+                            storageVersion = ?
+                        WHERE id = ? AND storageVersion IS ?
+                    ''', (questionHash, solutionHash, questionSize, solutionSize, STORAGE_BLOBSTORE, rowId, storageVersion))
+
+                connection.commit()
+
+            lastId = rows[-1][0]
+            moved[table] += len(rows)
+            logger.info(f"Moved {moved[table]} rows from {table} to the blob store (last id {lastId})")
+
+            if pause:
+                time.sleep(pause)
+
+    return moved
+
+
+def recompressBlobs(codecName, batchSize=50, pause=0.0, tables=None):
+    """
+    Store the blob store files of existing rows with another codec.
+
+    Files are decoded and encoded again one at a time, falling back to the none codec like new
+    uploads when the codec barely shrinks them. Files already stored as they are stay that way.
+    The old blobs are left for `gc-blobs`, so readers never miss a file.
+
+    Returns:
+        dict: Number of files recompressed per table
+    """
+    target = getCodec(codecName)
+    done = {}
+    converted = {}
+
+    for table in tables or fileTables:
+        done[table] = 0
+        lastId = 0
+
+        while True:
+            with pool.connection() as connection:
+                rows = connection.execute(f'''
+                    SELECT id, uuid, questionHash, questionCodec, solutionHash, solutionCodec
+                    FROM {table}
+                    WHERE id > ? AND storageVersion = ? AND fileState = 'ready'
+                    ORDER BY id
+                    LIMIT ?
+                ''', (lastId, STORAGE_BLOBSTORE, batchSize)).fetchall()
+
+                if not rows:
+                    break
+
+                for rowId, uuidStr, *files in rows:
+                    for fileType, contentHash, codec in (('question', *files[:2]), ('solution', *files[2:])):
+                        if contentHash is None or codec in (target.name, 'none'):
+                            continue
+
+                        if contentHash not in converted:
+                            storedData = blobStore.get(blobKey(contentHash, codec))
+                            if storedData is None:
+                                logger.warning(f"{fileType} file of {table} {uuidStr} is missing from the blob store")
+                                continue
+                            originalData = getCodec(codec).decompress(storedData)
+                            storedData = target.compress(originalData)
+                            newCodec = target.name
+                            if len(storedData) > len(originalData) * (1 - storageMinSaving):
+                                storedData, newCodec = originalData, 'none'
+                            blobStore.put(blobKey(contentHash, newCodec), storedData)
+                            converted[contentHash] = newCodec
+
+                        connection.execute(f'UPDATE {table} SET {fileType}Codec = ? WHERE id = ?', (converted[contentHash], rowId))
+                        done[table] += 1
+
+                connection.commit()
+
+            lastId = rows[-1][0]
+            logger.info(f"Recompressed {done[table]} files of {table} with {target.name} (last id {lastId})")
+
+            if pause:
+                time.sleep(pause)
+
+    return done
+
+
+def backfillYears(batchSize=500):
+    """
+    Fill papers.yearNumber / papers.session from the year labels of older rows.
+
+    Only rows without a yearNumber are touched, so the backfill can be rerun safely.
+    The catalog is rebuilt at the end so browsing picks up the sessions.
+
+    Returns:
+        int: Number of papers updated
+    """
+    updated = 0
+    lastId = 0
+
+    while True:
+        with pool.connection() as connection:
+            rows = connection.execute('''
+                SELECT id, year FROM papers
+                WHERE id > ? AND yearNumber IS NULL
+                ORDER BY id
+                LIMIT ?
+            ''', (lastId, batchSize)).fetchall()
+
+            if not rows:
+                break
+
+            for rowId, year in rows:
+                yearNumber, session = parseYear(year)
+                if yearNumber is None:
+                    logger.warning(f"Paper {rowId} has no recognisable year: {year!r}")
+                    continue
+                connection.execute(
+                    'UPDATE papers SET yearNumber = ?, session = ? WHERE id = ?',
+                    (yearNumber, session, rowId)
+                )
+                updated += 1
+
+            connection.commit()
+
+        lastId = rows[-1][0]
+        logger.info(f"Backfilled years for {updated} papers (last id {lastId})")
+
+    rebuildCatalog()
+    return updated
+
+
+def backfillHashes(batchSize=200):
+    """
+    Record the content hash and size of files still stored inline.
+
+    Rows moved to the blob store got theirs when they were moved, this lets duplicate uploads
+    of the older rows be caught too without moving them. Rerunning it only touches rows still
+    missing a hash.
+
+    Returns:
+        dict: Number of files hashed per table
+    """
+    hashed = {}
+
+    for table in fileTables:
+        hashed[table] = 0
+        lastId = 0
+
+        while True:
+            with pool.connection() as connection:
+                rows = connection.execute(f'''
+                    SELECT id, questionFile, solutionFile, questionHash, solutionHash, questionCodec, solutionCodec
+                    FROM {table}
+                    WHERE id > ?
+                    AND ((questionHash IS NULL AND questionFile IS NOT NULL) OR (solutionHash IS NULL AND solutionFile IS NOT NULL))
+                    ORDER BY id
+                    LIMIT ?
+                ''', (lastId, batchSize)).fetchall()
+
+                if not rows:
+                    break
+
+                for rowId, questionFile, solutionFile, questionHash, solutionHash, questionCodec, solutionCodec in rows:
+                    for fileType, storedData, contentHash, codec in (("question", questionFile, questionHash, questionCodec), ("solution", solutionFile, solutionHash, solutionCodec)):
+                        if contentHash is not None or storedData is None:
+                            continue
+                        originalData = getCodec(codec).decompress(loadStoredFile(storedData))
+                        connection.execute(
+                            f'UPDATE {table} SET {fileType}Hash = ?, {fileType}Size = ? WHERE id = ?',
+                            (hashlib.sha256(originalData).hexdigest(), len(originalData), rowId)
+                        )
+                        hashed[table] += 1
+
+                connection.commit()
+
+            lastId = rows[-1][0]
+            logger.info(f"Hashed {hashed[table]} inline files of {table} (last id {lastId})")
+
+    return hashed
+
+
+def backfillLevels(batchSize=5000):
+    """
+    Recompute the canonical levelKey of every question, paper and topical with normalizeLevel.
+
+    createDatabase fills the column when it is added, this repairs rows written around it.
+    Rows are handled in id ranges of batchSize, each its own short transaction, then the
+    catalog and the stats counters are rebuilt from the new keys.
+
+    Returns:
+        int: Number of rows whose level key changed
+    """
+    updated = 0
+    for table in fileTables:
+        with pool.connection() as connection:
+            maxId = connection.execute(f'SELECT MAX(id) FROM {table}').fetchone()[0] or 0
+
+        for firstId in range(0, maxId + 1, batchSize):
+            with pool.connection() as connection:
+                updated += fillLevelKeys(connection, table, firstId, firstId + batchSize - 1)
+                connection.commit()
+        logger.info(f"Backfilled level keys of {table}, {updated} rows changed so far")
+
+    rebuildCatalog()
+    rebuildStatsCounters()
+    return updated
+
+
+def collectGarbageBlobs(dryRun=False):
+    """
+    Delete blobs no row points at anymore.
+
+    Deleting a paper never removes its blobs directly since identical uploads share
+    them, this sweep is what reclaims the space. Run it when no uploads are in flight,
+    an upload writes its blob a moment before its row.
+
+    Returns:
+        int: Number of blobs deleted (or that would be deleted on a dry run)
+    """
+    with pool.connection() as connection:
+        referenced = set()
+        hashes = set()
+        for table in fileTables:
+            for questionHash, questionCodec, solutionHash, solutionCodec in connection.execute(
+                f"SELECT questionHash, questionCodec, solutionHash, solutionCodec FROM {table}"
+            ):
+                hashes.update((questionHash, solutionHash))
+                referenced.update((blobKey(questionHash, questionCodec), blobKey(solutionHash, solutionCodec)))
+
+        # Thumbnails live as long as the file they were rendered from
+        orphanedThumbnails = []
+        for rowId, contentHash, page, width in connection.execute("SELECT id, contentHash, page, width FROM thumbnails"):
+            if contentHash in hashes:
+                referenced.add(thumbnailKey(contentHash, page, width))
+            else:
+                orphanedThumbnails.append((rowId,))
+
+        if not dryRun:
+            connection.executemany("DELETE FROM thumbnails WHERE id = ?", orphanedThumbnails)
+            connection.commit()
+
+    deleted = 0
+    for key in list(blobStore.keys()):
+        if key not in referenced:
+            if not dryRun:
+                blobStore.delete(key)
+            deleted += 1
+
+    logger.info(f"{'Found' if dryRun else 'Deleted'} {deleted} unreferenced blobs")
+    return deleted
+
+
+def checkIndexes():
+    """
+    Run EXPLAIN QUERY PLAN over every hot query and report the ones doing a full table scan.
+
+    Returns:
+        list: Names of the queries that scan a whole table, empty when all of them use an index
+    """
+    scans = []
+    with pool.connection() as connection:
+        for name, (query, params) in hotQueries.items():
+            plan = [row[3] for row in connection.execute(f"EXPLAIN QUERY PLAN {query}", params)]
+            fullScans = [step for step in plan if step.startswith("SCAN") and "INDEX" not in step]
+
+            if fullScans:
+                scans.append(name)
+                logger.warning(f"{name}: {'; '.join(fullScans)}")
+            else:
+                logger.info(f"{name}: {'; '.join(plan)}")
+    return scans
+
+
+def renderMissingThumbnails():
+    """
+    Render thumbnails for approved papers and topicals that do not have them yet.
+
+    Runs in the foreground, handy after installing a rasterizer or for rows approved before thumbnails existed.
+
+    Returns:
+        int: Number of pages rendered
+    """
+    with pool.connection() as connection:
+        uuids = [
+            row[0] for table in ("papers", "topicals")
+            for row in connection.execute(f'''
+                SELECT uuid FROM {table} WHERE approved = 1
+                AND (questionHash NOT IN (SELECT contentHash FROM thumbnails) OR questionHash IS NULL)
+            ''')
+        ]
+
+    rendered = 0
+    for uuid in uuids:
+        rendered += generateThumbnails(uuid)
+    logger.info(f"Rendered {rendered} thumbnail pages for {len(uuids)} papers / topicals")
+    return rendered
+
+
+def vacuumDatabase():
+    """Rebuild the database file so space freed by a migration is given back to the OS"""
+    with pool.connection() as connection:
+        connection.execute("VACUUM")
+    logger.info("Database vacuumed")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Paper-Guides database maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    blobStorage = commands.add_parser("blob-storage", help="Convert base64 TEXT files to raw BLOBs")
+    blobStorage.add_argument("--batch-size", type=int, default=100)
+    blobStorage.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between batches")
+    blobStorage.add_argument("--table", action="append", choices=fileTables, help="Only migrate this table (repeatable)")
+
+    blobStoreMigration = commands.add_parser("blob-store", help="Move inline files into the blob store")
+    blobStoreMigration.add_argument("--batch-size", type=int, default=50)
+    blobStoreMigration.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between batches")
+    blobStoreMigration.add_argument("--table", action="append", choices=fileTables, help="Only migrate this table (repeatable)")
+
+    garbageCollection = commands.add_parser("gc-blobs", help="Delete blobs no longer referenced by any row")
+    garbageCollection.add_argument("--dry-run", action="store_true")
+
+    recompress = commands.add_parser("recompress", help="Store the files of existing rows with another codec")
+    recompress.add_argument("--codec", required=True, choices=list(codecClasses))
+    recompress.add_argument("--batch-size", type=int, default=50)
+    recompress.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between batches")
+    recompress.add_argument("--table", action="append", choices=fileTables, help="Only recompress this table (repeatable)")
+
+    commands.add_parser("vacuum", help="Reclaim free space in the database file")
+
+    backfill = commands.add_parser("backfill-years", help="Split old year labels into papers.yearNumber / papers.session")
+    backfill.add_argument("--batch-size", type=int, default=500)
+
+    backfillHashesCommand = commands.add_parser("backfill-hashes", help="Record the content hash of files still stored inline")
+    backfillHashesCommand.add_argument("--batch-size", type=int, default=200)
+
+    backfillLevelKeys = commands.add_parser("backfill-levels", help="Recompute the canonical level key of every row")
+    backfillLevelKeys.add_argument("--batch-size", type=int, default=5000)
+
+    commands.add_parser("rebuild-catalog", help="Recreate the browse catalog from the approved papers and topicals")
+
+    commands.add_parser("rebuild-stats", help="Recount the stats counters from the questions, papers and topicals")
+
+    commands.add_parser("resume-ingest", help="Compress the uploads left processing or failed, e.g. by a restart")
+
+    commands.add_parser("check-indexes", help="Fail if any hot query does a full table scan")
+
+    commands.add_parser("thumbnails", help="Render the missing WebP thumbnails of approved papers and topicals")
+
+    args = parser.parse_args()
+
+    try:
+        createDatabase()
+
+        if args.command == "blob-storage":
+            print(migrateBlobStorage(args.batch_size, args.pause, args.table))
+        elif args.command == "blob-store":
+            print(migrateBlobStore(args.batch_size, args.pause, args.table))
+        elif args.command == "gc-blobs":
+            print(collectGarbageBlobs(args.dry_run))
+        elif args.command == "recompress":
+            print(recompressBlobs(args.codec, args.batch_size, args.pause, args.table))
+        elif args.command == "vacuum":
+            vacuumDatabase()
+        elif args.command == "backfill-years":
+            print(backfillYears(args.batch_size))
+        elif args.command == "backfill-hashes":
+            print(backfillHashes(args.batch_size))
+        elif args.command == "backfill-levels":
+            print(backfillLevels(args.batch_size))
+        elif args.command == "rebuild-catalog":
+            print(rebuildCatalog())
+        elif args.command == "rebuild-stats":
+            print(rebuildStatsCounters())
+        elif args.command == "resume-ingest":
+            print(resumeIngestion())
+        elif args.command == "thumbnails":
+            print(renderMissingThumbnails())
+        elif args.command == "check-indexes":
+            scans = checkIndexes()
+            if scans:
+                print(f"Full table scans in: {', '.join(scans)}")
+                raise SystemExit(1)
+            print("All hot queries use an index")
+    except sqlite3.Error as e:
+        logger.error(f"Migration failed: {e}")
+        raise SystemExit(1)
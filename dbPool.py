@@ -0,0 +1,195 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from logHandler import getCustomLogger
+
+logger = getCustomLogger(__name__)
+
+
+# PRAGMAs applied to every connection the pool opens
+defaultPragmas = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 268435456,  # 256 MB
+    "cache_size": -65536,  # negative means KiB, so 64 MB
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000
+}
+
+
+class ConnectionPool:
+    """
+    A small thread-safe pool of SQLite connections.
+
+    Connections are opened lazily up to `size`, handed out with `connection()` and
+    returned to the pool afterwards. A thread that already holds a connection gets the
+    same one back on nested calls, so helpers like findDuplicateFile() can be called from
+    inside approvePapers() without checking out a second connection.
+    """
+
+    def __init__(self, path, size=5, timeout=30, pragmas=None):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.pragmas = dict(defaultPragmas if pragmas is None else pragmas)
+
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._reset()
+
+    def _reset(self):
+        # Called on creation and after a fork, a child worker must never reuse the parent's connections
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._local = threading.local()
+        self.counters = {
+            "checkouts": 0,
+            "waits": 0,
+            "waitTime": 0.0,
+            "reconnects": 0,
+            "opened": 0,
+            "timeouts": 0
+        }
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+
+        for pragma, value in self.pragmas.items():
+            connection.execute(f"PRAGMA {pragma} = {value}")
+
+        with self._lock:
+            self.counters["opened"] += 1
+        return connection
+
+    def _isAlive(self, connection):
+        try:
+            connection.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _checkout(self):
+        if os.getpid() != self._pid:
+            with self._lock:
+                if os.getpid() != self._pid:
+                    self._reset()
+
+        connection = None
+        try:
+            connection = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                canOpen = self._opened < self.size
+                if canOpen:
+                    self._opened += 1
+
+            if canOpen:
+                try:
+                    connection = self._connect()
+                except sqlite3.Error:
+                    with self._lock:
+                        self._opened -= 1
+                    raise
+            else:
+                # Pool exhausted, wait for another thread to give a connection back
+                start = time.perf_counter()
+                try:
+                    connection = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self.counters["timeouts"] += 1
+                    raise sqlite3.OperationalError(
+                        f"Timed out after {self.timeout}s waiting for a database connection"
+                    )
+                with self._lock:
+                    self.counters["waits"] += 1
+                    self.counters["waitTime"] += time.perf_counter() - start
+
+        if not self._isAlive(connection):
+            logger.warning("Discarding a broken database connection and reconnecting")
+            try:
+                connection.close()
+            except sqlite3.Error:
+                pass
+            connection = self._connect()
+            with self._lock:
+                self.counters["reconnects"] += 1
+
+        with self._lock:
+            self.counters["checkouts"] += 1
+        return connection
+
+    def _checkin(self, connection):
+        if connection.in_transaction:
+            connection.rollback()
+        connection.row_factory = None
+        self._idle.put(connection)
+
+    @contextmanager
+    def connection(self, rowFactory=None):
+        """
+        Check a connection out of the pool for the duration of a `with` block.
+
+        The outermost block commits on success and rolls back on error before handing
+        the connection back. Nested blocks on the same thread share that connection and
+        leave the transaction to the outer block.
+
+        Args:
+            rowFactory: Optional sqlite3 row factory to use inside this block
+
+        Yields:
+            sqlite3.Connection
+        """
+        held = getattr(self._local, "connection", None)
+
+        if held is not None and self._local.pid == os.getpid():
+            previousFactory = held.row_factory
+            held.row_factory = rowFactory
+            try:
+                yield held
+            finally:
+                held.row_factory = previousFactory
+            return
+
+        connection = self._checkout()
+        connection.row_factory = rowFactory
+        self._local.connection = connection
+        self._local.pid = os.getpid()
+        try:
+            yield connection
+            if connection.in_transaction:
+                connection.commit()
+        except BaseException:
+            if connection.in_transaction:
+                connection.rollback()
+            raise
+        finally:
+            self._local.connection = None
+            self._checkin(connection)
+
+    def stats(self):
+        """Return a snapshot of the pool counters"""
+        with self._lock:
+            snapshot = dict(self.counters)
+            snapshot["size"] = self.size
+            snapshot["open"] = self._opened
+        snapshot["idle"] = self._idle.qsize()
+        snapshot["inUse"] = snapshot["open"] - snapshot["idle"]
+        return snapshot
+
+    def close(self):
+        """Close every idle connection, used on shutdown"""
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            connection.close()
+            with self._lock:
+                self._opened -= 1
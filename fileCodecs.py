@@ -0,0 +1,166 @@
+import os
+import zlib
+
+# zstd and brotli are optional, without them files are stored with zlib as before
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class Codec:
+    """
+    One way of storing a file in the blob store.
+
+    compressor() / decompressor() return streaming objects with the zlib interface,
+    compress(chunk) / decompress(chunk) plus flush(), so files never have to be held in memory.
+    contentEncoding is the HTTP Content-Encoding browsers decode the stored bytes with,
+    None when the stored bytes have to be decoded on the server.
+    """
+
+    name = None
+    contentEncoding = None
+    # Levels the benchmark tries, the first one is the default
+    levels = (None,)
+
+    def __init__(self, level=None):
+        self.level = self.levels[0] if level is None else level
+
+    def available(self):
+        return True
+
+    def compressor(self):
+        raise NotImplementedError
+
+    def decompressor(self):
+        raise NotImplementedError
+
+    def compress(self, data):
+        compressor = self.compressor()
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data):
+        decompressor = self.decompressor()
+        return decompressor.decompress(data) + decompressor.flush()
+
+
+class PassThrough:
+    # Streaming object for the stored codec
+    def compress(self, data):
+        return data
+
+    decompress = compress
+
+    def flush(self):
+        return b""
+
+
+class StoredCodec(Codec):
+    """Keeps the file as it is, for PDFs and images that are compressed already"""
+
+    name = "none"
+
+    def compressor(self):
+        return PassThrough()
+
+    def decompressor(self):
+        return PassThrough()
+
+
+class ZlibCodec(Codec):
+    # A zlib stream is exactly what HTTP calls deflate
+    name = "zlib"
+    contentEncoding = "deflate"
+    levels = (9, 6, 1)
+
+    def compressor(self):
+        return zlib.compressobj(level=self.level)
+
+    def decompressor(self):
+        return zlib.decompressobj()
+
+
+class ZstdCodec(Codec):
+    name = "zstd"
+    contentEncoding = "zstd"
+    levels = (10, 3, 19)
+
+    def available(self):
+        return zstandard is not None
+
+    def compressor(self):
+        return zstandard.ZstdCompressor(level=self.level).compressobj()
+
+    def decompressor(self):
+        return zstandard.ZstdDecompressor().decompressobj()
+
+
+class BrotliStream:
+    # brotli's streaming objects call compress / decompress "process"
+    def __init__(self, stream, finish):
+        self.stream = stream
+        self.finish = finish
+
+    def compress(self, data):
+        return self.stream.process(data)
+
+    decompress = compress
+
+    def flush(self):
+        return self.finish()
+
+
+class BrotliCodec(Codec):
+    name = "br"
+    contentEncoding = "br"
+    levels = (9, 5, 11)
+
+    def available(self):
+        return brotli is not None
+
+    def compressor(self):
+        stream = brotli.Compressor(quality=self.level)
+        return BrotliStream(stream, stream.finish)
+
+    def decompressor(self):
+        return BrotliStream(brotli.Decompressor(), lambda: b"")
+
+
+codecClasses = {codec.name: codec for codec in (ZlibCodec, ZstdCodec, BrotliCodec, StoredCodec)}
+
+
+def getCodec(name, level=None):
+    """
+    Return the codec stored under name, rows without one are zlib.
+
+    Raises:
+        ValueError: If the codec is unknown or its package is not installed
+    """
+    codec = codecClasses.get(name or "zlib")
+    if codec is None or not codec().available():
+        raise ValueError(f"Codec {name} is not available, zstd needs `pip install zstandard` and br `pip install brotli`")
+    return codec(level)
+
+
+def availableCodecs():
+    """Names of the codecs usable here, in lookup order"""
+    return [name for name, codec in codecClasses.items() if codec().available()]
+
+
+def getStorageCodec():
+    """
+    Codec new uploads are stored with, from STORAGE_CODEC (auto, zlib, zstd, br or none).
+
+    auto picks zstd when it is installed and zlib otherwise. STORAGE_CODEC_LEVEL overrides
+    the codec's default level.
+    """
+    name = os.getenv('STORAGE_CODEC', 'auto').lower()
+    if name == 'auto':
+        name = 'zstd' if zstandard is not None else 'zlib'
+    level = os.getenv('STORAGE_CODEC_LEVEL')
+    return getCodec(name, int(level) if level else None)
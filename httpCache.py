@@ -0,0 +1,94 @@
+import hashlib
+import os
+from datetime import datetime
+from functools import wraps, lru_cache
+
+from flask import request, make_response
+from flask_login import current_user
+
+from paperGuidesDB import getContentVersion
+from logHandler import getCustomLogger
+
+logger = getCustomLogger(__name__)
+
+# Files whose change alters what a page renders, a deploy must not be answered with a stale 304
+deployFiles = ["./app.py"]
+
+# Hot-reloaded files pages render from, as functions returning their modification time.
+# app.py registers the site config, its edits need no restart so they can't be part of getDeployVersion.
+reloadableSources = []
+
+
+@lru_cache(maxsize=None)
+def getDeployVersion():
+    """
+    Newest modification time of the templates, the app and the config.
+
+    Read once per process, a deploy restarts the workers anyway.
+    """
+    mtimes = [os.path.getmtime(path) for path in deployFiles if os.path.exists(path)]
+    for directory, _, files in os.walk("./templates"):
+        mtimes.extend(os.path.getmtime(os.path.join(directory, name)) for name in files)
+    return int(max(mtimes, default=0))
+
+
+def getPageVersion():
+    """getDeployVersion, moved forward by edits to the reloadableSources"""
+    return int(max([getDeployVersion()] + [source() for source in reloadableSources]))
+
+
+def conditionalPage(maxAge=60, sharedMaxAge=600, versionKeys=("contentVersion",)):
+    """
+    Answer read-only pages with 304 Not Modified when the browser (or CDN) already has them.
+
+    The weak ETag is built from the deploy version, the content version counters that the
+    approve / delete functions bump (see bumpContentVersion) and the route arguments, so it
+    changes exactly when the rendered page could. Logged in users see their own navigation,
+    their pages are never cached.
+
+    Args:
+        maxAge: Seconds browsers may reuse the page without asking
+        sharedMaxAge: Seconds a CDN may reuse the page without asking
+        versionKeys: Content version counters the page depends on
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if current_user.is_authenticated:
+                response = make_response(view(*args, **kwargs))
+                response.cache_control.private = True
+                response.cache_control.no_cache = True
+                return response
+
+            versions, lastModified = getContentVersion(versionKeys)
+            if versions is None:
+                # Without a version there is nothing safe to validate against, just render
+                return view(*args, **kwargs)
+
+            deployVersion = getPageVersion()
+            deployedOn = datetime.utcfromtimestamp(deployVersion)
+            lastModified = max(lastModified, deployedOn) if lastModified else deployedOn
+
+            routeArgs = "/".join(f"{key}={kwargs[key]}" for key in sorted(kwargs))
+            tag = f"{deployVersion}:{':'.join(map(str, versions))}:{request.endpoint}:{routeArgs}"
+            etag = hashlib.sha1(tag.encode()).hexdigest()
+
+            if request.if_none_match.contains_weak(etag):
+                response = make_response("", 304)
+            elif not request.if_none_match and request.if_modified_since and request.if_modified_since.replace(tzinfo=None) >= lastModified:
+                response = make_response("", 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                # Only successful pages are worth caching, 404s and redirects go out as they are
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag, weak=True)
+            response.last_modified = lastModified
+            response.cache_control.public = True
+            response.cache_control.max_age = maxAge
+            response.cache_control.s_maxage = sharedMaxAge
+            response.vary.add("Cookie")
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,246 @@
+import atexit
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from fileCodecs import getCodec
+from logHandler import getCustomLogger
+
+logger = getCustomLogger(__name__)
+
+
+def compressSpooledFiles(paths, chunkSize, codecName='zlib', level=None, minSaving=0.0):
+    """
+    Compress raw spool files next to themselves, runs in a worker process.
+
+    A file the codec shrinks by less than minSaving (a fraction of its size) is kept as it is
+    with the none codec, its raw spool file is what gets stored. A path that is already gone
+    was stored by an earlier job for the same content, its entry comes back with no path.
+
+    Returns:
+        tuple: ([(path to store or None, codec name, raw size, stored size)], seconds spent)
+    """
+    started = time.perf_counter()
+    codec = getCodec(codecName, level)
+    results = []
+    for path in paths:
+        try:
+            source = open(path, 'rb')
+        except FileNotFoundError:
+            results.append((None, None, 0, 0))
+            continue
+
+        if codec.name == 'none':
+            with source:
+                size = os.fstat(source.fileno()).st_size
+            results.append((path, 'none', size, size))
+            continue
+
+        compressedPath = f"{path}.{os.getpid()}.{codec.name}"
+        compressor = codec.compressor()
+        rawSize = 0
+        with source, open(compressedPath, 'wb') as output:
+            while chunk := source.read(chunkSize):
+                rawSize += len(chunk)
+                output.write(compressor.compress(chunk))
+            output.write(compressor.flush())
+
+        compressedSize = os.path.getsize(compressedPath)
+        if compressedSize > rawSize * (1 - minSaving):
+            os.remove(compressedPath)
+            results.append((path, 'none', rawSize, rawSize))
+        else:
+            results.append((compressedPath, codec.name, rawSize, compressedSize))
+    return results, time.perf_counter() - started
+
+
+def runWorker(arguments):
+    """
+    Run compressSpooledFiles in a fresh `python ingestQueue.py` process.
+
+    The worker imports this module and fileCodecs and nothing else. A multiprocessing child would
+    import the parent's main script again (app.py creating the database and the Flask app), and
+    forking the threaded server could copy a lock another thread holds.
+    """
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__)],
+        input=json.dumps(arguments), capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"ingest worker exited with {completed.returncode}: {completed.stderr.strip()[-500:]}")
+    results, seconds = json.loads(completed.stdout)
+    return [tuple(result) for result in results], seconds
+
+
+class IngestQueue:
+    """
+    Compresses uploads in a pool of worker processes.
+
+    Compressing a large paper takes seconds and holds the GIL while it runs, so the request
+    only spools and hashes the upload and hands the compression to another process. When a
+    job finishes finishFunction(jobId, results) stores the output and marks the row ready,
+    results is None when the job failed. It returns False when the files could not be stored. With workers set to 0 jobs run inline,
+    which scripts importing the database module rely on.
+    """
+
+    def __init__(self, finishFunction, codec, workers=2, chunkSize=1024 * 1024, minSaving=0.0, historySize=50):
+        """
+        Args:
+            finishFunction: Called with the job id and [(key, raw path, path to store or None, codec name)],
+                            or None on failure
+            codec: fileCodecs.Codec the files are compressed with
+            workers: Worker processes, 0 compresses on the calling thread
+            chunkSize: Bytes read and compressed at a time
+            minSaving: Files compressing by less than this fraction are stored as they are
+            historySize: Finished jobs kept for the metrics
+        """
+        self.finishFunction = finishFunction
+        self.codec = codec
+        self.workers = workers
+        self.chunkSize = chunkSize
+        self.minSaving = minSaving
+
+        self._executor = None
+        self._lock = threading.Lock()
+        self._depth = 0
+        self._history = deque(maxlen=historySize)
+
+        self.counters = {
+            "submitted": 0,
+            "completed": 0,
+            "failures": 0,
+            "bytesIn": 0,
+            "bytesOut": 0,
+            "lastJobMs": 0.0,
+            "maxJobMs": 0.0,
+            "totalJobMs": 0.0,
+            "totalWaitMs": 0.0
+        }
+
+    def _getExecutor(self):
+        # Started on first use, scripts importing the database module never pay for it. Each thread
+        # waits on one worker process at a time (see runWorker), so `workers` jobs run in parallel.
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ingest")
+            atexit.register(self.close)
+        return self._executor
+
+    def submit(self, jobId, files):
+        """
+        Queue the raw spool files of one upload for compression.
+
+        Args:
+            jobId: Passed back to finishFunction
+            files: (key, raw spool path) pairs
+
+        Returns:
+            Future: The running job, None when there was nothing to do or the job ran inline
+        """
+        if not files:
+            return None
+        paths = [path for _, path in files]
+
+        queuedAt = time.perf_counter()
+        with self._lock:
+            self._depth += 1
+            self.counters["submitted"] += 1
+            executor = self._getExecutor() if self.workers > 0 else None
+
+        if executor is not None:
+            future = executor.submit(runWorker, self._jobArguments(paths))
+            future.add_done_callback(lambda future: self._finish(jobId, files, queuedAt, future.result))
+            return future
+
+        self._finish(jobId, files, queuedAt, lambda: compressSpooledFiles(*self._jobArguments(paths)))
+        return None
+
+    def _jobArguments(self, paths):
+        # Codecs are passed by name, the worker builds its own
+        return paths, self.chunkSize, self.codec.name, self.codec.level, self.minSaving
+
+    def _finish(self, jobId, files, queuedAt, getResult):
+        try:
+            results, workSeconds = getResult()
+        except Exception as e:
+            logger.error(f"Error compressing upload {jobId}: {e}")
+            results, workSeconds = None, 0.0
+
+        try:
+            stored = self.finishFunction(jobId, None if results is None else [
+                (key, path, storedPath, codecName) for (key, path), (storedPath, codecName, _, _) in zip(files, results)
+            ]) is not False
+        except Exception as e:
+            logger.error(f"Error storing compressed upload {jobId}: {e}")
+            stored = False
+
+        elapsed = (time.perf_counter() - queuedAt) * 1000
+        workMs = workSeconds * 1000
+        bytesIn = sum(result[2] for result in results or [])
+        bytesOut = sum(result[3] for result in results or [])
+
+        with self._lock:
+            self._depth -= 1
+            if results is None or not stored:
+                self.counters["failures"] += 1
+            else:
+                self.counters["completed"] += 1
+                self.counters["bytesIn"] += bytesIn
+                self.counters["bytesOut"] += bytesOut
+            self.counters["lastJobMs"] = round(elapsed, 2)
+            self.counters["maxJobMs"] = round(max(self.counters["maxJobMs"], elapsed), 2)
+            self.counters["totalJobMs"] += elapsed
+            self.counters["totalWaitMs"] += max(elapsed - workMs, 0.0)
+            self._history.append({
+                "job": str(jobId),
+                "ok": results is not None and stored,
+                "files": len(files),
+                "bytesIn": bytesIn,
+                "bytesOut": bytesOut,
+                "waitMs": round(max(elapsed - workMs, 0.0), 2),
+                "workMs": round(workMs, 2),
+                "finishedAt": time.strftime('%Y-%m-%d %H:%M:%S')
+            })
+
+    def wait(self, timeout=None):
+        """Block until every queued job has finished, returns False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                if self._depth == 0:
+                    return True
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.05)
+
+    def close(self):
+        """Finish the queued jobs and stop the worker threads, registered to run at exit"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+            atexit.unregister(self.close)
+            logger.info("Ingest queue closed")
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self.counters)
+            snapshot["depth"] = self._depth
+            snapshot["recentJobs"] = list(self._history)
+        finished = snapshot["completed"] + snapshot["failures"]
+        snapshot["totalJobMs"] = round(snapshot["totalJobMs"], 2)
+        snapshot["averageJobMs"] = round(snapshot["totalJobMs"] / finished, 2) if finished else 0.0
+        snapshot["averageWaitMs"] = round(snapshot.pop("totalWaitMs") / finished, 2) if finished else 0.0
+        snapshot["workers"] = self.workers
+        snapshot["codec"] = self.codec.name
+        return snapshot
+
+
+if __name__ == '__main__':
+    # Worker entry point, see runWorker: the compressSpooledFiles arguments come in as JSON on stdin
+    # and its result goes back as JSON on stdout
+    json.dump(compressSpooledFiles(*json.load(sys.stdin)), sys.stdout)
@@ -2,7 +2,6 @@ import logging
 from logging.handlers import TimedRotatingFileHandler
 import os
 from datetime import datetime
-from flask import request
 import zipfile
 import glob
 
@@ -37,6 +36,9 @@ class CustomLogHandler(TimedRotatingFileHandler):
             self.doRollover()
         
         try:
+            # Imported here, the ingest workers log without Flask and start faster without importing it
+            from flask import request
+
             if hasattr(record, 'http_request') and request:
                 record.msg = f"{record.msg} - IP: {request.remote_addr}"
                 
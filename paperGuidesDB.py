@@ -9,15 +9,99 @@ import requests
 from datetime import datetime
 from dotenv import load_dotenv
 import hashlib
+import io
+import re
+import tempfile
+import time
 
 from config import *
 
 load_dotenv()
 from logHandler import getCustomLogger
+from dbPool import ConnectionPool
+from blobStore import getBlobStore, LocalBlobStore
+from catalogCache import CatalogCache
+from questionIndex import QuestionIndex
+from ratingQueue import RatingQueue
+from ingestQueue import IngestQueue, compressSpooledFiles
+from fileCodecs import getCodec, getStorageCodec, availableCodecs
 
 logger = getCustomLogger(__name__)
 dbPath = './instance/paper-guides-resources.db'
 
+# Every function below borrows its connection from this pool instead of opening a new one
+pool = ConnectionPool(
+    dbPath,
+    size=int(os.getenv('DB_POOL_SIZE', 5)),
+    timeout=float(os.getenv('DB_POOL_TIMEOUT', 30))
+)
+
+# Storage formats for the questionFile / solutionFile columns, recorded per row in storageVersion
+STORAGE_BASE64 = 1  # zlib output, base64 encoded and saved as TEXT (rows from before the migration)
+STORAGE_BLOB = 2    # zlib output saved as a raw BLOB
+STORAGE_BLOBSTORE = 3  # kept in the blob store, the row only holds questionHash / solutionHash and their codecs
+
+# Exam sessions a paper can belong to, stored in papers.session and shown as the label
+paperSessions = {
+    "specimen": "Specimen",
+    "feb-mar": "Feb / Mar",
+    "may-june": "May / June",
+    "oct-nov": "Oct / Nov"
+}
+
+# Canonical level every A and AS level spelling is stored and looked up as, see normalizeLevel
+LEVEL_A_LEVEL = "a-level"
+
+# Content-addressed store holding the compressed files
+blobStore = getBlobStore()
+
+# Decompressed copies of served files, safe to delete at any time
+fileCachePath = os.getenv('FILE_CACHE_PATH', './instance/file-cache')
+
+# Uploads are hashed and compressed this many bytes at a time, the compressed output is spooled
+# here until its hash is known. Keep it on the blob store's filesystem so storing it is a rename.
+uploadChunkSize = int(os.getenv('UPLOAD_CHUNK_SIZE', 1024 * 1024))
+uploadSpoolPath = os.getenv('UPLOAD_SPOOL_PATH', './instance/uploads')
+
+# Browse listings only change on approve / delete, which invalidate the affected subject here
+# and bump the table's version every other worker checks its entries against
+catalogCache = CatalogCache(
+    maxSize=int(os.getenv('CATALOG_CACHE_SIZE', 1024)),
+    ttl=float(os.getenv('CATALOG_CACHE_TTL', 300)),
+    versionFunction=lambda table: getContentVersion((f'{table}Version',))[0],
+    versionInterval=float(os.getenv('CATALOG_VERSION_INTERVAL', 1))
+)
+
+# Approved question ids grouped for the question generator, reloaded when the content version changes
+questionIndex = QuestionIndex(pool, lambda: getContentVersion()[0])
+
+# Codec new uploads are stored with, files it shrinks by less than STORAGE_MIN_SAVING are kept
+# as they are (most PDFs and images are compressed already), see fileCodecs.py
+storageCodec = getStorageCodec()
+storageMinSaving = float(os.getenv('STORAGE_MIN_SAVING', 0.05))
+
+# Called with the uuid of every paper approvePendingPaper approves, app.py renders its thumbnails
+paperApprovedListeners = []
+
+# Uploads are compressed into the blob store by worker processes, see ingestQueue.py
+ingestQueue = IngestQueue(
+    lambda job, results: finishIngestion(job, results),
+    storageCodec,
+    workers=int(os.getenv('INGEST_WORKERS', 2)),
+    chunkSize=uploadChunkSize,
+    minSaving=storageMinSaving
+)
+
+# Ratings are buffered here and written in batches, see ratingQueue.py
+ratingQueue = RatingQueue(
+    lambda entries: applyRatings(entries),
+    flushInterval=float(os.getenv('RATING_FLUSH_INTERVAL', 2)),
+    maxPending=int(os.getenv('RATING_FLUSH_SIZE', 500))
+)
+
+# Question generator settings, reloaded when configs/generator.json changes
+generatorSettings = ConfigService('./configs/generator.json')
+
 def createDatabase():
     """
     Synchronizes the database schema with the defined schema.
@@ -39,7 +123,24 @@ def createDatabase():
             "submittedFrom": "TEXT",
             "submitDate": "DATE",
             "approvedBy": "TEXT",
-            "approvedOn": "DATE"
+            "approvedOn": "DATE",
+            "storageVersion": f"INTEGER DEFAULT {STORAGE_BASE64}",
+            "questionHash": "TEXT",
+            "solutionHash": "TEXT",
+            "questionSize": "INTEGER",
+            "solutionSize": "INTEGER",
+            # year keeps the display label ("2023 (May / June)"), these hold its parts, see parseYear
+            "yearNumber": "INTEGER",
+            "session": "TEXT",
+            # Canonical level the lookups match on, see normalizeLevel
+            "levelKey": "TEXT",
+            # 'processing' until ingestQueue has stored the files, then 'ready' (or 'failed')
+            "fileState": "TEXT DEFAULT 'ready'",
+            # fileCodecs name each file is stored with, see blobKey
+            "questionCodec": "TEXT DEFAULT 'zlib'",
+            "solutionCodec": "TEXT DEFAULT 'zlib'",
+            # Admin who uploaded the paper, it is approved in their name once fileState is 'ready'
+            "approveWhenReady": "TEXT"
         },
         "questions": {
             "id": "INTEGER PRIMARY KEY",
@@ -62,7 +163,18 @@ def createDatabase():
             "submittedFrom": "TEXT",
             "submitDate": "DATE",
             "approvedBy": "TEXT",
-            "approvedOn": "DATE"
+            "approvedOn": "DATE",
+            "storageVersion": f"INTEGER DEFAULT {STORAGE_BASE64}",
+            "questionHash": "TEXT",
+            "solutionHash": "TEXT",
+            "questionSize": "INTEGER",
+            "solutionSize": "INTEGER",
+            # Bayesian average of the one..five histogram, see ratingScoreSql
+            "ratingScore": "REAL",
+            "levelKey": "TEXT",
+            "fileState": "TEXT DEFAULT 'ready'",
+            "questionCodec": "TEXT DEFAULT 'zlib'",
+            "solutionCodec": "TEXT DEFAULT 'zlib'"
         },
         "topicals": {
             "id": "INTEGER PRIMARY KEY",
@@ -77,18 +189,90 @@ def createDatabase():
             "submittedFrom": "TEXT",
             "submitDate": "DATE",
             "approvedBy": "TEXT",
-            "approvedOn": "DATE"
+            "approvedOn": "DATE",
+            "storageVersion": f"INTEGER DEFAULT {STORAGE_BASE64}",
+            "questionHash": "TEXT",
+            "solutionHash": "TEXT",
+            "questionSize": "INTEGER",
+            "solutionSize": "INTEGER",
+            "levelKey": "TEXT",
+            "fileState": "TEXT DEFAULT 'ready'",
+            "questionCodec": "TEXT DEFAULT 'zlib'",
+            "solutionCodec": "TEXT DEFAULT 'zlib'"
         },
         "ratings": {
             "id": "INTEGER PRIMARY KEY",
             "user_id": "TEXT",
             "question_UUID": "TEXT",
             "rating": "INTEGER"
+        },
+        "meta": {
+            "key": "TEXT PRIMARY KEY",
+            "value": "INTEGER DEFAULT 0",
+            "updatedOn": "DATE"
+        },
+        # Narrow copy of the approved papers / topicals the browse pages list, see syncCatalogEntry
+        "catalog": {
+            "id": "INTEGER PRIMARY KEY",
+            "uuid": "TEXT UNIQUE",
+            "kind": "TEXT",
+            "board": "TEXT",
+            "level": "TEXT",
+            "subject": "TEXT",
+            "yearNumber": "INTEGER",
+            "session": "TEXT",
+            "year": "TEXT",
+            "component": "TEXT",
+            "topic": "TEXT",
+            "levelKey": "TEXT"
+        },
+        # WebP page renders kept in the blob store, see thumbnails.py
+        "thumbnails": {
+            "id": "INTEGER PRIMARY KEY",
+            "contentHash": "TEXT",
+            "page": "INTEGER",
+            "width": "INTEGER",
+            "size": "INTEGER"
+        },
+        # Row counts per (table, board, levelKey, subject, approved) for the stats page, see adjustStatsCounter
+        "stats_counters": {
+            "id": "INTEGER PRIMARY KEY",
+            "tableName": "TEXT",
+            "board": "TEXT",
+            "level": "TEXT",
+            "subject": "TEXT",
+            "approved": "INTEGER",
+            "count": "INTEGER DEFAULT 0"
         }
     }
 
+    # Indexes for the hot lookups, "UNIQUE table (columns)" makes a unique index
+    # Indexes missing here are dropped and changed ones rebuilt, check them with `python dbMigrations.py check-indexes`
+    tableIndexes = {
+        "papers_level_key": "papers (levelKey, subject, approved, year, component)",
+        "papers_subject_year": "papers (subject, year)",
+        "papers_approved": "papers (approved)",
+        "questions_board_subject": "questions (board, subject, approved, level)",
+        "questions_level_key": "questions (levelKey, subject, approved)",
+        "questions_approved": "questions (approved)",
+        "questions_score": "questions (board, subject, levelKey, approved, ratingScore)",
+        "topicals_subject": "topicals (subject, approved)",
+        "topicals_approved": "topicals (approved)",
+        # Content hashes, duplicate uploads are looked up by these (see findDuplicateFile). Not UNIQUE,
+        # rows from before the check and a file shared between a question and a solution can repeat
+        "papers_question_hash": "papers (questionHash)",
+        "papers_solution_hash": "papers (solutionHash)",
+        "questions_question_hash": "questions (questionHash)",
+        "questions_solution_hash": "questions (solutionHash)",
+        "topicals_question_hash": "topicals (questionHash)",
+        "topicals_solution_hash": "topicals (solutionHash)",
+        "ratings_user_question": "UNIQUE ratings (user_id, question_UUID)",
+        "catalog_level_key": "catalog (kind, levelKey, subject, yearNumber)",
+        "thumbnails_page": "UNIQUE thumbnails (contentHash, page, width)",
+        "stats_counters_key": "UNIQUE stats_counters (tableName, board, level, subject, approved)"
+    }
+
     lockFile = "/tmp/db_lock"
-    connection = None
 
     try:
         # Ensure directory exists
@@ -98,40 +282,87 @@ def createDatabase():
         with open(lockFile, "w"):
             pass
 
-        # Connect to database
-        connection = sqlite3.connect(dbPath)
-        db = connection.cursor()
-
-        # Fetch existing tables
-        db.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'")
-        existingTables = [table[0] for table in db.fetchall()]
-
-        # Drop tables not in schema
-        for table in existingTables:
-            if table not in tableSchemas:
-                db.execute(f"DROP TABLE {table}")
-                logger.info(f"Dropped table: {table}")
-
-        # Sync each table in schema
-        for tableName, schema in tableSchemas.items():
-            db.execute(f"PRAGMA table_info({tableName})")
-            existingColumns = {col[1]: col[2] for col in db.fetchall()}
-
-            if not existingColumns:
-                # Create table if it doesn't exist
-                columnDefinitions = ", ".join(f"{colName} {colType}" for colName, colType in schema.items())
-                db.execute(f"CREATE TABLE {tableName} ({columnDefinitions})")
-                logger.info(f"Created table: {tableName}")
-            else:
-                # Add missing columns
-                for colName, colType in schema.items():
-                    if colName not in existingColumns:
-                        db.execute(f"ALTER TABLE {tableName} ADD COLUMN {colName} {colType}")
-                        logger.info(f"Added column {colName} to {tableName}")
-
-        # Commit changes
-        connection.commit()
-        logger.info("Database schema synchronization completed successfully.")
+        with pool.connection() as connection:
+            db = connection.cursor()
+            catalogChanged = False
+            levelKeysAdded = False
+
+            # Fetch existing tables
+            db.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'")
+            existingTables = [table[0] for table in db.fetchall()]
+
+            # Drop tables not in schema
+            for table in existingTables:
+                if table not in tableSchemas:
+                    db.execute(f"DROP TABLE {table}")
+                    logger.info(f"Dropped table: {table}")
+
+            # Sync each table in schema
+            for tableName, schema in tableSchemas.items():
+                db.execute(f"PRAGMA table_info({tableName})")
+                existingColumns = {col[1]: col[2] for col in db.fetchall()}
+
+                # The catalog only holds copies, columns it no longer has go by recreating (and refilling) it
+                if tableName == "catalog" and set(existingColumns) - set(schema):
+                    db.execute("DROP TABLE catalog")
+                    logger.info("Dropped the catalog to remove the columns it no longer has")
+                    existingColumns = {}
+                    catalogChanged = True
+
+                if not existingColumns:
+                    # Create table if it doesn't exist
+                    columnDefinitions = ", ".join(f"{colName} {colType}" for colName, colType in schema.items())
+                    db.execute(f"CREATE TABLE {tableName} ({columnDefinitions})")
+                    logger.info(f"Created table: {tableName}")
+                else:
+                    # Add missing columns
+                    for colName, colType in schema.items():
+                        if colName not in existingColumns:
+                            db.execute(f"ALTER TABLE {tableName} ADD COLUMN {colName} {colType}")
+                            logger.info(f"Added column {colName} to {tableName}")
+                            if tableName == "catalog":
+                                catalogChanged = True
+                            if colName == "levelKey" and tableName in statsCounterTables:
+                                fillLevelKeys(connection, tableName)
+                                levelKeysAdded = True
+                            if tableName == "questions" and colName == "ratingScore":
+                                db.execute(f"UPDATE questions SET ratingScore = {ratingScoreSql}")
+                                logger.info("Filled in the rating scores")
+
+            # Sync indexes, autoindexes (UNIQUE / PRIMARY KEY) have no sql and are left alone
+            db.execute("SELECT name, sql FROM sqlite_master WHERE type='index' AND sql IS NOT NULL")
+            existingIndexes = dict(db.fetchall())
+
+            # Older databases can hold several ratings per user and question, the unique index needs them gone
+            if not (existingIndexes.get("ratings_user_question") or "").startswith("CREATE UNIQUE"):
+                dedupeRatings(connection)
+
+            for indexName, definition in tableIndexes.items():
+                unique = definition.startswith("UNIQUE ")
+                indexSql = f"CREATE {'UNIQUE ' if unique else ''}INDEX {indexName} ON {definition.removeprefix('UNIQUE ')}"
+
+                if existingIndexes.get(indexName) == indexSql:
+                    continue
+                if indexName in existingIndexes:
+                    db.execute(f"DROP INDEX {indexName}")
+                    logger.info(f"Dropped changed index: {indexName}")
+                db.execute(indexSql)
+                logger.info(f"Created index: {indexName}")
+
+            for indexName in existingIndexes:
+                if indexName not in tableIndexes:
+                    db.execute(f"DROP INDEX IF EXISTS {indexName}")
+                    logger.info(f"Dropped index: {indexName}")
+
+            # A new or changed catalog table needs filling from the already approved rows
+            if "catalog" not in existingTables or catalogChanged:
+                rebuildCatalog()
+            if "stats_counters" not in existingTables or levelKeysAdded:
+                rebuildStatsCounters()
+
+            # Commit changes
+            connection.commit()
+            logger.info("Database schema synchronization completed successfully.")
 
     except sqlite3.Error as e:
         logger.error(f"SQLite error: {e}")
@@ -141,477 +372,563 @@ def createDatabase():
         # Clean up
         if os.path.exists(lockFile):
             os.remove(lockFile)
-        if connection:
-            connection.close()
 
 
 def insertQuestion(board, subject, topic, difficulty, level, component, questionFile, solutionFile, user, ip):
+    spooled = []
     try:
         uuidStr = str(uuid.uuid4())
-        connection = sqlite3.connect(dbPath)
-
-        db = connection.cursor()
-
-        # Compress the questionFile and solutionFile
-        compressedQuestionFile = zlib.compress(questionFile, level=9)
-        compressedSolutionFile = zlib.compress(solutionFile, level=9)
-
-        # Encode the compressed data in base64
-        encodedQuestionFile = base64.b64encode(compressedQuestionFile).decode('utf-8')
-        encodedSolutionFile = base64.b64encode(compressedSolutionFile).decode('utf-8')
-
-        db.execute('''INSERT INTO questions
-            (uuid, subject, topic, difficulty, board, level, component, questionFile, solutionFile, submittedBy, submittedFrom, submitDate)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-            (uuidStr, subject, topic, difficulty, board, level, component, encodedQuestionFile, encodedSolutionFile, user, ip, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
-        connection.commit()
-        connection.close()
-        logger.info(f"Question inserted successfully. UUID: {uuidStr}")
-        return True
-    except sqlite3.Error as e:
+        with pool.connection() as connection:
+
+            db = connection.cursor()
+
+            # Hash the questionFile and solutionFile, ingestQueue compresses them into the blob store
+            ((questionHash, questionSize, questionCodec), (solutionHash, solutionSize, solutionCodec)), spooled = spoolUploads(questionFile, solutionFile)
+
+            duplicate = findDuplicateFile('questions', questionHash)
+            if duplicate:
+                discardSpooled(spooled)
+                logger.warning(f"Question not stored, its file was already submitted as {duplicate['uuid']}")
+                return False, duplicate
+
+            db.execute('''INSERT INTO questions
+                (uuid, subject, topic, difficulty, board, level, levelKey, component, questionHash, solutionHash, questionSize, solutionSize, submittedBy, submittedFrom, submitDate, storageVersion, fileState, questionCodec, solutionCodec)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                (uuidStr, subject, topic, difficulty, board, level, normalizeLevel(level, board), component, questionHash, solutionHash, questionSize, solutionSize, user, ip, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), STORAGE_BLOBSTORE,
+                 'processing' if spooled else 'ready', questionCodec, solutionCodec))
+            db.execute(f'UPDATE questions SET ratingScore = {ratingScoreSql} WHERE uuid = ?', (uuidStr,))
+            adjustStatsCounter(connection, 'questions', uuidStr, 1)
+            bumpContentVersion(connection, 'submissionVersion')
+            connection.commit()
+            ingestQueue.submit(f'questions/{uuidStr}', spooled)
+            logger.info(f"Question inserted successfully. UUID: {uuidStr}")
+            return True, uuidStr
+    except (sqlite3.Error, OSError) as e:
+        # OSError is the spool, e.g. a full disk. The row was rolled back, its files go too
         logger.error(f"Error inserting question into database: {e}")
-        return False
+        discardSpooled(spooled)
+        return False, None
 
 def insertPaper(board: str, subject: str, year: str, level: str,
-                component: str, questionFile: bytes, solutionFile: bytes, user, ip) -> bool:
+                component: str, questionFile, solutionFile, user, ip, session: str = None, approveBy: str = None) -> tuple:
     """
     Insert a paper into the database with proper compression and encoding.
 
     Args:
         board: Exam board
         subject: Subject name
-        year: Year of paper
+        year: Year of paper, either the plain year or an already formatted label
+        session: Exam session key from paperSessions, if the paper belongs to one
         level: Education level
         component: Paper component
-        questionFile: Raw bytes of the question paper PDF
-        solutionFile: Raw bytes of the solution paper PDF
+        questionFile: Question paper PDF, raw bytes or a readable file object (streamed, see spoolUploads)
+        solutionFile: Solution paper PDF, raw bytes or a readable file object
+        approveBy: Username to approve the paper as once its files are stored, see approvePendingPaper
 
     Returns:
-        bool: True if insertion was successful, False otherwise
+        tuple: (True, UUID) if insertion was successful, (False, the findDuplicateFile match) when the
+               question paper was already submitted, (False, None) otherwise
     """
+    spooled = []
     try:
         uuidStr = str(uuid.uuid4())
-        connection = sqlite3.connect(dbPath)
-
-        # Compress the files
-        questionFile_compressed = zlib.compress(questionFile, level=9)
-        solutionFile_compressed = zlib.compress(solutionFile, level=9)
-
-        # Convert compressed binary to base64 for storage
-        questionFile_b64 = base64.b64encode(questionFile_compressed).decode('utf-8')
-        solutionFile_b64 = base64.b64encode(solutionFile_compressed).decode('utf-8')
-
-        db = connection.cursor()
-        db.execute('''INSERT INTO papers
-            (uuid, subject, year, board, level, component, questionFile, solutionFile, submittedBy, submittedFrom, submitDate)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-            (uuidStr, subject, year, board, level, component,
-             questionFile_b64, solutionFile_b64, user, ip, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
-        connection.commit()
-        connection.close()
-        logger.info(f"Paper inserted successfully. UUID: {uuidStr}")
-        return True, uuidStr
+        with pool.connection() as connection:
+
+            # Hash the files, ingestQueue compresses them into the blob store, the row only keeps their hashes
+            stored, spooled = spoolUploads(questionFile, solutionFile)
+
+            duplicate = findDuplicateFile('papers', stored[0][0])
+            if duplicate:
+                discardSpooled(spooled)
+                logger.warning(f"Paper not stored, its question paper was already submitted as {duplicate['uuid']}")
+                return False, duplicate
+
+            insertPaperRow(connection, uuidStr, board, subject, year, session, level, component, stored, spooled, user, ip, approveBy)
+            bumpContentVersion(connection, 'submissionVersion')
+            connection.commit()
+            ingestQueue.submit(f'papers/{uuidStr}', spooled)
+            logger.info(f"Paper inserted successfully. UUID: {uuidStr}")
+            if approveBy and not spooled:
+                # Nothing to compress, the row is ready already
+                approvePendingPaper(uuidStr)
+            return True, uuidStr
     except Exception as e:
         logger.error(f"Error inserting paper into database: {e}")
-        return False
+        discardSpooled(spooled)
+        return False, None
 
-def insertTopical(board, subject, topic ,questionFile, solutionFile, user, ip):
+def insertPapers(papers, user, ip):
+    """
+    Insert a batch of already spooled papers in one transaction, for bulk imports.
+
+    Args:
+        papers: dicts with board, subject, year, session, level, component and the spoolUploads
+                result of their question / solution files under stored and spooled
+
+    Returns:
+        list: UUIDs in the order of papers, or None if the batch was rolled back
+    """
+    uuids = [str(uuid.uuid4()) for _ in papers]
     try:
-        uuidStr = str(uuid.uuid4())
-        connection = sqlite3.connect(dbPath)
+        with pool.connection() as connection:
+            for uuidStr, paper in zip(uuids, papers):
+                insertPaperRow(connection, uuidStr, paper["board"], paper["subject"], paper["year"], paper.get("session"),
+                               paper["level"], paper["component"], paper["stored"], paper["spooled"], user, ip)
+            bumpContentVersion(connection, 'submissionVersion')
+            connection.commit()
+    except (sqlite3.Error, OSError) as e:
+        logger.error(f"Error inserting a batch of {len(papers)} papers: {e}")
+        for paper in papers:
+            discardSpooled(paper["spooled"])
+        return None
 
+    for uuidStr, paper in zip(uuids, papers):
+        ingestQueue.submit(f'papers/{uuidStr}', paper["spooled"])
+    logger.info(f"Inserted a batch of {len(papers)} papers")
+    return uuids
 
-        questionFile = zlib.compress(questionFile, level=9)
-        solutionFile = zlib.compress(solutionFile, level=9)
+def insertPaperRow(connection, uuidStr, board, subject, year, session, level, component, stored, spooled, user, ip, approveBy=None):
+    # The INSERT behind insertPaper and insertPapers, the caller commits and queues the spooled files
+    ((questionHash, questionSize, questionCodec), (solutionHash, solutionSize, solutionCodec)) = stored
 
-        questionFile = base64.b64encode(questionFile).decode('utf-8')
-        solutionFile = base64.b64encode(solutionFile).decode('utf-8')
+    yearNumber, parsedSession = parseYear(year)
+    session = session if session in paperSessions else parsedSession
 
-        db = connection.cursor()
-        db.execute('''INSERT INTO topicals
-            (uuid, subject, board, topic ,questionFile, solutionFile, submittedBy, submittedFrom, submitDate)
-            VALUES (?, ?, ?, ?, ? , ?, ?, ?, ?)''',
-            (uuidStr, subject, board, topic,questionFile, solutionFile, user, ip, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
-        connection.commit()
-        connection.close()
-        logger.info(f"Topical paper inserted successfully. UUID: {uuidStr}")
-        return True, uuidStr
-    except sqlite3.Error as e:
+    connection.execute('''INSERT INTO papers
+        (uuid, subject, year, yearNumber, session, board, level, levelKey, component, questionHash, solutionHash, questionSize, solutionSize, submittedBy, submittedFrom, submitDate, storageVersion, fileState, questionCodec, solutionCodec, approveWhenReady)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+        (uuidStr, subject, formatYear(yearNumber, session) if yearNumber else year, yearNumber, session, board, level, normalizeLevel(level, board), component,
+         questionHash, solutionHash, questionSize, solutionSize, user, ip, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), STORAGE_BLOBSTORE,
+         'processing' if spooled else 'ready', questionCodec, solutionCodec, approveBy))
+    adjustStatsCounter(connection, 'papers', uuidStr, 1)
+
+def insertTopical(board, subject, topic ,questionFile, solutionFile, user, ip):
+    spooled = []
+    try:
+        uuidStr = str(uuid.uuid4())
+        with pool.connection() as connection:
+
+
+            ((questionHash, questionSize, questionCodec), (solutionHash, solutionSize, solutionCodec)), spooled = spoolUploads(questionFile, solutionFile)
+
+            duplicate = findDuplicateFile('topicals', questionHash)
+            if duplicate:
+                discardSpooled(spooled)
+                logger.warning(f"Topical not stored, its question paper was already submitted as {duplicate['uuid']}")
+                return False, duplicate
+
+            db = connection.cursor()
+            db.execute('''INSERT INTO topicals
+                (uuid, subject, board, levelKey, topic, questionHash, solutionHash, questionSize, solutionSize, submittedBy, submittedFrom, submitDate, storageVersion, fileState, questionCodec, solutionCodec)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                (uuidStr, subject, board, normalizeLevel(None, board), topic, questionHash, solutionHash, questionSize, solutionSize, user, ip, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), STORAGE_BLOBSTORE,
+                 'processing' if spooled else 'ready', questionCodec, solutionCodec))
+            adjustStatsCounter(connection, 'topicals', uuidStr, 1)
+            bumpContentVersion(connection, 'submissionVersion')
+            connection.commit()
+            ingestQueue.submit(f'topicals/{uuidStr}', spooled)
+            logger.info(f"Topical paper inserted successfully. UUID: {uuidStr}")
+            return True, uuidStr
+    except (sqlite3.Error, OSError) as e:
         logger.error(f"Error inserting topical paper into database: {e}")
-        return False
+        discardSpooled(spooled)
+        return False, None
 
+@catalogCache.memoize(lambda level, subjectName: ('papers', normalizeLevel(level), subjectName, None))
 def getYears(level , subjectName):
     try:
         total_years = []
         # Connect to the database
-        connection = sqlite3.connect(dbPath)
-        db = connection.cursor()
-
-        # Execute the query and fetch all results
-
-        if level == "A level" or level == "AS level" or level == "A Level" or level == "AS Level":
-            query = 'SELECT substr(year, 1, 4) FROM papers WHERE board = ? AND subject = ? AND approved = 1'
-            rows = db.execute(query, ( "A Levels",subjectName,)).fetchall()
-        else:
-            query = 'SELECT substr(year, 1, 4) FROM papers WHERE level = ? AND subject = ? AND approved = 1'
-            rows = db.execute(query, (level, subjectName)).fetchall()
+        with pool.connection() as connection:
+            db = connection.cursor()
 
+            # Execute the query and fetch all results
+            query = "SELECT DISTINCT yearNumber FROM catalog WHERE kind = 'paper' AND levelKey = ? AND subject = ? ORDER BY yearNumber DESC"
+            rows = db.execute(query, (normalizeLevel(level), subjectName)).fetchall()
 
-        # Extract the years from the query result
-        years = list(set([row[0] for row in rows]))
+            # Extract the years from the query result, already unique and newest first
+            years = [row[0] for row in rows if row[0] is not None]
 
-        if years == []:
-            logger.warning(f"No years found for level {level} and subject {subjectName}")
-            return False
-        else:
-            years.sort(reverse=True)
-        logger.info(f"Years retrieved successfully for level {level} and subject {subjectName}")
-        return years
+            if years == []:
+                logger.warning(f"No years found for level {level} and subject {subjectName}")
+                return False
+            logger.info(f"Years retrieved successfully for level {level} and subject {subjectName}")
+            return years
     except sqlite3.Error as e:
         logger.error(f"An error occurred while getting years: {e}")
         return None
-    finally:
-        # Close the connection
-        connection.close()
 
 
+@catalogCache.memoize(lambda level, subject_name, year: ('papers', normalizeLevel(level), subject_name, year))
 def getQuestions(level, subject_name, year):
     try:
+        yearNumber, _ = parseYear(year)
+
         # Connect to the database
-        connection = sqlite3.connect(dbPath)
-        db = connection.cursor()
-        
-        if level == "A level" or level == "AS level":
+        with pool.connection() as connection:
+            db = connection.cursor()
+
+            # Match on the numeric year, but retrieve the full year label
             query = '''
-                SELECT component, year 
-                FROM papers 
-                WHERE board = ? 
-                AND subject = ? 
-                AND substr(year, 1, 4) = ? 
-                AND approved = 1
+                SELECT component, year
+                FROM catalog
+                WHERE kind = 'paper'
+                AND levelKey = ?
+                AND subject = ?
+                AND yearNumber = ?
                 ORDER BY component ASC
             '''
-            rows = db.execute(query, ( "A Levels" ,subject_name,str(year))).fetchall()
-        else:
-            query = '''
-                SELECT component, year 
-                FROM papers 
-                WHERE level = ? 
-                AND subject = ? 
-                AND substr(year, 1, 4) = ? 
-                AND approved = 1
-            '''
-            # Get rows where the first 4 characters match, but retrieve the full year string
-            rows = db.execute(query, (level, subject_name, str(year))).fetchall()
+            rows = db.execute(query, (normalizeLevel(level), subject_name, yearNumber)).fetchall()
         
-        components = [row[0] for row in rows]
-        full_years = [row[1] for row in rows]  # Get the full year strings from database
-        question_name = []
+            components = [row[0] for row in rows]
+            full_years = [row[1] for row in rows]  # Get the full year strings from database
+            question_name = []
         
-        for component, full_year in zip(components, full_years):
-            question_name.append(f'{subject_name}, {component}, Year: {full_year} question paper')
+            for component, full_year in zip(components, full_years):
+                question_name.append(f'{subject_name}, {component}, Year: {full_year} question paper')
             
-        logger.info(f"Questions retrieved successfully for level {level}, subject {subject_name}, year {year}")
-        return question_name
+            logger.info(f"Questions retrieved successfully for level {level}, subject {subject_name}, year {year}")
+            return question_name
         
     except sqlite3.Error as e:
         logger.error(f"An error occurred while getting questions: {e}")
         return None
         
-    finally:
-        # Close the connection
-        connection.close()
 
 
+@catalogCache.memoize(lambda subject, level: ('questions' if normalizeLevel(level) == LEVEL_A_LEVEL else 'papers', normalizeLevel(level), subject, None))
 def countQuestions(subject, level):
     try:
         # Connect to the database
-        connection = sqlite3.connect(dbPath)
-        db = connection.cursor()
-        
-        if level == "A level" or level == "AS level":
-            query = '''
-                SELECT COUNT (*) 
-                FROM questions 
-                WHERE board = ? 
-                AND subject = ? 
-                AND approved = 1
-            '''
-            result = db.execute(query, ("A Levels", subject)).fetchone()
-            return result[0] if result else 0  # Return count or 0 if no result
-        else:
-            query = '''
+        with pool.connection() as connection:
+            db = connection.cursor()
+
+            # A levels count generator questions, the other boards their papers
+            levelKey = normalizeLevel(level)
+            table = 'questions' if levelKey == LEVEL_A_LEVEL else 'papers'
+            result = db.execute(f'''
                 SELECT COUNT (*)
-                FROM papers 
-                WHERE level = ? 
-                AND subject = ? 
+                FROM {table}
+                WHERE levelKey = ?
+                AND subject = ?
                 AND approved = 1
-            '''
-            result = db.execute(query, (level, subject)).fetchone()
+            ''', (levelKey, subject)).fetchone()
             return result[0] if result else 0  # Return count or 0 if no result
     except sqlite3.Error as e:
         logger.error(f"An error occurred while getting questions: {e}")
         return None
         
-    finally:
-        # Close the connection
-        connection.close()
 
+@catalogCache.memoize(lambda level, subject_name: ('topicals', normalizeLevel(level), subject_name, None))
 def getTopicalFiles(level, subject_name):
     try:
-        connection = sqlite3.connect(dbPath)
-        db = connection.cursor()
+        with pool.connection() as connection:
+            db = connection.cursor()
 
-        if level == 'A level' or level == 'AS level':
-            query = '''
-            SELECT uuid, topic
-            FROM topicals
-            WHERE subject = ?
-            AND approved = 1
-            '''
-            result = db.execute(query, (subject_name,)).fetchall()
-        else:
             query = '''
             SELECT uuid, topic
-            FROM topicals
-            WHERE level = ?
+            FROM catalog
+            WHERE kind = 'topical'
+            AND levelKey = ?
             AND subject = ?
-            AND approved = 1
             '''
-            result = db.execute(query, (level, subject_name)).fetchall()
-        # Check if results exist
-        if not result:
-            logger.warning(f"No topical data found for level {level}, subject {subject_name}")
-            return None
+            result = db.execute(query, (normalizeLevel(level), subject_name)).fetchall()
+            # Check if results exist
+            if not result:
+                logger.warning(f"No topical data found for level {level}, subject {subject_name}")
+                return None
         
-        return result
+            return result
     
     except sqlite3.Error as e:
         logger.error(f"An error occurred while rendering question: {e}")
         return None
-    finally:
-        connection.close()
                
 
 def renderQuestion(level, subject_name, year, component):
+    """
+    Find the approved paper behind a paper page.
+
+    The page links to /files/<uuid>/... and the thumbnails, so only the uuid and hashes are read.
+
+    Returns:
+        tuple: (uuid, questionHash, solutionHash), None when there is no such paper or on error
+    """
     try:
         # Connect to the database
-        connection = sqlite3.connect(dbPath)
-        db = connection.cursor()
+        with pool.connection() as connection:
+            db = connection.cursor()
         
-        # Single query to fetch both questionFile and uuid
-        if level == 'A level' or level == 'AS level':
-            query = '''
-            SELECT questionFile, solutionFile, uuid
-            FROM papers
-            WHERE board = ?
-            AND subject = ?
-            AND year = ?
-            AND component = ?
-            AND approved = 1
-            '''
-            result = db.execute(query, ( "A Levels" ,subject_name, year, component)).fetchall()
-        else:
             query = '''
-            SELECT questionFile, solutionFile ,uuid
+            SELECT uuid, questionHash, solutionHash
             FROM papers
-            WHERE level = ?
+            WHERE levelKey = ?
             AND subject = ?
             AND year = ?
             AND component = ?
             AND approved = 1
             '''
-            result = db.execute(query, (level, subject_name, year, component)).fetchall()
+            result = db.execute(query, (normalizeLevel(level), subject_name, year, component)).fetchall()
         
-        # Check if results exist
-        if not result:
-            logger.warning(f"No data found for level {level}, subject {subject_name}, year {year}, component {component}")
-            return None
+            # Check if results exist
+            if not result:
+                logger.warning(f"No data found for level {level}, subject {subject_name}, year {year}, component {component}")
+                return None
         
-        logger.info(f"Question rendered successfully for level {level}, subject {subject_name}, year {year}, component {component}")
-        return result[0]
+            logger.info(f"Question rendered successfully for level {level}, subject {subject_name}, year {year}, component {component}")
+            return result[0]
     
     except sqlite3.Error as e:
         logger.error(f"An error occurred while rendering question: {e}")
         return None
-    finally:
-        connection.close()
 
 
 def renderTopcial(uuid):
+    """Return (uuid, topic, questionHash, solutionHash) of a topical page, None if there is no such topical"""
     try:
-        connection = sqlite3.connect(dbPath)
-        db = connection.cursor()
+        with pool.connection() as connection:
+            db = connection.cursor()
 
-        return db.execute("""
-                    SELECT questionFile, solutionFile, uuid, topic
-                    FROM topicals WHERE uuid = ? 
-                """, (uuid,)).fetchone()
+            return db.execute("""
+                        SELECT uuid, topic, questionHash, solutionHash
+                        FROM topicals WHERE uuid = ? 
+                    """, (uuid,)).fetchone()
     except sqlite3.Error as e:
         logger.error(f'Error while retriving topcial with uuid {uuid}: {e}')
         return False
-    finally:
-        connection.close()
+# Histogram column per rating value, the questions table keeps one counter per star
+ratingColumns = {1: "one", 2: "two", 3: "three", 4: "four", 5: "five"}
+
+# Moves one vote between the histogram counters, parameters are (new rating, previous rating or None) per column
+ratingHistogramUpdate = "UPDATE questions SET " + ", ".join(
+    f"{column} = {column} + (? = {value}) - (? IS {value})" for value, column in ratingColumns.items()
+) + " WHERE uuid = ?"
+
+# The rating score starts out as ratingPriorWeight votes for the admin set difficulty (or the middle
+# when there is none), each real vote then pulls it towards the raters' average. Reading the five
+# counters of one row keeps the update O(1) per rating.
+ratingPriorWeight = float(os.getenv('RATING_PRIOR_WEIGHT', 5))
+ratingScoreSql = (
+    f"(({ratingPriorWeight} * COALESCE(CASE WHEN difficulty BETWEEN 1 AND 5 THEN difficulty END, 3)"
+    f" + one + 2 * two + 3 * three + 4 * four + 5 * five)"
+    f" / ({ratingPriorWeight} + one + two + three + four + five))"
+)
+
+
 def giveRating(user_id, question_UUID, rating):
-    try:
-        connection = sqlite3.connect(dbPath)
-        db = connection.cursor()
+    """Rate one question, see applyRatings"""
+    return applyRatings([(user_id, question_UUID, rating)]) == 1
 
-        # Check if the user has already rated this question
-        previousRating = db.execute('SELECT rating FROM ratings WHERE user_id = ? AND question_UUID = ?', (user_id, question_UUID)).fetchall()
 
-        if previousRating:
-            previousRatingValue = previousRating[0][0]  # Extract the rating value
+def giveRatings(user_id, ratings):
+    """Save a user's (question_UUID, rating) pairs, see applyRatings"""
+    return applyRatings([(user_id, question_UUID, rating) for question_UUID, rating in ratings])
 
-            previousRatingStr = convertRatingToString(previousRatingValue)
 
-            # Update the rating for the user and question
-            db.execute('UPDATE ratings SET rating = ? WHERE user_id = ? AND question_UUID = ?', (rating, user_id, question_UUID))
-            # Decrease the previous rating count for the given question (assuming it's another table)
-            db.execute(f'UPDATE questions SET {previousRatingStr} = {previousRatingStr} - 1 WHERE uuid = ?', (question_UUID,))
-        else:
-            # Insert new rating for the user and question
-            db.execute('INSERT INTO ratings (user_id, question_UUID, rating) VALUES (?, ?, ?)', (user_id, question_UUID, rating))
+def applyRatings(entries):
+    """
+    Save ratings of any number of users in one transaction.
+
+    Each rating is an upsert on the unique (user_id, question_UUID) index and the question's
+    histogram moves from the previous rating to the new one in the same transaction, so
+    concurrent raters can't double count. Ratings outside 1 - 5 or of unknown questions are skipped.
+    Called inside an open transaction the ratings join it and are committed or rolled back with it.
 
-        # Increase the new rating count for the given question
-        newRatingStr = convertRatingToString(rating)
-        db.execute(f'UPDATE questions SET {newRatingStr} = {newRatingStr} + 1 WHERE uuid = ?', (question_UUID,))
+    Args:
+        entries: (user_id, question_UUID, rating) triples, the last one wins when a user repeats a question
 
+    Returns:
+        int: Number of ratings saved, None on a database error
+    """
+    latest = {}
+    for user_id, question_UUID, rating in entries:
+        if rating in ratingColumns:
+            latest[(user_id, str(question_UUID))] = rating
+    if not latest:
+        return 0
 
-        # Commit the changes to the database
-        connection.commit()
-        logger.info(f"Rating {rating} given by user {user_id} for question {question_UUID}")
-        return True
+    try:
+        with pool.connection() as connection:
+            db = connection.cursor()
+            # Take the write lock up front so the previous ratings read below can't change under us.
+            # Inside the caller's transaction a savepoint keeps a failed batch from leaving half its writes.
+            nested = connection.in_transaction
+            db.execute('SAVEPOINT applyRatings' if nested else 'BEGIN IMMEDIATE')
+            try:
+                saved, changed = writeRatings(db, latest)
+            except sqlite3.Error:
+                if nested:
+                    db.execute('ROLLBACK TO applyRatings')
+                    db.execute('RELEASE applyRatings')
+                raise
+
+            if nested:
+                db.execute('RELEASE applyRatings')
+            else:
+                connection.commit()
+            logger.info(f"{saved} ratings saved, {changed} changed")
+            return saved
 
     except sqlite3.Error as e:
         logger.error(f'DB error while updating/inserting rating: {e}')
-        return False
-    finally:
-        connection.close()
+        return None
+
+
+def writeRatings(db, latest):
+    # The upserts and histogram moves of applyRatings, returns (ratings saved, ratings changed)
+    known = {}
+    changes = []
+    for (user_id, question_UUID), rating in latest.items():
+        if question_UUID not in known:
+            known[question_UUID] = db.execute('SELECT 1 FROM questions WHERE uuid = ?', (question_UUID,)).fetchone() is not None
+        if not known[question_UUID]:
+            continue
+
+        previous = db.execute(
+            'SELECT rating FROM ratings WHERE user_id = ? AND question_UUID = ?', (user_id, question_UUID)
+        ).fetchone()
+        previousRating = previous[0] if previous else None
+        if previousRating != rating:
+            changes.append((user_id, question_UUID, rating, previousRating))
+
+    db.executemany('''
+        INSERT INTO ratings (user_id, question_UUID, rating) VALUES (?, ?, ?)
+        ON CONFLICT (user_id, question_UUID) DO UPDATE SET rating = excluded.rating
+    ''', [(user_id, question_UUID, rating) for user_id, question_UUID, rating, _ in changes])
+    db.executemany(ratingHistogramUpdate, [
+        (*[value for _ in ratingColumns for value in (rating, previousRating)], question_UUID)
+        for _, question_UUID, rating, previousRating in changes
+    ])
+    db.executemany(
+        f'UPDATE questions SET ratingScore = {ratingScoreSql} WHERE uuid = ?',
+        [(question_UUID,) for question_UUID in {change[1] for change in changes}]
+    )
+
+    return len([key for key in latest if known[key[1]]]), len(changes)
+
+
+def dedupeRatings(connection):
+    """
+    Keep only the newest rating per user and question and recount the histograms from what is left.
+
+    Returns:
+        int: Number of duplicate ratings removed
+    """
+    removed = connection.execute('''
+        DELETE FROM ratings WHERE id NOT IN (
+            SELECT MAX(id) FROM ratings GROUP BY user_id, question_UUID
+        )
+    ''').rowcount
+
+    if removed:
+        counts = ", ".join(
+            f"{column} = (SELECT COUNT(*) FROM ratings WHERE question_UUID = questions.uuid AND rating = {value})"
+            for value, column in ratingColumns.items()
+        )
+        connection.execute(f"UPDATE questions SET {counts}")
+        connection.execute(f"UPDATE questions SET ratingScore = {ratingScoreSql}")
+        logger.info(f"Removed {removed} duplicate ratings and recounted the histograms")
+    return removed
 
 
 def getComponents(year, subjectName):
     try:
         # Connect to the database
-        connection = sqlite3.connect(dbPath)
-        db = connection.cursor()
+        with pool.connection() as connection:
+            db = connection.cursor()
 
-        # Convert year to string if necessary
-        year = str(year)
+            # Convert year to string if necessary
+            year = str(year)
 
-        # Execute the query and fetch all results
-        rows = db.execute('SELECT component FROM papers WHERE subject = ? AND year = ?', (subjectName, year)).fetchall()
+            # Execute the query and fetch all results
+            rows = db.execute('SELECT component FROM papers WHERE subject = ? AND year = ?', (subjectName, year)).fetchall()
 
 
-        # Extract the components from the query result
-        components = [row[0] for row in rows]
+            # Extract the components from the query result
+            components = [row[0] for row in rows]
 
 
-        logger.info(f"Components retrieved successfully for subject {subjectName} and year {year}")
-        return components
+            logger.info(f"Components retrieved successfully for subject {subjectName} and year {year}")
+            return components
     except sqlite3.Error as e:
         logger.error(f"An error occurred while getting components: {e}")
         return None
-    finally:
-        # Close the connection
-        connection.close()
 
 
-def getQuestionsForGen(board, subject, level, topics, components, difficulties):
+def getQuestionsForGen(board, subject, level, topics, components, difficulties, seed=None,
+                       mode='random', topicQuotas=None, difficultyQuotas=None,
+                       minScore=None, maxScore=None, order='random'):
     """
     Get questions based on selected criteria from the questions table.
     
     Args:
         board (str): Board name (e.g., "Board1")
         subject (str): Subject name
-        level (int): Education level
+        level (str): Education level label, any spelling normalizeLevel accepts
         topics (str|list): 'ALL' or list of specific topics
         components (str|list): 'ALL' or list of specific components
         difficulties (str|list): 'ALL' or list of difficulty levels
+        seed (int): Optional seed, the same seed and filters give back the same questions
+        mode (str): 'random' for a plain random pick, 'balanced' to spread the questions over topics and difficulties
+        topicQuotas (dict): Balanced mode only, questions wanted per topic (the rest is split evenly)
+        difficultyQuotas (dict): Balanced mode only, questions wanted per difficulty
+        minScore (float): Only questions whose rating score is at least this
+        maxScore (float): Only questions whose rating score is at most this
+        order (str): 'random' keeps the sampled order, 'score' goes from the easiest to the hardest question
         
     Returns:
-        list: List of question rows matching the criteria
+        list: Sampled (id, uuid, subject, topic, difficulty, board, level, component, ratingScore) rows, the
+              images themselves are loaded by the page from /files/<uuid>/..., empty if nothing matched or on error
     """
-    connection = None
     try:
-        # Connect to the database
-        connection = sqlite3.connect(dbPath)
-        db = connection.cursor()
-
-        # Base query parts
-        query = """
-            SELECT *
-            FROM questions
-            WHERE
-            board = ?
-            AND subject = ?
-            AND level = ?
-            AND approved = True
-        """
-        params = [board, subject, level]
-
-        # Helper function to build conditions
-        def add_condition(field_name, values):
-            if values != 'ALL':
-                condition = " OR ".join([f"{field_name} = ?" for _ in values])
-                return f" AND ({condition})", values
-            return "", []
-
-        # Add difficulty condition
-        if difficulties != 'ALL':
-            diff_condition, diff_params = add_condition("difficulty", difficulties)
-            query += diff_condition
-            params.extend(diff_params)
-
-        # Add topic condition
-        if topics != 'ALL':
-            topic_condition, topic_params = add_condition("topic", topics)
-            query += topic_condition
-            params.extend(topic_params)
-
-        # Add components condition
-        if components != 'ALL':
-            comp_condition, comp_params = add_condition("component", components)
-            query += comp_condition
-            params.extend(comp_params)
-
-        # Log the query for debugging (optional)
-        logger.debug(f"Generated SQL query: {query}")
-        logger.debug(f"Query parameters: {params}")
-
-        # Execute the query
-        cursor = db.execute(query, params)
-        rows = cursor.fetchall()
-
-        # Process results
-
-        generatorConfig = loadConfig('./configs/generator.json')
-
-        questionsToGenerate = generatorConfig["questionsToGenerate"]
-
-        if rows:
-            # If more than questionsToGenerate questions, randomly select questionsToGenerate number in the config file
-            if len(rows) > questionsToGenerate:
-                rows = random.sample(rows, questionsToGenerate)
-            else:
-                random.shuffle(rows)
-
-            processed_rows = rows
-            logger.info(f"Successfully retrieved {len(processed_rows)} questions for {subject} level {level}")
-            return processed_rows
+        questionsToGenerate = generatorSettings.get().data["questionsToGenerate"]
+
+        # Pick the ids from the in-memory index, only the sampled rows are read from the database.
+        # Questions are bucketed by their level key, so "AS Level" finds the "A Levels" questions too.
+        levelKey = normalizeLevel(level, board)
+        buckets = questionIndex.matching(board, subject, levelKey, topics, components, difficulties)
+
+        # Scores move with every rating and are not in the index, the questions_score index narrows them instead
+        if minScore is not None or maxScore is not None:
+            with pool.connection() as connection:
+                scored = {row[0] for row in connection.execute('''
+                    SELECT id FROM questions
+                    WHERE board = ? AND subject = ? AND levelKey = ? AND approved = 1 AND ratingScore BETWEEN ? AND ?
+                ''', (board, subject, levelKey, 1 if minScore is None else minScore, 5 if maxScore is None else maxScore))}
+            buckets = [(key, [questionId for questionId in ids if questionId in scored]) for key, ids in buckets]
+            buckets = [(key, ids) for key, ids in buckets if ids]
+
+        if mode == 'balanced':
+            questionIds = questionIndex.sampleBalanced(buckets, questionsToGenerate, topicQuotas, difficultyQuotas, seed)
         else:
+            questionIds = questionIndex.sample(buckets, questionsToGenerate, seed)
+
+        if not questionIds:
             logger.warning(f"No questions found for {subject} level {level}")
             return []
 
+        with pool.connection() as connection:
+            rows = connection.execute(f"""
+                SELECT id, uuid, subject, topic, difficulty, board, level, component, ratingScore
+                FROM questions
+                WHERE id IN ({", ".join("?" for _ in questionIds)})
+            """, questionIds).fetchall()
+
+        # Keep the sampled order, the IN query returns the rows by id
+        rowsById = {row[0]: row for row in rows}
+        rows = [rowsById[questionId] for questionId in questionIds if questionId in rowsById]
+        if order == 'score':
+            rows.sort(key=lambda row: row[8] if row[8] is not None else 3)
+
+        logger.info(f"Successfully retrieved {len(rows)} questions for {subject} level {level}")
+        return rows
+
     except sqlite3.Error as e:
         logger.error(f"Database error in getQuestionsForGen: {str(e)}")
-        raise Exception(f"Database error occurred: {str(e)}")
+        return []
     except Exception as e:
         logger.error(f"General error in getQuestionsForGen: {str(e)}")
-        raise Exception(f"An error occurred while retrieving questions: {str(e)}")
-    finally:
-        if connection:
-            connection.close()
+        return []
 
 
 def dbDump():
@@ -620,45 +937,41 @@ def dbDump():
 
     try:
         # Connect to the database
-        connection = sqlite3.connect(dbPath)
-        db = connection.cursor()
+        with pool.connection() as connection:
+            db = connection.cursor()
 
-        # Fetch all rows from the 'papers' table
-        rows = db.execute('SELECT id, uuid, subject, year, component, board, level FROM papers').fetchall()
+            # Fetch all rows from the 'papers' table
+            rows = db.execute('SELECT id, uuid, subject, year, component, board, level FROM papers').fetchall()
 
-        data = [row for row in rows]
+            data = [row for row in rows]
 
-        json_data = []
+            json_data = []
 
-        for data in data:
-            subject_name = data[2]
-            component = data[4]
-            year = data[3]
-            level = data[6]
-            board = data[5]
+            for data in data:
+                subject_name = data[2]
+                component = data[4]
+                year = data[3]
+                level = data[6]
+                board = data[5]
 
-            json_data.append(f'Grade: {level}, Subject: {subject_name}, Province: {component}, Year: {year} question paper. ({board})')
+                json_data.append(f'Grade: {level}, Subject: {subject_name}, Province: {component}, Year: {year} question paper. ({board})')
 
 
-        # Write to JSON file
-        with open(output_json_file, 'w') as json_file:
-            json.dump(json_data, json_file, indent=4)
+            # Write to JSON file
+            with open(output_json_file, 'w') as json_file:
+                json.dump(json_data, json_file, indent=4)
 
-        # Write to text file
-        with open(output_text_file, 'w') as text_file:
-            for name in data:
-                text_file.write(f"{name}\n")
+            # Write to text file
+            with open(output_text_file, 'w') as text_file:
+                for name in data:
+                    text_file.write(f"{name}\n")
 
-        logger.info("Database dump completed successfully")
-        return data
+            logger.info("Database dump completed successfully")
+            return data
 
     except sqlite3.Error as e:
         logger.error(f"An error occurred during database dump: {e}")
         return None
-    finally:
-        # Close the connection
-        if connection:
-            connection.close()
 
 
 
@@ -670,26 +983,29 @@ def dbDump():
 def upadte_rating(uuid, rating):
 
     try:
-        connection = sqlite3.connect(dbPath)
-        connection.row_factory = dict_factory
-        db = connection.cursor()
-
-        db.execute(
-            """UPDATE questions
-               SET difficulty = ?
-               WHERE uuid = ?""",
-            (rating, uuid)
-        )
+        with pool.connection(rowFactory=dict_factory) as connection:
+            db = connection.cursor()
 
-        connection.commit()
-        return True
+            db.execute(
+                """UPDATE questions
+                   SET difficulty = ?
+                   WHERE uuid = ?""",
+                (rating, uuid)
+            )
+            # The difficulty is the score's prior
+            db.execute(f'UPDATE questions SET ratingScore = {ratingScoreSql} WHERE uuid = ?', (uuid,))
+
+            connection.commit()
+            return True
 
     except sqlite3.Error as e:
         logger.error(f"Error fetching unapproved questions: {e}")
         return False
-    finally:
-        if connection:
-            connection.close()
+
+# Columns the admin listings need, so they don't drag the files through the page cache
+questionMetadataColumns = "id, uuid, subject, topic, difficulty, board, level, component, approved, submittedBy, submittedFrom, submitDate, questionHash, solutionHash, fileState"
+paperMetadataColumns = "id, uuid, subject, year, yearNumber, session, component, board, level, approved, submittedBy, submittedFrom, submitDate, questionHash, solutionHash, fileState"
+topicalMetadataColumns = "id, uuid, subject, board, topic, approved, submittedBy, submittedFrom, submitDate, questionHash, solutionHash, fileState"
 
 def dict_factory(cursor, row):
     """Convert database row objects into a dict"""
@@ -699,284 +1015,474 @@ def dict_factory(cursor, row):
 def get_unapproved_questions():
     """Get all unapproved questions from the database"""
     try:
-        connection = sqlite3.connect(dbPath)
-        connection.row_factory = dict_factory
-        db = connection.cursor()
+        with pool.connection(rowFactory=dict_factory) as connection:
+            db = connection.cursor()
 
-        questions = db.execute('''
-            SELECT *
-            FROM questions
-            WHERE approved = False
-        ''').fetchall()
+            questions = db.execute(f'''
+                SELECT {questionMetadataColumns}
+                FROM questions
+                WHERE approved = False
+            ''').fetchall()
 
-        return questions
+            return questions
     except sqlite3.Error as e:
         logger.error(f"Error fetching unapproved questions: {e}")
         return []
-    finally:
-        if connection:
-            connection.close()
 
 def get_unapproved_papers():
     """Get all unapproved papers from the database"""
     try:
-        connection = sqlite3.connect(dbPath)
-        connection.row_factory = dict_factory
-        db = connection.cursor()
+        with pool.connection(rowFactory=dict_factory) as connection:
+            db = connection.cursor()
 
-        papers = db.execute('''
-            SELECT *
-            FROM papers
-            WHERE approved = False
-        ''').fetchall()
+            papers = db.execute(f'''
+                SELECT {paperMetadataColumns}
+                FROM papers
+                WHERE approved = False
+            ''').fetchall()
 
-        return papers
+            return papers
     except sqlite3.Error as e:
         logger.error(f"Error fetching unapproved papers: {e}")
         return []
-    finally:
-        if connection:
-            connection.close()
 
 def get_unapproved_topicals():
     try:
-        connection = sqlite3.connect(dbPath)
-        connection.row_factory = dict_factory
-        db = connection.cursor()
+        with pool.connection(rowFactory=dict_factory) as connection:
+            db = connection.cursor()
 
-        papers = db.execute('''
-            SELECT *
-            FROM topicals
-            WHERE approved = False
-        ''').fetchall()
+            papers = db.execute(f'''
+                SELECT {topicalMetadataColumns}
+                FROM topicals
+                WHERE approved = False
+            ''').fetchall()
 
-        return papers
+            return papers
     except sqlite3.Error as e:
         logger.error(f"Error fetching unapproved papers: {e}")
         return []
-    finally:
-        if connection:
-            connection.close()
 def approve_question(username: str, uuid: str) -> bool:
     """Approve a question by UUID"""
-    connection = None
     try:
         logger.info(
             f"Starting approval process for question UUID: {uuid}",
             extra={'http_request': True}
         )
-        connection = sqlite3.connect(dbPath)
-
-        # Get question data before updating
-        question_data = get_question(uuid)
-        if not question_data:
-            logger.error(f"Question {uuid} not found", extra={'http_request': True})
-            return False
+        with pool.connection() as connection:
+
+            # Get question data before updating
+            question_data = get_question(uuid, includeFiles=False)
+            if not question_data:
+                logger.error(f"Question {uuid} not found", extra={'http_request': True})
+                return False
+            if question_data['fileState'] != 'ready':
+                logger.warning(f"Question {uuid} can't be approved while its files are {question_data['fileState']}")
+                return False
+
+            sameFile = findDuplicateFile('questions', question_data['questionHash'], exclude=uuid)
+            if sameFile and sameFile['approved']:
+                logger.warning(f"Question {uuid} has the same question file as the approved question {sameFile['uuid']}")
+                return False
         
 
-        # Update approval status
-        cursor = connection.cursor()
-        cursor.execute('UPDATE questions SET approved = True , approvedBy = ? , approvedOn = ? WHERE uuid = ?', (username, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), uuid))
-        connection.commit()
+            # Update approval status
+            cursor = connection.cursor()
+            adjustStatsCounter(connection, 'questions', uuid, -1)
+            cursor.execute('UPDATE questions SET approved = True , approvedBy = ? , approvedOn = ? WHERE uuid = ?', (username, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), uuid))
+            adjustStatsCounter(connection, 'questions', uuid, 1)
+            bumpContentVersion(connection, table='questions')
+            connection.commit()
+            catalogCache.invalidate('questions', question_data['subject'])
 
-        # Send webhook notification
-        send_to_discord("question", question_data)
+            # Send webhook notification
+            send_to_discord("question", question_data)
 
-        return True
+            return True
     except sqlite3.Error as e:
         logger.error(f"Error approving question {uuid}: {e}",
                     extra={'http_request': True})
         return False
-    finally:
-        if connection:
-            connection.close()
 
 def approve_paper(username : str,uuid: str) -> bool:
     """Approve a paper by UUID"""
-    connection = None
     try:
         logger.info(
             f"Starting approval process for paper UUID: {uuid}",
             extra={'http_request': True}
         )
-        connection = sqlite3.connect(dbPath)
-
-        # Get paper data before updating
-        paper_data = get_paper(uuid)
-        if not paper_data:
-            logger.error(f"Paper {uuid} not found", extra={'http_request': True})
-            return False
-
-        # Update approval status
-        cursor = connection.cursor()
+        with pool.connection() as connection:
+
+            # Get paper data before updating
+            paper_data = get_paper(uuid, includeFiles=False)
+            if not paper_data:
+                logger.error(f"Paper {uuid} not found", extra={'http_request': True})
+                return False
+            if paper_data['fileState'] != 'ready':
+                logger.warning(f"Paper {uuid} can't be approved while its files are {paper_data['fileState']}")
+                return False
+
+            # Update approval status
+            cursor = connection.cursor()
         
-        # Get all the paper data from the db to check if we are approving a duplicate paper
-        if paper_data['board'] == 'A Levels':
+            # Get all the paper data from the db to check if we are approving a duplicate paper,
+            # every A level spelling shares one level key so A and AS papers collide as before
             query = """SELECT * FROM papers WHERE
-                    approved = True AND subject = ?
-                    AND year = ? AND component = ?
-                    AND board = ?"""       
-        
-            exesting_paper = cursor.execute(query, (paper_data['subject'], paper_data['year'], paper_data['component'], paper_data['board'])).fetchone()
-        else:
-            query = """SELECT * FROM papers WHERE 
-                    approved = True AND subject = ? 
-                    AND year = ? AND component = ? 
-                    AND board = ? AND level = ?"""
-            
-            exesting_paper = cursor.execute(query, (paper_data['subject'], paper_data['year'], paper_data['component'], paper_data['board'], paper_data['level'])).fetchone()
+                    levelKey = ? AND subject = ? AND approved = True
+                    AND year = ? AND component = ? AND board = ?"""
 
-        if exesting_paper:
-            logger.warning(f"Paper {uuid} has a duplicate in the database with UUID: {exesting_paper[1]}" )
-            return False
+            exesting_paper = cursor.execute(query, (normalizeLevel(paper_data['level'], paper_data['board']), paper_data['subject'], paper_data['year'], paper_data['component'], paper_data['board'])).fetchone()
 
-        cursor.execute('UPDATE papers SET approved = True , approvedBy = ? , approvedOn = ? WHERE uuid = ?', (username, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), uuid))
-        connection.commit()
+            if exesting_paper:
+                logger.warning(f"Paper {uuid} has a duplicate in the database with UUID: {exesting_paper[1]}" )
+                return False
 
-        # Send webhook notification
-        send_to_discord("paper", paper_data)
+            # The same question paper approved under another label, e.g. a wrong year
+            sameFile = findDuplicateFile('papers', paper_data['questionHash'], exclude=uuid)
+            if sameFile and sameFile['approved']:
+                logger.warning(f"Paper {uuid} has the same question paper as the approved paper {sameFile['uuid']}")
+                return False
 
-        return True
+            adjustStatsCounter(connection, 'papers', uuid, -1)
+            cursor.execute('UPDATE papers SET approved = True , approvedBy = ? , approvedOn = ? WHERE uuid = ?', (username, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), uuid))
+            adjustStatsCounter(connection, 'papers', uuid, 1)
+            syncCatalogEntry(connection, 'papers', uuid)
+            bumpContentVersion(connection, table='papers')
+            connection.commit()
+            catalogCache.invalidate('papers', paper_data['subject'], paper_data['year'])
+
+            # Send webhook notification
+            send_to_discord("paper", paper_data)
+
+            return True
     except sqlite3.Error as e:
         logger.error(f"Error approving paper {uuid}: {e}",
                     extra={'http_request': True})
         return False
-    finally:
-        if connection:
-            connection.close()
+
+def approvePapers(username, uuids):
+    """
+    Approve a batch of papers in one transaction, for bulk imports.
+
+    Papers whose files are not ready, or that duplicate an approved paper (one approved earlier
+    in the batch included), stay unapproved. No Discord message is sent per paper.
+
+    Returns:
+        dict: uuid -> 'approved', 'duplicate', 'processing', 'failed' or 'missing', None on error
+    """
+    results = {}
+    try:
+        with pool.connection() as connection:
+            for uuidStr in uuids:
+                paper = get_paper(uuidStr, includeFiles=False)
+                if not paper:
+                    results[uuidStr] = 'missing'
+                    continue
+                if paper['fileState'] != 'ready':
+                    results[uuidStr] = paper['fileState']
+                    continue
+
+                duplicate = connection.execute("""SELECT uuid FROM papers WHERE
+                        levelKey = ? AND subject = ? AND approved = True
+                        AND year = ? AND component = ? AND board = ?""",
+                    (normalizeLevel(paper['level'], paper['board']), paper['subject'], paper['year'], paper['component'], paper['board'])).fetchone()
+                if duplicate:
+                    logger.warning(f"Paper {uuidStr} has a duplicate in the database with UUID: {duplicate[0]}")
+                    results[uuidStr] = 'duplicate'
+                    continue
+
+                sameFile = findDuplicateFile('papers', paper['questionHash'], exclude=uuidStr)
+                if sameFile and sameFile['approved']:
+                    logger.warning(f"Paper {uuidStr} has the same question paper as the approved paper {sameFile['uuid']}")
+                    results[uuidStr] = 'duplicate'
+                    continue
+
+                adjustStatsCounter(connection, 'papers', uuidStr, -1)
+                connection.execute('UPDATE papers SET approved = True , approvedBy = ? , approvedOn = ? WHERE uuid = ?',
+                                   (username, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), uuidStr))
+                adjustStatsCounter(connection, 'papers', uuidStr, 1)
+                syncCatalogEntry(connection, 'papers', uuidStr)
+                results[uuidStr] = 'approved'
+
+            bumpContentVersion(connection, table='papers')
+            connection.commit()
+    except sqlite3.Error as e:
+        logger.error(f"Error approving a batch of {len(uuids)} papers: {e}")
+        return None
+
+    # Whole subjects change at once in a bulk import, drop their listings in one go
+    catalogCache.clear()
+    logger.info(f"{username} approved {sum(result == 'approved' for result in results.values())} of {len(uuids)} papers")
+    return results
 
 def approve_topical(username : str,uuid: str) -> bool:
-    connection = None
     try:
         logger.info(
             f"Starting approval process for paper UUID: {uuid}",
             extra={'http_request': True}
         )
-        connection = sqlite3.connect(dbPath)
-
-        topical_data = get_topical(uuid)
-        if not topical_data:
-            logger.error(f"Topical {uuid} not found", extra={'http_request': True})
-            return False
-
-        # Update approval status
-        cursor = connection.cursor()
+        with pool.connection() as connection:
+
+            topical_data = get_topical(uuid, includeFiles=False)
+            if not topical_data:
+                logger.error(f"Topical {uuid} not found", extra={'http_request': True})
+                return False
+            if topical_data['fileState'] != 'ready':
+                logger.warning(f"Topical {uuid} can't be approved while its files are {topical_data['fileState']}")
+                return False
+
+            sameFile = findDuplicateFile('topicals', topical_data['questionHash'], exclude=uuid)
+            if sameFile and sameFile['approved']:
+                logger.warning(f"Topical {uuid} has the same question paper as the approved topical {sameFile['uuid']}")
+                return False
+
+            # Update approval status
+            cursor = connection.cursor()
         
-        cursor.execute('UPDATE topicals SET approved = True , approvedBy = ? , approvedOn = ? WHERE uuid = ?', (username, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), uuid))
-        connection.commit()
-
-        # Send webhook notification
-        send_to_discord("topical", topical_data)
-
-        return True
+            adjustStatsCounter(connection, 'topicals', uuid, -1)
+            cursor.execute('UPDATE topicals SET approved = True , approvedBy = ? , approvedOn = ? WHERE uuid = ?', (username, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), uuid))
+            adjustStatsCounter(connection, 'topicals', uuid, 1)
+            syncCatalogEntry(connection, 'topicals', uuid)
+            bumpContentVersion(connection, table='topicals')
+            connection.commit()
+            catalogCache.invalidate('topicals', topical_data['subject'])
+
+            # Send webhook notification
+            send_to_discord("topical", topical_data)
+
+            return True
     except sqlite3.Error as e:
         logger.error(f"Error approving topical {uuid}: {e}",
                     extra={'http_request': True})
         return False
-    finally:
-        if connection:
-            connection.close()
 
 def delete_question(uuid: str) -> bool:
     """Delete a question by UUID"""
     try:
-        connection = sqlite3.connect(dbPath)
-        db = connection.cursor()
-
-        db.execute('DELETE FROM questions WHERE uuid = ?', (uuid,))
-        connection.commit()
-        return True
+        with pool.connection() as connection:
+            db = connection.cursor()
+
+            row = db.execute('SELECT subject FROM questions WHERE uuid = ?', (uuid,)).fetchone()
+            adjustStatsCounter(connection, 'questions', uuid, -1)
+            db.execute('DELETE FROM questions WHERE uuid = ?', (uuid,))
+            if db.rowcount:
+                bumpContentVersion(connection, table='questions')
+            connection.commit()
+            if row:
+                catalogCache.invalidate('questions', row[0])
+            return True
     except sqlite3.Error as e:
         logger.error(f"Error deleting question {uuid}: {e}")
         return False
-    finally:
-        if connection:
-            connection.close()
 
 def delete_paper(uuid: str) -> bool:
     """Delete a paper by UUID"""
     try:
-        connection = sqlite3.connect(dbPath)
-        db = connection.cursor()
-
-        db.execute('DELETE FROM papers WHERE uuid = ?', (uuid,))
-        connection.commit()
-        return True
+        with pool.connection() as connection:
+            db = connection.cursor()
+
+            row = db.execute('SELECT subject, year FROM papers WHERE uuid = ?', (uuid,)).fetchone()
+            adjustStatsCounter(connection, 'papers', uuid, -1)
+            db.execute('DELETE FROM papers WHERE uuid = ?', (uuid,))
+            if db.rowcount:
+                syncCatalogEntry(connection, 'papers', uuid)
+                bumpContentVersion(connection, table='papers')
+            connection.commit()
+            if row:
+                catalogCache.invalidate('papers', row[0], row[1])
+            return True
     except sqlite3.Error as e:
         logger.error(f"Error deleting paper {uuid}: {e}")
         return False
-    finally:
-        if connection:
-            connection.close()
 
 def delete_topical(uuid: str) -> bool:
     try:
-        connection = sqlite3.connect(dbPath)
-        db = connection.cursor()
-
-        db.execute('DELETE FROM topicals WHERE uuid = ?', (uuid,))
-        connection.commit()
-        return True
+        with pool.connection() as connection:
+            db = connection.cursor()
+
+            row = db.execute('SELECT subject FROM topicals WHERE uuid = ?', (uuid,)).fetchone()
+            adjustStatsCounter(connection, 'topicals', uuid, -1)
+            db.execute('DELETE FROM topicals WHERE uuid = ?', (uuid,))
+            if db.rowcount:
+                syncCatalogEntry(connection, 'topicals', uuid)
+                bumpContentVersion(connection, table='topicals')
+            connection.commit()
+            if row:
+                catalogCache.invalidate('topicals', row[0])
+            return True
     except sqlite3.Error as e:
         logger.error(f"Error deleting topical {uuid}: {e}")
         return False
-    finally:
-        if connection:
-            connection.close()
 
-def get_question(uuid: str):
-    """Get a single question by UUID"""
+def get_question(uuid: str, includeFiles=True):
+    """Get a single question by UUID, pass includeFiles=False when only the metadata is needed"""
     try:
-        connection = sqlite3.connect(dbPath)
-        connection.row_factory = dict_factory
-        db = connection.cursor()
+        with pool.connection(rowFactory=dict_factory) as connection:
+            db = connection.cursor()
 
-        question = db.execute('''
-            SELECT * FROM questions WHERE uuid = ?
-        ''', (uuid,)).fetchone()
+            question = db.execute(f'''
+                SELECT {'*' if includeFiles else questionMetadataColumns} FROM questions WHERE uuid = ?
+            ''', (uuid,)).fetchone()
 
-        return question
+            return loadStoredFiles(question)
     except sqlite3.Error as e:
         logger.error(f"Error fetching question {uuid}: {e}")
         return None
-    finally:
-        if connection:
-            connection.close()
 
-def get_paper(uuid: str):
-    """Get a single paper by UUID"""
+def get_paper(uuid: str, includeFiles=True):
+    """Get a single paper by UUID, pass includeFiles=False when only the metadata is needed"""
     try:
-        connection = sqlite3.connect(dbPath)
-        connection.row_factory = dict_factory
-        db = connection.cursor()
-
-        paper = db.execute('''
-            SELECT * FROM papers WHERE uuid = ?
-        ''', (uuid,)).fetchone()
-        return paper
+        with pool.connection(rowFactory=dict_factory) as connection:
+            db = connection.cursor()
+
+            paper = db.execute(f'''
+                SELECT {'*' if includeFiles else paperMetadataColumns} FROM papers WHERE uuid = ?
+            ''', (uuid,)).fetchone()
+            return loadStoredFiles(paper)
     except sqlite3.Error as e:
         logger.error(f"Error fetching paper {uuid}: {e}")
         return None
-    finally:
-        if connection:
-            connection.close()
 
-def get_topical(uuid: str):
+def get_topical(uuid: str, includeFiles=True):
     try:
-        connection = sqlite3.connect(dbPath)
-        connection.row_factory = dict_factory
-        db = connection.cursor()
-
-        paper = db.execute('''
-            SELECT * FROM topicals WHERE uuid = ?
-        ''', (uuid,)).fetchone()
-        return paper
+        with pool.connection(rowFactory=dict_factory) as connection:
+            db = connection.cursor()
+
+            paper = db.execute(f'''
+                SELECT {'*' if includeFiles else topicalMetadataColumns} FROM topicals WHERE uuid = ?
+            ''', (uuid,)).fetchone()
+            return loadStoredFiles(paper)
     except sqlite3.Error as e:
         logger.error(f"Error fetching paper {uuid}: {e}")
         return None
-    finally:
-        if connection:
-            connection.close()
+
+# How each approved row maps onto the catalog columns. Papers the year backfill has not reached use the
+# label's first four characters, NULL (left out of the year list) when they are not a year
+catalogColumns = "uuid, kind, board, level, levelKey, subject, yearNumber, session, year, component, topic"
+catalogSources = {
+    "papers": '''
+        SELECT uuid, 'paper', board, level, levelKey, subject, COALESCE(yearNumber, NULLIF(CAST(substr(year, 1, 4) AS INTEGER), 0)), session, year, component, NULL
+        FROM papers WHERE approved = 1
+    ''',
+    "topicals": '''
+        SELECT uuid, 'topical', board, NULL, levelKey, subject, NULL, NULL, NULL, NULL, topic
+        FROM topicals WHERE approved = 1
+    '''
+}
+
+def syncCatalogEntry(connection, table, uuid):
+    """
+    Bring the catalog row of one paper / topical in line with its source row.
+
+    Runs inside the caller's transaction, so the catalog never disagrees with the
+    approve or delete that triggered it. Unapproved or deleted rows simply drop out.
+    """
+    connection.execute('DELETE FROM catalog WHERE uuid = ?', (uuid,))
+    connection.execute(f'INSERT INTO catalog ({catalogColumns}) {catalogSources[table]} AND uuid = ?', (uuid,))
+
+def rebuildCatalog():
+    """
+    Recreate the whole catalog from the papers and topicals tables.
+
+    Returns:
+        int: Number of catalog rows, or None on error
+    """
+    try:
+        with pool.connection() as connection:
+            connection.execute('DELETE FROM catalog')
+            for source in catalogSources.values():
+                connection.execute(f'INSERT INTO catalog ({catalogColumns}) {source}')
+            count = connection.execute('SELECT COUNT(*) FROM catalog').fetchone()[0]
+            connection.commit()
+        catalogCache.clear()
+        logger.info(f"Catalog rebuilt with {count} rows")
+        return count
+    except sqlite3.Error as e:
+        logger.error(f"Error rebuilding catalog: {e}")
+        return None
+
+# Tables the stats page counts, rows are counted under their canonical level key (see normalizeLevel)
+statsCounterTables = ("questions", "papers", "topicals")
+
+# (board, level, subject, approved) of a row, NULLs become '' / -1 so the unique index sees them as equal
+statsCounterKey = "COALESCE(board, '') AS counterBoard, COALESCE(levelKey, '') AS counterLevel, COALESCE(subject, '') AS counterSubject, COALESCE(approved, -1) AS counterApproved"
+
+def adjustStatsCounter(connection, table, uuid, delta):
+    """
+    Add delta to the stats counter the row `uuid` of `table` falls under, inside the caller's transaction.
+
+    Writers call it with +1 after inserting a row, -1 before deleting one and -1 / +1 around a change
+    of approved, board, level or subject. A missing row changes nothing.
+    """
+    connection.execute(f'''
+        INSERT INTO stats_counters (tableName, board, level, subject, approved, count)
+        SELECT ?, {statsCounterKey}, ? FROM {table} WHERE uuid = ?
+        ON CONFLICT (tableName, board, level, subject, approved) DO UPDATE SET count = count + excluded.count
+    ''', (table, delta, uuid))
+
+def rebuildStatsCounters():
+    """
+    Recount stats_counters from the questions, papers and topicals tables, repairs any drift.
+
+    Returns:
+        int: Number of counter rows, or None on error
+    """
+    try:
+        with pool.connection() as connection:
+            connection.execute('DELETE FROM stats_counters')
+            for table in statsCounterTables:
+                connection.execute(f'''
+                    INSERT INTO stats_counters (tableName, board, level, subject, approved, count)
+                    SELECT ?, {statsCounterKey}, COUNT(*) FROM {table}
+                    GROUP BY counterBoard, counterLevel, counterSubject, counterApproved
+                ''', (table,))
+            count = connection.execute('SELECT COUNT(*) FROM stats_counters').fetchone()[0]
+            bumpContentVersion(connection, 'submissionVersion')
+            connection.commit()
+        logger.info(f"Stats counters rebuilt with {count} rows")
+        return count
+    except sqlite3.Error as e:
+        logger.error(f"Error rebuilding stats counters: {e}")
+        return None
+
+def bumpContentVersion(connection, key='contentVersion', table=None):
+    """
+    Increase a content version counter inside the caller's transaction.
+
+    'contentVersion' changes whenever approved content changes (approve / delete) and
+    'submissionVersion' whenever something new is submitted and 'thumbnailVersion' when
+    thumbnails are rendered. Cached pages derive their ETags from these, see httpCache.py.
+    Passing the table that changed also bumps its own '<table>Version', which the catalog
+    cache checks so a topical approval doesn't drop the paper listings.
+    """
+    updatedOn = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+    for versionKey in (key, f'{table}Version') if table else (key,):
+        connection.execute('''
+            INSERT INTO meta (key, value, updatedOn) VALUES (?, 1, ?)
+            ON CONFLICT(key) DO UPDATE SET value = value + 1, updatedOn = excluded.updatedOn
+        ''', (versionKey, updatedOn))
+
+def getContentVersion(keys=('contentVersion',)):
+    """
+    Read content version counters.
+
+    Returns:
+        tuple: (list of versions in the order of keys, latest updatedOn as a datetime or None)
+    """
+    try:
+        with pool.connection() as connection:
+            rows = dict(
+                (key, (value, updatedOn)) for key, value, updatedOn in connection.execute(
+                    f"SELECT key, value, updatedOn FROM meta WHERE key IN ({', '.join('?' for _ in keys)})", tuple(keys)
+                )
+            )
+    except sqlite3.Error as e:
+        logger.error(f"Error reading content version: {e}")
+        return None, None
+
+    versions = [rows.get(key, (0, None))[0] for key in keys]
+    updated = [rows[key][1] for key in keys if key in rows and rows[key][1]]
+    lastModified = datetime.strptime(max(updated), '%Y-%m-%d %H:%M:%S') if updated else None
+    return versions, lastModified
 
 # Discord web hook so the users are notified when a question is approved
 
@@ -1027,23 +1533,49 @@ def send_to_discord(item_type: str, data: dict) -> bool:
         return False
 
 def getStat(config):
+    """
+    Count approved / unapproved questions, papers and topicals per board, level and subject.
+
+    The counts come from one read of stats_counters, which the insert / approve / delete functions
+    keep up to date, and are folded into the per level / subject numbers here.
+    """
     try:
-        connection = sqlite3.connect(dbPath)
-        db = connection.cursor()
+        with pool.connection() as connection:
+            db = connection.cursor()
+
+            # Counts per (level, subject, approved), (level, approved) and approved for each table,
+            # levels as the strings config.json uses. Topicals only count per (subject, approved).
+            counts = {"questions": {}, "papers": {}}
+            topicalCounts = {}
+            for table, level, subject, approved, count in db.execute(
+                "SELECT tableName, level, subject, approved, count FROM stats_counters WHERE count != 0"
+            ):
+                if table == "topicals":
+                    topicalCounts[(subject, approved)] = topicalCounts.get((subject, approved), 0) + count
+                    continue
+                for key in ((level, subject, approved), (level, approved), (approved,)):
+                    counts[table][key] = counts[table].get(key, 0) + count
+
+        def total(table, levels=None, subject=None, approved=1):
+            if levels is None:
+                return counts[table].get((approved,), 0)
+            if subject is None:
+                return sum(counts[table].get((level, approved), 0) for level in levels)
+            return sum(counts[table].get((level, subject, approved), 0) for level in levels)
 
         stats = {
             "overall": {
                 "questions": {
-                    "approved": 0,
-                    "unapproved": 0
+                    "approved": total("questions"),
+                    "unapproved": total("questions", approved=0)
                 },
                 "papers": {
-                    "approved": 0,
-                    "unapproved": 0
+                    "approved": total("papers"),
+                    "unapproved": total("papers", approved=0)
                 },
-                "topicals":{
-                    "approved": 0,
-                    "unapproved": 0
+                "topicals": {
+                    "approved": sum(count for (_, approved), count in topicalCounts.items() if approved == 1),
+                    "unapproved": sum(count for (_, approved), count in topicalCounts.items() if approved == 0)
                 }
             },
             "byBoard": {}
@@ -1057,134 +1589,39 @@ def getStat(config):
             stats["byBoard"][boardName] = boardStats
 
             for level in boardConfig["levels"]:
-                # Normalize A-level variations
-                normalized_level = level
-                if level.lower() in ["a level", "as level", "a-level", "as-level"]:
-                    normalized_level = "A level"  # Use this as the standard key
-                
-                if normalized_level not in boardStats["levels"]:
-                    boardStats["levels"][normalized_level] = {
-                        "approvedQuestions": 0,
-                        "unapprovedQuestions": 0,
-                        "subjects": {}
+                # A and AS level share one entry holding the counts of every spelling
+                levelKey = normalizeLevel(level)
+                isALevel = levelKey == LEVEL_A_LEVEL
+                normalizedLevel = "A level" if isALevel else level
+                levels = (levelKey,)
+
+                levelStats = boardStats["levels"].setdefault(normalizedLevel, {
+                    "approvedQuestions": 0,
+                    "unapprovedQuestions": 0,
+                    "subjects": {}
+                })
+
+                # Each A level spelling in the config adds the combined count again, as it always has
+                if isALevel:
+                    levelStats["approvedQuestions"] += total("questions", levels)
+                    levelStats["unapprovedQuestions"] += total("questions", levels, approved=0)
+                else:
+                    levelStats["approvedQuestions"] = total("questions", levels)
+                    levelStats["unapprovedQuestions"] = total("questions", levels, approved=0)
+
+                for subject in boardConfig["subjects"]:
+                    subjectName = subject["name"]
+                    subjectStats = {
+                        "approved": total("questions", levels, subjectName),
+                        "unapproved": total("questions", levels, subjectName, 0),
+                        "approvedPapers": total("papers", levels, subjectName),
+                        "unapprovedPapers": total("papers", levels, subjectName, 0)
                     }
+                    if isALevel:
+                        subjectStats["approvedTopicals"] = topicalCounts.get((subjectName, 1), 0)
+                        subjectStats["unapprovedTopicals"] = topicalCounts.get((subjectName, 0), 0)
+                    levelStats["subjects"][subjectName] = subjectStats
 
-                # For A-levels, combine both A and AS level counts
-                if level.lower() in ["a level", "as level", "a-level", "as-level"]:
-                    approved_count = db.execute(
-                        "SELECT COUNT(*) FROM questions WHERE (level = ? OR level = ? OR level = ? OR level = ?) AND approved = ?",
-                        ("A level", "AS level", "A Level", "AS Level", True)
-                    ).fetchone()[0]
-                    unapproved_count = db.execute(
-                        "SELECT COUNT(*) FROM questions WHERE (level = ? OR level = ? OR level = ? OR level = ?) AND approved = ?",
-                        ("A level", "AS level", "A Level", "AS Level", False)
-                    ).fetchone()[0]
-                    
-                    boardStats["levels"][normalized_level]["approvedQuestions"] += approved_count
-                    boardStats["levels"][normalized_level]["unapprovedQuestions"] += unapproved_count
-
-                    # Handle subjects for A-levels
-                    for subject in boardConfig["subjects"]:
-                        subjectName = subject["name"]
-                        if subjectName not in boardStats["levels"][normalized_level]["subjects"]:
-                            boardStats["levels"][normalized_level]["subjects"][subjectName] = {
-                                "approved": 0,
-                                "unapproved": 0,
-                                "approvedPapers": 0,
-                                "unapprovedPapers": 0,
-                                "approvedTopicals": 0,
-                                "unapprovedTopicals": 0
-                            }
-                        
-                        # Combine A and AS level counts for each subject
-                        approved = db.execute(
-                            "SELECT COUNT(*) FROM questions WHERE (level = ? OR level = ? OR level = ? OR level = ?) AND subject = ? AND approved = ?",
-                            ("A level", "AS level", "A Level", "AS Level", subjectName, True)
-                        ).fetchone()[0]
-                        unapproved = db.execute(
-                            "SELECT COUNT(*) FROM questions WHERE (level = ? OR level = ? OR level = ? OR level = ?) AND subject = ? AND approved = ?",
-                            ("A level", "AS level", "A Level", "AS Level", subjectName, False)
-                        ).fetchone()[0]
-                        
-                        approved_papers = db.execute(
-                            "SELECT COUNT(*) FROM papers WHERE (level = ? OR level = ? OR level = ? OR level = ?) AND subject = ? AND approved = ?",
-                            ("A level", "AS level", "A Level", "AS Level", subjectName, True)
-                        ).fetchone()[0]
-                        unapproved_papers = db.execute(
-                            "SELECT COUNT(*) FROM papers WHERE (level = ? OR level = ? OR level = ? OR level = ?) AND subject = ? AND approved = ?",
-                            ("A level", "AS level", "A Level", "AS Level", subjectName, False)
-                        ).fetchone()[0]
-
-                        approved_topicals = db.execute(
-                            "SELECT COUNT(*) FROM topicals WHERE subject = ? AND approved = ?",
-                            (subjectName, True)
-                        ).fetchone()[0]
-
-                        unapproved_topicals = db.execute(
-                            "SELECT COUNT(*) FROM topicals WHERE subject = ? AND approved = ?",
-                            (subjectName, False)
-                        ).fetchone()[0]
-                        boardStats["levels"][normalized_level]["subjects"][subjectName].update({
-                            "approved": approved,
-                            "unapproved": unapproved,
-                            "approvedPapers": approved_papers,
-                            "unapprovedPapers": unapproved_papers,
-                            "approvedTopicals": approved_topicals,
-                            "unapprovedTopicals": unapproved_topicals
-                        })
-
-                else:
-                    # Handle non-A-level statistics as before
-                    boardStats["levels"][normalized_level]["approvedQuestions"] = db.execute(
-                        "SELECT COUNT(*) FROM questions WHERE level = ? AND approved = ?",
-                        (level, True)
-                    ).fetchone()[0]
-                    boardStats["levels"][normalized_level]["unapprovedQuestions"] = db.execute(
-                        "SELECT COUNT(*) FROM questions WHERE level = ? AND approved = ?",
-                        (level, False)
-                    ).fetchone()[0]
-
-                    for subject in boardConfig["subjects"]:
-                        subjectName = subject["name"]
-                        boardStats["levels"][normalized_level]["subjects"][subjectName] = {
-                            "approved": db.execute(
-                                "SELECT COUNT(*) FROM questions WHERE level = ? AND subject = ? AND approved = ?",
-                                (level, subjectName, True)
-                            ).fetchone()[0],
-                            "unapproved": db.execute(
-                                "SELECT COUNT(*) FROM questions WHERE level = ? AND subject = ? AND approved = ?",
-                                (level, subjectName, False)
-                            ).fetchone()[0],
-                            "approvedPapers": db.execute(
-                                "SELECT COUNT(*) FROM papers WHERE level = ? AND subject = ? AND approved = ?",
-                                (level, subjectName, True)
-                            ).fetchone()[0],
-                            "unapprovedPapers": db.execute(
-                                "SELECT COUNT(*) FROM papers WHERE level = ? AND subject = ? AND approved = ?",
-                                (level, subjectName, False)
-                            ).fetchone()[0]
-                        }
-
-        # Update overall stats
-        stats["overall"]["questions"]["approved"] = db.execute(
-            "SELECT COUNT(*) FROM questions WHERE approved = ?", (True,)
-        ).fetchone()[0]
-        stats["overall"]["questions"]["unapproved"] = db.execute(
-            "SELECT COUNT(*) FROM questions WHERE approved = ?", (False,)
-        ).fetchone()[0]
-        stats["overall"]["papers"]["approved"] = db.execute(
-            "SELECT COUNT(*) FROM papers WHERE approved = ?", (True,)
-        ).fetchone()[0]
-        stats["overall"]["papers"]["unapproved"] = db.execute(
-            "SELECT COUNT(*) FROM papers WHERE approved = ?", (False,)
-        ).fetchone()[0]
-        stats["overall"]["topicals"]["approved"] = db.execute(
-            "SELECT COUNT(*) FROM topicals WHERE approved = ?", (True,)
-        ).fetchone()[0]
-        stats["overall"]["topicals"]["unapproved"] = db.execute(
-            "SELECT COUNT(*) FROM topicals WHERE approved = ?", (False,)
-        ).fetchone()[0]
-        connection.close()
         return stats
 
     except sqlite3.Error as e:
@@ -1192,25 +1629,484 @@ def getStat(config):
         return {"error": "Failed to retrieve stats"}
 
 
-def getHash(encodedData):
-    # Decode base64 to get compressed binary data
-    compressedData = base64.b64decode(encodedData)
-    # Decompress to get the original file data
-    originalData = zlib.decompress(compressedData)
-    # Return the SHA-256 hash
-    return hashlib.sha256(originalData).hexdigest()
-
-def convertRatingToString(rating):
-    # Convert integer rating to string representation ('one', 'two', etc.)
-    if rating == 1:
-        return 'one'
-    elif rating == 2:
-        return 'two'
-    elif rating == 3:
-        return 'three'
-    elif rating == 4:
-        return 'four'
-    elif rating == 5:
-        return 'five'
+def compressFile(data):
+    # Files are stored zlib compressed at the highest level
+    return zlib.compress(data, level=9)
+
+def loadStoredFile(storedData):
+    """
+    Return the compressed bytes of a stored file.
+
+    Rows written before the BLOB migration hold base64 text, newer rows hold the raw
+    compressed bytes, so readers go through here to handle both.
+    """
+    if storedData is None:
+        return None
+    if isinstance(storedData, str):
+        return base64.b64decode(storedData)
+    return bytes(storedData)
+
+def blobKey(contentHash, codec=None):
+    # zlib blobs keep the plain hash they were always stored under, other codecs add their name
+    if codec in (None, 'zlib'):
+        return contentHash
+    return f"{contentHash}.{codec}"
+
+def storedCodec(contentHash):
+    """Return the codec the blob store holds a file in, or None if it doesn't have it"""
+    for codec in availableCodecs():
+        if blobStore.exists(blobKey(contentHash, codec)):
+            return codec
+    return None
+
+def storeFile(data):
+    """
+    Compress a file into the blob store on the calling thread, for scripts.
+
+    Uploads go through spoolUploads and ingestQueue instead, this runs the same steps inline.
+
+    Returns:
+        tuple: (SHA-256 of the original file, original size in bytes, codec it is stored with)
+    """
+    ((contentHash, size, codec),), spooled = spoolUploads(data)
+    for _, rawPath in spooled:
+        ((storedPath, codecName, _, _),), _ = compressSpooledFiles(
+            [rawPath], uploadChunkSize, storageCodec.name, storageCodec.level, storageMinSaving
+        )
+        codec = storeSpooledBlob(contentHash, rawPath, storedPath, codecName)
+    return contentHash, size, codec
+
+def spoolRawPath(contentHash):
+    # Uploads waiting for ingestQueue, named by hash so identical uploads share one file
+    return os.path.join(uploadSpoolPath, f"{contentHash}.raw")
+
+def spoolUploads(*files):
+    """
+    Hash the files of one submission and spool them uncompressed for ingestQueue.
+
+    Each file is bytes or a readable file object, read in uploadChunkSize chunks. Files the blob
+    store already holds are not spooled. storeFile does the same in one step for scripts.
+
+    Returns:
+        tuple: ([(SHA-256, size in bytes, stored codec or None)] per file, [(SHA-256, spool path)] still to compress)
+    """
+    os.makedirs(uploadSpoolPath, exist_ok=True)
+    stored, spooled = [], {}
+    try:
+        for data in files:
+            stream = io.BytesIO(data) if isinstance(data, (bytes, bytearray)) else data
+            digest = hashlib.sha256()
+            size = 0
+
+            spool = tempfile.NamedTemporaryFile(dir=uploadSpoolPath, prefix=".upload-", delete=False)
+            try:
+                with spool:
+                    while chunk := stream.read(uploadChunkSize):
+                        digest.update(chunk)
+                        size += len(chunk)
+                        spool.write(chunk)
+
+                contentHash = digest.hexdigest()
+                codec = storedCodec(contentHash)
+                if codec is None:
+                    os.replace(spool.name, spoolRawPath(contentHash))
+            finally:
+                # Still there when the blob store has the file already or anything above failed
+                if os.path.exists(spool.name):
+                    os.remove(spool.name)
+
+            stored.append((contentHash, size, codec))
+            if codec is None:
+                spooled[contentHash] = spoolRawPath(contentHash)
+    except Exception:
+        # A full disk or a broken upload, drop what this submission spooled so far
+        discardSpooled(list(spooled.items()))
+        raise
+    return stored, list(spooled.items())
+
+# Fields the admin pages label a duplicate with
+duplicateLabelColumns = {
+    "papers": "subject, year, component, board, level",
+    "questions": "subject, topic, board, level, component",
+    "topicals": "subject, topic, board"
+}
+
+def findDuplicateFile(table, questionHash, exclude=None):
+    """
+    Find the row of a table whose question file has this content hash, approved rows first.
+
+    Args:
+        table: 'papers', 'questions' or 'topicals'
+        questionHash: SHA-256 of the question file
+        exclude: UUID of the row asking, so it doesn't find itself
+
+    Returns:
+        dict: uuid, approved, fileState and the duplicateLabelColumns of the match, None when there is none
+    """
+    if not questionHash:
+        return None
+    try:
+        with pool.connection(rowFactory=dict_factory) as connection:
+            return connection.execute(f'''
+                SELECT uuid, approved, fileState, {duplicateLabelColumns[table]} FROM {table}
+                WHERE questionHash = ? AND uuid != ?
+                ORDER BY approved DESC, id LIMIT 1
+            ''', (questionHash, exclude or '')).fetchone()
+    except sqlite3.Error as e:
+        logger.error(f"Error looking up duplicates of {questionHash} in {table}: {e}")
+        return None
+
+def discardSpooled(spooled):
+    # Drop the spool files of an upload that is not stored, unless a row still waits for the same file
+    try:
+        with pool.connection() as connection:
+            for contentHash, rawPath in spooled:
+                referenced = any(
+                    connection.execute(f'SELECT 1 FROM {table} WHERE questionHash = ? OR solutionHash = ? LIMIT 1', (contentHash, contentHash)).fetchone()
+                    for table in ('papers', 'topicals', 'questions')
+                )
+                if not referenced and os.path.exists(rawPath):
+                    os.remove(rawPath)
+    except (sqlite3.Error, OSError) as e:
+        # Left for resumeIngestion / a later cleanup, better than deleting a file a row needs
+        logger.error(f"Error discarding spool files {[rawPath for _, rawPath in spooled]}: {e}")
+
+def storeSpooledBlob(contentHash, rawPath, storedPath, codec):
+    """
+    Move a compressed spool file into the blob store.
+
+    When the store already holds the file, in whatever codec, that copy wins and storedPath is
+    dropped. The raw spool file is removed once the file is stored, a queued upload of the same
+    file then finds it gone and skips it.
+
+    Returns:
+        str: Codec the file is stored with, None when it is not stored
+    """
+    existing = storedCodec(contentHash)
+    if storedPath is not None:
+        if existing is None:
+            blobStore.putFile(blobKey(contentHash, codec), storedPath)
+            existing = codec
+        elif storedPath != rawPath:
+            os.remove(storedPath)
+
+    if existing is not None and os.path.exists(rawPath):
+        os.remove(rawPath)
+    return existing
+
+def finishIngestion(job, results):
+    """
+    Store the compressed files of a finished ingestQueue job and mark its row ready.
+
+    Args:
+        job: 'table/uuid' of the row
+        results: (SHA-256, raw spool path, path to store, codec) per file, None when compressing failed
+
+    Returns:
+        bool: True when the row is ready
+    """
+    table, uuidStr = job.split('/', 1)
+    fileState = 'ready' if results is not None else 'failed'
+
+    codecs = {}
+    for contentHash, rawPath, storedPath, codec in results or []:
+        codecs[contentHash] = storeSpooledBlob(contentHash, rawPath, storedPath, codec)
+        if codecs[contentHash] is None:
+            fileState = 'failed'
+
+    try:
+        with pool.connection() as connection:
+            connection.execute(f'UPDATE {table} SET fileState = ? WHERE uuid = ?', (fileState, uuidStr))
+            for contentHash, codec in codecs.items():
+                if codec is not None:
+                    # Both files of a row can be the same upload
+                    connection.execute(f'''
+                        UPDATE {table} SET
+                            questionCodec = CASE WHEN questionHash = ? THEN ? ELSE questionCodec END,
+                            solutionCodec = CASE WHEN solutionHash = ? THEN ? ELSE solutionCodec END
+                        WHERE uuid = ?
+                    ''', (contentHash, codec, contentHash, codec, uuidStr))
+            bumpContentVersion(connection, 'submissionVersion')
+            connection.commit()
+    except sqlite3.Error as e:
+        logger.error(f"Error marking {table} {uuidStr} {fileState}: {e}")
+        return False
+
+    if fileState == 'failed':
+        logger.error(f"Files of {table} {uuidStr} could not be stored, the spool files are kept for resumeIngestion")
+        return False
+    logger.info(f"Files of {table} {uuidStr} stored")
+    if table == 'papers':
+        approvePendingPaper(uuidStr)
+    return True
+
+def approvePendingPaper(uuidStr):
+    """
+    Approve a paper uploaded with approveBy, once its files are ready.
+
+    The request that uploaded it returns straight away, finishIngestion calls this when the files
+    are stored (also for rows picked up again by resumeIngestion). The request is dropped whether
+    the approval works or not, a paper that fails it (a duplicate) waits in the admin queue.
+
+    Returns:
+        bool: True when the paper was approved
+    """
+    try:
+        with pool.connection() as connection:
+            row = connection.execute(
+                "SELECT approveWhenReady FROM papers WHERE uuid = ? AND fileState = 'ready' AND approveWhenReady IS NOT NULL",
+                (uuidStr,)
+            ).fetchone()
+            if not row:
+                return False
+            connection.execute('UPDATE papers SET approveWhenReady = NULL WHERE uuid = ?', (uuidStr,))
+            connection.commit()
+    except sqlite3.Error as e:
+        logger.error(f"Error reading the pending approval of paper {uuidStr}: {e}")
+        return False
+
+    if not approve_paper(row[0], uuidStr):
+        logger.warning(f"Paper {uuidStr} uploaded by {row[0]} could not be approved, it stays in the admin queue")
+        return False
+    logger.info(f"Paper {uuidStr} was approved by {row[0]} once its files were stored")
+    for listener in paperApprovedListeners:
+        listener(uuidStr)
+    return True
+
+def waitForFiles(table, uuidStr, timeout=120):
+    """Block until ingestQueue is done with a row, returns its fileState ('processing' on timeout)"""
+    deadline = time.monotonic() + timeout
+    while True:
+        with pool.connection() as connection:
+            row = connection.execute(f'SELECT fileState FROM {table} WHERE uuid = ?', (uuidStr,)).fetchone()
+        if row is None or row[0] != 'processing' or time.monotonic() > deadline:
+            return row[0] if row else None
+        time.sleep(0.1)
+
+def resumeIngestion():
+    """
+    Queue the rows left processing or failed again, e.g. after a restart in the middle of a job.
+
+    Returns:
+        int: Number of rows queued, or None on error
+    """
+    try:
+        with pool.connection() as connection:
+            rows = [
+                (table, *row) for table in ('papers', 'topicals', 'questions')
+                for row in connection.execute(f"SELECT uuid, questionHash, solutionHash FROM {table} WHERE fileState != 'ready'")
+            ]
+    except sqlite3.Error as e:
+        logger.error(f"Error listing unfinished uploads: {e}")
+        return None
+
+    for table, uuidStr, *hashes in rows:
+        # Files already in the blob store come back without output and just mark the row ready
+        ingestQueue.submit(f'{table}/{uuidStr}', [(contentHash, spoolRawPath(contentHash)) for contentHash in dict.fromkeys(hashes) if contentHash])
+    ingestQueue.wait()
+    return len(rows)
+
+def loadFile(storedData, contentHash, codec=None):
+    # Rows moved to the blob store have no inline data, only the hash. Returns the bytes as stored, in codec
+    if storedData is None and contentHash:
+        return blobStore.get(blobKey(contentHash, codec))
+    return loadStoredFile(storedData)
+
+def loadStoredFiles(row):
+    # Same as loadFile but for a dict row with questionFile / solutionFile keys
+    if not row:
+        return row
+    for fileType in ('question', 'solution'):
+        if f'{fileType}File' in row:
+            row[f'{fileType}File'] = loadFile(row[f'{fileType}File'], row.get(f'{fileType}Hash'), row.get(f'{fileType}Codec'))
+    return row
+
+def getFileReference(uuid, fileType):
+    """
+    Find the stored file behind a /files/<uuid>/<fileType> request.
+
+    Args:
+        uuid: UUID of a paper, topical or question
+        fileType: 'question' or 'solution'
+
+    Returns:
+        dict: table, approved flag, content hash, original size and codec, or None if there is no such file
+    """
+    if fileType not in ('question', 'solution'):
+        return None
+
+    try:
+        with pool.connection() as connection:
+            for table in ('papers', 'topicals', 'questions'):
+                row = connection.execute(f'''
+                    SELECT approved, {fileType}Hash, {fileType}Size, {fileType}Codec FROM {table} WHERE uuid = ?
+                ''', (uuid,)).fetchone()
+
+                if row is None:
+                    continue
+
+                approved, contentHash, size, codec = row
+                if contentHash is None:
+                    # Row not moved to the blob store yet, hash the inline copy for this request.
+                    # Recording it is left to `dbMigrations.py backfill-hashes`, a GET doesn't write.
+                    storedData = connection.execute(f'SELECT {fileType}File FROM {table} WHERE uuid = ?', (uuid,)).fetchone()[0]
+                    if storedData is None:
+                        return None
+                    contentHash = getHash(storedData, codec)
+
+                return {"table": table, "uuid": uuid, "fileType": fileType, "approved": bool(approved), "hash": contentHash, "size": size, "codec": codec}
+            return None
+    except sqlite3.Error as e:
+        logger.error(f"Error looking up {fileType} file for {uuid}: {e}")
+        return None
+
+def getCachedFilePath(reference, chunkSize=256 * 1024):
+    """
+    Return the path of the decompressed file on disk, decompressing it on first use.
+
+    The cache is keyed by content hash like the blob store, so it can be deleted at any
+    time and it gets rebuilt on demand.
+    """
+    contentHash = reference["hash"]
+    path = os.path.join(fileCachePath, contentHash[:2], contentHash)
+    if os.path.exists(path):
+        return path
+
+    # Files stored as they are need no copy when the blob store is a local directory
+    if reference["codec"] == 'none' and isinstance(blobStore, LocalBlobStore):
+        storedPath = blobStore.path(blobKey(contentHash, 'none'))
+        if os.path.exists(storedPath):
+            return storedPath
+
+    with pool.connection() as connection:
+        storedData, storedHash = connection.execute(f'''
+            SELECT {reference["fileType"]}File, {reference["fileType"]}Hash FROM {reference["table"]} WHERE uuid = ?
+        ''', (reference["uuid"],)).fetchone()
+    compressedData = loadFile(storedData, storedHash, reference["codec"])
+    if compressedData is None:
+        # Uploads still being compressed are served from their raw spool file
+        rawPath = spoolRawPath(contentHash)
+        return rawPath if os.path.exists(rawPath) else None
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tempPath = f"{path}.{uuid.uuid4().hex}.tmp"
+    decompressor = getCodec(reference["codec"]).decompressor()
+    view = memoryview(compressedData)
+    with open(tempPath, 'wb') as output:
+        for start in range(0, len(view), chunkSize):
+            output.write(decompressor.decompress(view[start:start + chunkSize]))
+        output.write(decompressor.flush())
+    os.replace(tempPath, path)
+    return path
+
+def getEncodedFile(reference, acceptedEncodings):
+    """
+    Return a file exactly as the blob store holds it, for sending with a Content-Encoding header.
+
+    Browsers decode zlib (deflate), brotli and zstd themselves, sending them the stored bytes
+    skips the decode and the file cache and puts fewer bytes on the wire.
+
+    Args:
+        reference: getFileReference result
+        acceptedEncodings: Content-Encodings the client accepts
+
+    Returns:
+        tuple: (path or file object, mimetype, Content-Encoding), None when the client can't take
+               the stored encoding or the file is not in the blob store (yet)
+    """
+    if reference["codec"] is None or reference["hash"] is None:
+        return None
+    codec = getCodec(reference["codec"])
+    if codec.contentEncoding not in acceptedEncodings:
+        return None
+
+    key = blobKey(reference["hash"], codec.name)
+    if isinstance(blobStore, LocalBlobStore):
+        source = blobStore.path(key)
+        if not os.path.exists(source):
+            return None
+        with open(source, 'rb') as file:
+            head = file.read(4096)
     else:
-        return 'unknown'
+        data = blobStore.get(key)
+        if data is None:
+            return None
+        source, head = io.BytesIO(data), data[:4096]
+
+    # The first stored bytes decode to the header the mimetype is sniffed from
+    return source, mimeTypeFromHeader(codec.decompressor().decompress(head)[:12]), codec.contentEncoding
+
+def detectMimeType(path):
+    # Uploads are PDFs for papers and images for questions, sniff the first bytes to tell them apart
+    with open(path, 'rb') as file:
+        return mimeTypeFromHeader(file.read(12))
+
+def mimeTypeFromHeader(header):
+    if header.startswith(b'%PDF'):
+        return 'application/pdf'
+    if header.startswith(b'\x89PNG'):
+        return 'image/png'
+    if header.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if header.startswith(b'RIFF') and header[8:12] == b'WEBP':
+        return 'image/webp'
+    if header.startswith(b'GIF8'):
+        return 'image/gif'
+    return 'application/octet-stream'
+
+def getHash(storedData, codec=None):
+    # Get the compressed binary data whether it was stored as base64 text or a BLOB
+    compressedData = loadStoredFile(storedData)
+    # Decode it with the row's codec, in chunks so the original file is never held in memory
+    decompressor = getCodec(codec).decompressor()
+    digest = hashlib.sha256()
+    view = memoryview(compressedData)
+    for start in range(0, len(view), uploadChunkSize):
+        digest.update(decompressor.decompress(view[start:start + uploadChunkSize]))
+    digest.update(decompressor.flush())
+    return digest.hexdigest()
+
+def normalizeLevel(level, board=None):
+    """
+    Canonical level key stored in levelKey and used by every lookup.
+
+    Any A / AS level spelling ("A level", "AS Level", "A Levels", "as-level" ...) and anything on the
+    A Levels board becomes LEVEL_A_LEVEL, other levels keep their text ("11"), a missing level is None.
+    """
+    text = str(level).strip() if level is not None else ""
+    if board == "A Levels" or text.lower().replace("-", " ") in ("a level", "as level", "a levels", "as levels"):
+        return LEVEL_A_LEVEL
+    if isinstance(level, float) and level.is_integer():
+        return str(int(level))
+    return text or None
+
+def fillLevelKeys(connection, table, firstId=None, lastId=None):
+    """
+    Recompute levelKey for the rows of `table` (optionally only ids firstId..lastId) with normalizeLevel.
+
+    Returns:
+        int: Number of rows whose key changed
+    """
+    connection.create_function("normalizeLevel", 2, normalizeLevel, deterministic=True)
+    level = "level" if table != "topicals" else "NULL"
+    idRange = "AND id BETWEEN ? AND ?" if firstId is not None else ""
+    return connection.execute(f'''
+        UPDATE {table} SET levelKey = normalizeLevel({level}, board)
+        WHERE levelKey IS NOT normalizeLevel({level}, board) {idRange}
+    ''', (firstId, lastId) if idRange else ()).rowcount
+
+def parseYear(year):
+    """
+    Split a stored year label like "2023 (May / June)" into its parts.
+
+    Returns:
+        tuple: (year as int or None, session key from paperSessions or None)
+    """
+    label = str(year or "")
+    yearMatch = re.search(r"\d{4}", label)
+    session = next((key for key, name in paperSessions.items() if name.lower() in label.lower()), None)
+    return (int(yearMatch.group(0)) if yearMatch else None), session
+
+def formatYear(year, session=None):
+    """Build the year label shown on the site, formatYear(2023, "may-june") gives 2023 (May / June)"""
+    return f"{year} ({paperSessions[session]})" if session in paperSessions else str(year)
@@ -0,0 +1,235 @@
+import random
+import threading
+from array import array
+from bisect import bisect_right
+from collections import deque
+from itertools import accumulate
+
+from logHandler import getCustomLogger
+
+logger = getCustomLogger(__name__)
+
+# Columns a question bucket is keyed by, in key order
+bucketColumns = ("board", "subject", "levelKey", "topic", "component", "difficulty")
+
+
+class QuestionIndex:
+    """
+    In-memory index of approved question ids for the question generator.
+
+    Ids are grouped into one sorted array per (board, subject, levelKey, topic, component, difficulty)
+    bucket, so picking k questions only touches the matching buckets and k ids instead of
+    every matching row. The index is rebuilt whenever the content version changes, which
+    approve / delete bump, so every worker process notices changes made by the others.
+    """
+
+    def __init__(self, pool, versionFunction):
+        self.pool = pool
+        self.versionFunction = versionFunction
+
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._version = None
+
+    def _load(self):
+        buckets = {}
+        with self.pool.connection() as connection:
+            rows = connection.execute(f'''
+                SELECT id, {", ".join(bucketColumns)}
+                FROM questions
+                WHERE approved = 1
+                ORDER BY id
+            ''')
+            for questionId, *key in rows:
+                key = tuple(str(value) for value in key)
+                buckets.setdefault(key, array("q")).append(questionId)
+        return buckets
+
+    def buckets(self):
+        """Return the current buckets, reloading them first if the content changed"""
+        version = self.versionFunction()
+        with self._lock:
+            if version is None or version != self._version:
+                self._buckets = self._load()
+                self._version = version
+                logger.info(f"Question index rebuilt with {sum(len(ids) for ids in self._buckets.values())} questions in {len(self._buckets)} buckets")
+            return self._buckets
+
+    def matching(self, board, subject, levelKey, topics='ALL', components='ALL', difficulties='ALL'):
+        """
+        List the buckets matching the generator filters, 'ALL' or a list of allowed values each.
+
+        levelKey is the canonical level from normalizeLevel, so every A / AS level spelling matches.
+
+        Returns:
+            list: (key, ids) pairs in a stable order, so a seed always maps to the same questions
+        """
+        filters = [
+            {str(board)}, {str(subject)}, {str(levelKey)},
+            None if topics == 'ALL' else {str(value) for value in topics},
+            None if components == 'ALL' else {str(value) for value in components},
+            None if difficulties == 'ALL' else {str(value) for value in difficulties}
+        ]
+
+        return sorted(
+            (key, ids) for key, ids in self.buckets().items()
+            if all(allowed is None or value in allowed for value, allowed in zip(key, filters))
+        )
+
+    def sample(self, buckets, k, seed=None):
+        """
+        Draw k distinct question ids from the given buckets in O(k) after locating them.
+
+        Positions are drawn from the concatenation of the buckets without building it,
+        a binary search over the running bucket sizes maps a position back to its id.
+
+        Returns:
+            list: Question ids in sampled order
+        """
+        sizes = list(accumulate(len(ids) for _, ids in buckets))
+        total = sizes[-1] if sizes else 0
+
+        generator = random.Random(seed)
+        positions = generator.sample(range(total), min(k, total))
+
+        sampled = []
+        for position in positions:
+            bucket = bisect_right(sizes, position)
+            offset = position - (sizes[bucket - 1] if bucket else 0)
+            sampled.append(buckets[bucket][1][offset])
+        return sampled
+
+    def sampleBalanced(self, buckets, k, topicQuotas=None, difficultyQuotas=None, seed=None):
+        """
+        Draw k questions spread over topics and difficulties according to quotas.
+
+        Quotas map a topic / difficulty to a number of questions, anything left out is split
+        evenly over the remaining k. How many questions each (topic, difficulty) pair gets is
+        a transportation problem, solved as a max flow from the topics to the difficulties:
+
+            source -> topic (quota) -> difficulty (questions available) -> sink (quota)
+
+        The graph only has one node per topic and difficulty, so solving it takes the same time
+        whether the bank holds a hundred or a hundred thousand questions. When the quotas cannot
+        all be met the remaining places are filled with any other matching question.
+
+        Returns:
+            list: Question ids in a shuffled order
+        """
+        generator = random.Random(seed)
+
+        # Questions available per (topic, difficulty), summed over the components
+        cells = {}
+        for key, ids in buckets:
+            topic, difficulty = key[3], key[5]
+            cells.setdefault((topic, difficulty), []).append((key, ids))
+
+        topics = sorted({topic for topic, _ in cells})
+        difficulties = sorted({difficulty for _, difficulty in cells})
+        topicQuotas = fillQuotas(topicQuotas, topics, k)
+        difficultyQuotas = fillQuotas(difficultyQuotas, difficulties, k)
+
+        # Visiting the pairs in a seeded random order decides which of several equally good answers is used
+        pairs = list(cells)
+        generator.shuffle(pairs)
+
+        capacities = {("source", ("topic", topic)): quota for topic, quota in topicQuotas.items()}
+        capacities.update({(("difficulty", difficulty), "sink"): quota for difficulty, quota in difficultyQuotas.items()})
+        for topic, difficulty in pairs:
+            capacities[(("topic", topic), ("difficulty", difficulty))] = sum(len(ids) for _, ids in cells[(topic, difficulty)])
+
+        flow = maxFlow(capacities, "source", "sink")
+
+        sampled = []
+        for topic, difficulty in pairs:
+            count = flow.get((("topic", topic), ("difficulty", difficulty)), 0)
+            if count:
+                sampled.extend(self.sample(cells[(topic, difficulty)], count, generator.randrange(2 ** 32)))
+
+        # Quotas that could not be met are filled from whatever else matches
+        if len(sampled) < k:
+            chosen = set(sampled)
+            for questionId in self.sample(buckets, k + len(chosen), generator.randrange(2 ** 32)):
+                if len(sampled) >= k:
+                    break
+                if questionId not in chosen:
+                    sampled.append(questionId)
+
+        generator.shuffle(sampled)
+        return sampled
+
+    def stats(self):
+        with self._lock:
+            return {
+                "buckets": len(self._buckets),
+                "questions": sum(len(ids) for ids in self._buckets.values()),
+                "version": self._version
+            }
+
+
+def fillQuotas(quotas, keys, total):
+    """
+    Complete a quota mapping over keys.
+
+    Explicit quotas for keys not in the index are dropped, keys without a quota share
+    what is left of total evenly (the first ones get the remainder).
+    """
+    quotas = {str(key): max(int(quota), 0) for key, quota in (quotas or {}).items() if str(key) in keys}
+    remaining = [key for key in keys if key not in quotas]
+    left = max(total - sum(quotas.values()), 0)
+
+    for index, key in enumerate(remaining):
+        quotas[key] = left // len(remaining) + (1 if index < left % len(remaining) else 0)
+    return quotas
+
+
+def maxFlow(capacities, source, sink):
+    """
+    Edmonds-Karp max flow over a small graph.
+
+    Args:
+        capacities: {(node, node): capacity} for every directed edge
+        source: Start node
+        sink: End node
+
+    Returns:
+        dict: Flow on every edge of capacities that carries any
+    """
+    residual = {}
+    neighbours = {}
+    for (start, end), capacity in capacities.items():
+        residual[(start, end)] = residual.get((start, end), 0) + capacity
+        residual.setdefault((end, start), 0)
+        neighbours.setdefault(start, []).append(end)
+        neighbours.setdefault(end, []).append(start)
+
+    while True:
+        # Shortest augmenting path by breadth first search
+        parents = {source: None}
+        queue = deque([source])
+        while queue and sink not in parents:
+            node = queue.popleft()
+            for neighbour in neighbours.get(node, []):
+                if neighbour not in parents and residual[(node, neighbour)] > 0:
+                    parents[neighbour] = node
+                    queue.append(neighbour)
+
+        if sink not in parents:
+            break
+
+        path = []
+        node = sink
+        while parents[node] is not None:
+            path.append((parents[node], node))
+            node = parents[node]
+
+        bottleneck = min(residual[edge] for edge in path)
+        for start, end in path:
+            residual[(start, end)] -= bottleneck
+            residual[(end, start)] += bottleneck
+
+    return {
+        edge: capacity - residual[edge]
+        for edge, capacity in capacities.items()
+        if capacity - residual[edge] > 0
+    }
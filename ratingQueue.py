@@ -0,0 +1,152 @@
+import atexit
+import threading
+import time
+
+from logHandler import getCustomLogger
+
+logger = getCustomLogger(__name__)
+
+
+class RatingQueue:
+    """
+    Write-behind buffer for rating submissions.
+
+    Ratings are held in memory keyed by (user, question), so a user changing their mind before
+    the next flush costs nothing, and written by a background thread in one transaction every
+    flushInterval seconds or as soon as maxPending ratings are waiting. A whole class rating the
+    same paper then takes a handful of commits instead of one per rating. Pending ratings are
+    flushed on interpreter exit, a crash loses at most flushInterval seconds of them.
+    """
+
+    def __init__(self, flushFunction, flushInterval=2.0, maxPending=500):
+        """
+        Args:
+            flushFunction: Called with a list of (user, question_UUID, rating), returns the number
+                           saved or None when the write failed and should be retried
+            flushInterval: Seconds between flushes
+            maxPending: Pending ratings that trigger an early flush
+        """
+        self.flushFunction = flushFunction
+        self.flushInterval = flushInterval
+        self.maxPending = maxPending
+
+        self._pending = {}
+        self._lock = threading.Lock()
+        # Only one flush at a time, the timer and close() can race otherwise
+        self._flushLock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = None
+
+        self.counters = {
+            "enqueued": 0,
+            "coalesced": 0,
+            "flushed": 0,
+            "flushes": 0,
+            "failures": 0,
+            "lastFlushMs": 0.0,
+            "maxFlushMs": 0.0,
+            "totalFlushMs": 0.0
+        }
+
+    def _start(self):
+        # Started on first use, so scripts importing the database module don't get a stray thread
+        self._thread = threading.Thread(target=self._run, name="rating-queue", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def put(self, user, ratings):
+        """
+        Queue a user's ratings.
+
+        Args:
+            user: The rating user
+            ratings: (question_UUID, rating) pairs
+
+        Returns:
+            int: Number of ratings queued
+        """
+        if self._closed:
+            # Shutting down, nothing would flush them any more
+            return self.flushFunction([(user, question_UUID, rating) for question_UUID, rating in ratings]) or 0
+
+        with self._lock:
+            if self._thread is None:
+                self._start()
+
+            queued = 0
+            for question_UUID, rating in ratings:
+                key = (user, str(question_UUID))
+                if key in self._pending:
+                    self.counters["coalesced"] += 1
+                self._pending[key] = rating
+                queued += 1
+            self.counters["enqueued"] += queued
+
+            if len(self._pending) >= self.maxPending:
+                self._wake.set()
+        return queued
+
+    def flush(self):
+        """
+        Write everything pending now.
+
+        Returns:
+            int: Number of ratings saved, 0 when there was nothing to write or the write failed
+        """
+        with self._flushLock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+
+            started = time.perf_counter()
+            try:
+                saved = self.flushFunction([(user, question_UUID, rating) for (user, question_UUID), rating in batch.items()])
+            except Exception as e:
+                logger.error(f"Error flushing ratings: {e}")
+                saved = None
+            elapsed = (time.perf_counter() - started) * 1000
+
+            with self._lock:
+                self.counters["flushes"] += 1
+                self.counters["lastFlushMs"] = round(elapsed, 2)
+                self.counters["maxFlushMs"] = round(max(self.counters["maxFlushMs"], elapsed), 2)
+                self.counters["totalFlushMs"] += elapsed
+
+                if saved is None:
+                    # Put the batch back for the next flush, ratings given meanwhile are newer and win
+                    self.counters["failures"] += 1
+                    for key, rating in batch.items():
+                        self._pending.setdefault(key, rating)
+                    return 0
+
+                self.counters["flushed"] += len(batch)
+            return saved
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.flushInterval)
+            self._wake.clear()
+            self.flush()
+
+    def close(self):
+        """Stop the background thread and write what is left"""
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flushInterval + 5)
+        self.flush()
+        logger.info("Rating queue closed")
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self.counters)
+            snapshot["depth"] = len(self._pending)
+        snapshot["totalFlushMs"] = round(snapshot["totalFlushMs"], 2)
+        snapshot["averageFlushMs"] = round(snapshot["totalFlushMs"] / snapshot["flushes"], 2) if snapshot["flushes"] else 0.0
+        snapshot["flushInterval"] = self.flushInterval
+        snapshot["maxPending"] = self.maxPending
+        return snapshot
@@ -48,6 +48,18 @@ function renderData(data) {
   })
 }
 
+// Uploads are compressed in the background, they can't be approved until the files are ready
+function fileStateLine(item) {
+  if (!item.fileState || item.fileState === 'ready') return '';
+  return `<h2 style='color: #e0a800;'><strong>Files:</strong> ${item.fileState}</h2>`;
+}
+
+// Another submission has the same question file, its page shows which one
+function duplicateLine(item) {
+  if (!item.duplicateOf) return '';
+  return `<h2 style='color: #f44336;'><strong>Same file as:</strong> ${item.duplicateOf}</h2>`;
+}
+
 // Function to create a question card (unchanged)
 function createQuestionCard(question, count) {
   const card = document.createElement("div");
@@ -67,6 +79,8 @@ function createQuestionCard(question, count) {
                     <h2 style='color: #5d71e0;'><strong>Submitted by:</strong> ${question.submittedBy}</h2>
                     <h2><strong>Submitted on:</strong> ${question.submittedOn}</h2>
                     <h2><strong>UUID:</strong> ${question.uuid}</h2>
+                    ${fileStateLine(question)}
+                    ${duplicateLine(question)}
                     </a>
                 `;
   card.appendChild(questionDetailsDiv);
@@ -90,6 +104,8 @@ function createPaperCard(paper, count) {
                     <h2 style='color: #F25C6A;'><strong>Submitted by:</strong> ${paper.submittedBy}</h2>
                     <h2><strong>Submitted on:</strong> ${paper.submittedOn}</h2>
                     <h2><strong>UUID:</strong> ${paper.uuid}</h2>
+                    ${fileStateLine(paper)}
+                    ${duplicateLine(paper)}
                     </a>
                 `;
   card.appendChild(paperDetailsDiv);
@@ -108,6 +124,8 @@ function createTopicalCard(topical, count){
                     <h2 style='color: #F25C6A;'><strong>Submitted by:</strong> ${topical.submittedBy}</h2>
                     <h2><strong>Submitted on:</strong> ${topical.submittedOn}</h2>
                     <h2><strong>UUID:</strong> ${topical.uuid}</h2>
+                    ${fileStateLine(topical)}
+                    ${duplicateLine(topical)}
                     </a>
                 `;
   card.appendChild(topicalDetailsDiv);
@@ -7,6 +7,15 @@ document.addEventListener("DOMContentLoaded", function () {
   let currentPage = 1;
   const totalPages = Math.ceil(questionItems.length / itemsPerPage);
 
+  // Images are fetched from /files/<uuid>/... only once they are about to be shown
+  function loadImage(element) {
+    if (!element || element.dataset.loaded) return;
+    const imageUrl = element.getAttribute("data-lazy-src");
+    if (!imageUrl) return;
+    element.dataset.loaded = "true";
+    renderImageFromUrl(element, imageUrl);
+  }
+
   const prevPageBtn = document.getElementById("prevPage");
   const nextPageBtn = document.getElementById("nextPage");
   const pageInfo = document.getElementById("pageInfo");
@@ -17,7 +26,9 @@ document.addEventListener("DOMContentLoaded", function () {
     const end = start + itemsPerPage;
 
     questionItems.forEach((item, index) => {
-      item.style.display = index >= start && index < end ? "block" : "none";
+      const visible = index >= start && index < end;
+      item.style.display = visible ? "block" : "none";
+      if (visible) loadImage(item.querySelector(".question-image"));
     });
 
     prevPageBtn.disabled = page === 1;
@@ -49,7 +60,10 @@ document.addEventListener("DOMContentLoaded", function () {
       const questionContainer = document.querySelector(`#question-container-${questionId}`);
 
       questionContainers.forEach((container) => (container.style.display = "none"));
-      if (questionContainer) questionContainer.style.display = "flex";
+      if (questionContainer) {
+        questionContainer.style.display = "flex";
+        loadImage(questionContainer.querySelector(".question-image"));
+      }
     });
   });
 
@@ -93,6 +107,7 @@ document.addEventListener("DOMContentLoaded", function () {
 
         // Check if solution is missing
         const solutionImage = solutionContainer.querySelector(".solution-image");
+        loadImage(solutionImage);
         if (solutionImage && !solutionImage.querySelector("img")) {
           solutionImage.innerHTML = '<div class="solution-not-found">Solution not found!</div>';
         }
@@ -1,48 +1,31 @@
-// Image rendering function
-function renderImageFromElement(element, base64Data) {
-  if (!element || !base64Data) {
-    element.innerHTML = `
-      <div class="error-message" style="
-        background-color: #f8d7da;
-        color: #721c24;
-        padding: 15px;
-        border-radius: 5px;
-        text-align: center;
-        border: 1px solid #f5c6cb;
-      ">
-        <strong>🚫 Image Unavailable</strong>
-        <p>Unfortunately, no image data could be found for this content.</p>
-      </div>
-    `;
-    return;
-  }
-
-  try {
-    const decoded = decodeURIComponent(base64Data);
-    const cleaned = cleanBase64(decoded);
-    const binaryString = atob(cleaned);
-    const uint8Array = new Uint8Array(
-      binaryString.split("").map((char) => char.charCodeAt(0)),
-    );
-    const decompressedData = pako.inflate(uint8Array);
-    const blob = new Blob([decompressedData], {
-      type: "image/png",
-    });
-    const imageUrl = URL.createObjectURL(blob);
-
-    const imgElement = document.createElement("img");
-    imgElement.src = imageUrl;
-    imgElement.style.maxWidth = "100%";
-    imgElement.style.height = "auto";
-    imgElement.style.display = "block";
-    imgElement.style.margin = "0 auto";
+// Shown when an element has no file to load
+function renderImageUnavailable(element) {
+  element.innerHTML = `
+    <div class="error-message" style="
+      background-color: #f8d7da;
+      color: #721c24;
+      padding: 15px;
+      border-radius: 5px;
+      text-align: center;
+      border: 1px solid #f5c6cb;
+    ">
+      <strong>🚫 Image Unavailable</strong>
+      <p>Unfortunately, no image data could be found for this content.</p>
+    </div>
+  `;
+}
 
-    element.textContent = "";
-    element.appendChild(imgElement);
+// Image rendering from a /files/... URL, the browser fetches and caches it on its own
+function renderImageFromUrl(element, imageUrl) {
+  const imgElement = document.createElement("img");
+  imgElement.src = imageUrl;
+  imgElement.loading = "lazy";
+  imgElement.style.maxWidth = "100%";
+  imgElement.style.height = "auto";
+  imgElement.style.display = "block";
+  imgElement.style.margin = "0 auto";
 
-    imgElement.onload = () => URL.revokeObjectURL(imageUrl);
-  } catch (error) {
-    console.error("Failed to render image:", error);
+  imgElement.onerror = () => {
     element.innerHTML = `
       <div class="error-message" style="
         background-color: #f8d7da;
@@ -56,12 +39,15 @@ function renderImageFromElement(element, base64Data) {
         <p>We couldn't load the image. The file might be damaged or incomplete.</p>
       </div>
     `;
-  }
+  };
+
+  element.textContent = "";
+  element.appendChild(imgElement);
 }
 
 // PDF rendering function with image fallback
-async function renderPDFElement(element, base64Data) {
-  if (!element || !base64Data) {
+async function renderPDFElement(element, pdfUrl) {
+  if (!element || !pdfUrl) {
     element.innerHTML = `
       <div class="error-message" style="
         background-color: #f8d7da;
@@ -79,17 +65,8 @@ async function renderPDFElement(element, base64Data) {
   }
 
   try {
-    const binaryData = atob(base64Data);
-    const uint8Array = new Uint8Array(
-      binaryData.split("").map((char) => char.charCodeAt(0)),
-    );
-    const decompressedData = pako.inflate(uint8Array);
-    let binary = "";
-    decompressedData.forEach((byte) => {
-      binary += String.fromCharCode(byte);
-    });
-    const base64PDF = btoa(binary);
-    const pdfDataUrl = `data:application/pdf;base64,${base64PDF}`;
+    // The server streams the PDF from /files/<uuid>/<type>, no decoding needed here
+    const pdfDataUrl = pdfUrl;
 
     // Create container for PDF or images
     const container = document.createElement("div");
@@ -104,27 +81,7 @@ async function renderPDFElement(element, base64Data) {
     object.height = "100%";
     object.data = pdfDataUrl;
 
-// Get the download buttons
-const downloadQuestion = document.querySelector(".download-question");
-const downloadSolution = document.querySelector(".download-solution");
-
-// Assuming `pdfDataUrl` is available in your scope
-
-// Check if it's the question PDF
-if (downloadQuestion && element.classList.contains("question-pdf")) {
-  downloadQuestion.setAttribute(
-    "onclick",
-    `downloadFile("${pdfDataUrl}", "question.pdf");`  // Pass pdfDataUrl as a string
-  );
-}
-
-// Check if it's the solution PDF
-if (downloadSolution && element.classList.contains("solution-pdf")) {
-  downloadSolution.setAttribute(
-    "onclick",
-    `downloadFile("${pdfDataUrl}", "solution.pdf");`  // Pass pdfDataUrl as a string
-  );
-}
+    setDownloadButton(element, pdfDataUrl);
 
 
     // Add fallback handling
@@ -176,7 +133,7 @@ if (downloadSolution && element.classList.contains("solution-pdf")) {
         container.appendChild(loadingIndicator);
 
         // Load the PDF document
-        const loadingTask = pdfjsLib.getDocument({ data: decompressedData });
+        const loadingTask = pdfjsLib.getDocument({ url: pdfUrl });
         const pdf = await loadingTask.promise;
 
         // Create scrollable container for images
@@ -281,6 +238,26 @@ if (downloadSolution && element.classList.contains("solution-pdf")) {
   }
 }
 
+// Point the matching download button at the PDF url
+function setDownloadButton(element, pdfUrl) {
+  const downloadQuestion = document.querySelector(".download-question");
+  const downloadSolution = document.querySelector(".download-solution");
+
+  if (downloadQuestion && element.classList.contains("question-pdf")) {
+    downloadQuestion.setAttribute(
+      "onclick",
+      `downloadFile("${pdfUrl}", "question.pdf");`
+    );
+  }
+
+  if (downloadSolution && element.classList.contains("solution-pdf")) {
+    downloadSolution.setAttribute(
+      "onclick",
+      `downloadFile("${pdfUrl}", "solution.pdf");`
+    );
+  }
+}
+
 // Helper function to load PDF.js library
 async function loadPDFJS() {
   return new Promise((resolve, reject) => {
@@ -299,14 +276,28 @@ document.addEventListener("DOMContentLoaded", () => {
   document
     .querySelectorAll(".question-image, .solution-image")
     .forEach((element) => {
-      const base64Data = element.getAttribute("data-compressed");
-      renderImageFromElement(element, base64Data);
+      // data-lazy-src images are loaded by the page itself once they are shown
+      if (element.hasAttribute("data-lazy-src")) {
+        return;
+      }
+
+      // Files come decoded from /files/..., or compressed with a Content-Encoding the browser undoes itself
+      const imageUrl = element.getAttribute("data-src");
+      if (imageUrl) {
+        renderImageFromUrl(element, imageUrl);
+        return;
+      }
+      renderImageUnavailable(element);
     });
 
-  // Initialize PDFs
+  // Initialize PDFs, pages with server rendered thumbnails keep their images and only need the download button
   document.querySelectorAll(".paper-pdf").forEach((element) => {
-    const base64Data = element.getAttribute("data-compressed");
-    renderPDFElement(element, base64Data);
+    const pdfUrl = element.getAttribute("data-src");
+    if (element.dataset.thumbnails === "true") {
+      setDownloadButton(element, pdfUrl);
+      return;
+    }
+    renderPDFElement(element, pdfUrl);
   });
 });
 
@@ -318,12 +309,3 @@ function downloadFile(dataUrl, filename) {
   anchor.click();  // Trigger the download
   anchor.remove(); // Clean up
 }
-
-// Utility function for base64 handling
-function cleanBase64(str) {
-  str = str.replace(/[^A-Za-z0-9+/=]/g, "");
-  if (str.length % 4 !== 0) {
-    str = str.padEnd(str.length + (4 - (str.length % 4)), "=");
-  }
-  return str;
-}
@@ -43,7 +43,7 @@ const commonOptions = {
 
 // Create overall stats chart
 const overallCtx = document.getElementById('overallChart');
-new Chart(overallCtx, {
+const overallChart = new Chart(overallCtx, {
     type: 'bar',
     data: {
         labels: ['Questions', 'Papers', 'Topicals'],
@@ -84,6 +84,9 @@ new Chart(overallCtx, {
     }
 });
 
+// Per-level charts, kept so refreshStats can update them
+const levelCharts = [];
+
 // Create per-level subject distribution charts for each board
 Object.keys(statsData.byBoard).forEach(board => {
     const boardData = statsData.byBoard[board];
@@ -112,7 +115,7 @@ Object.keys(statsData.byBoard).forEach(board => {
             levelLabel = "Level " + level;
         }
 
-        new Chart(canvas, {
+        const chart = new Chart(canvas, {
             type: 'bar',
             data: {
                 labels: subjects,
@@ -184,5 +187,37 @@ Object.keys(statsData.byBoard).forEach(board => {
                 }
             }
         });
+        levelCharts.push({ board, level, subjects, chart });
     });
-});
\ No newline at end of file
+});
+
+// Per-level chart datasets in order
+const subjectFields = ['approved', 'unapproved', 'approvedPapers', 'unapprovedPapers', 'approvedTopicals', 'unapprovedTopicals'];
+
+// Poll for live numbers, the endpoint answers 304 until something is submitted, approved or deleted
+function refreshStats() {
+    if (document.hidden) return;
+
+    fetch('/stats/data', { cache: 'no-cache' })
+        .then(response => response.ok ? response.json() : null)
+        .then(data => {
+            if (!data || !data.overall) return;
+
+            overallChart.data.datasets[0].data = ['questions', 'papers', 'topicals'].map(type => data.overall[type].approved);
+            overallChart.data.datasets[1].data = ['questions', 'papers', 'topicals'].map(type => data.overall[type].unapproved);
+            overallChart.update();
+
+            levelCharts.forEach(({ board, level, subjects, chart }) => {
+                const levelData = data.byBoard[board] && data.byBoard[board].levels[level];
+                if (!levelData) return;
+
+                subjectFields.forEach((field, index) => {
+                    chart.data.datasets[index].data = subjects.map(subject => (levelData.subjects[subject] || {})[field]);
+                });
+                chart.update();
+            });
+        })
+        .catch(error => console.error('Error refreshing stats:', error));
+}
+
+setInterval(refreshStats, 30000);
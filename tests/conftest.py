@@ -0,0 +1,59 @@
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+# The database module opens ./instance, ./logs and ./configs relative to the working directory,
+# so the tests run from a scratch folder instead of touching the real instance
+repoPath = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+workPath = tempfile.mkdtemp(prefix="paper-guides-tests-")
+shutil.copytree(os.path.join(repoPath, "configs"), os.path.join(workPath, "configs"))
+os.chdir(workPath)
+sys.path.insert(0, repoPath)
+
+# Compress uploads on the calling thread, so a stored file is ready as soon as the insert returns
+os.environ["INGEST_WORKERS"] = "0"
+os.environ["BLOB_STORE"] = "local"
+os.environ.pop("DISCORD_WEBHOOK_URL", None)
+os.environ.setdefault("SECRET_KEY", "test")
+os.environ["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{os.path.join(workPath, 'users.db')}"
+
+
+@pytest.fixture(scope="session")
+def database():
+    """paperGuidesDB with its tables created in the scratch folder"""
+    import paperGuidesDB
+    paperGuidesDB.createDatabase()
+    return paperGuidesDB
+
+
+@pytest.fixture(scope="session")
+def webApp(database):
+    """app.py's Flask app, with an admin account for adminClient"""
+    import app
+    from models import User, db
+
+    with app.app.app_context():
+        db.session.add(User(username="admin", password="x", role="admin", email="admin@example.com"))
+        db.session.commit()
+    return app
+
+
+@pytest.fixture
+def adminClient(webApp):
+    """Test client logged in as the admin account"""
+    from models import User
+
+    client = webApp.app.test_client()
+    with webApp.app.app_context():
+        adminId = User.query.filter_by(username="admin").one().id
+    with client.session_transaction() as session:
+        session["_user_id"] = str(adminId)
+    return client
+
+
+def pytest_sessionfinish(session, exitstatus):
+    os.chdir(repoPath)
+    shutil.rmtree(workPath, ignore_errors=True)
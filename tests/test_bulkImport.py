@@ -0,0 +1,160 @@
+import io
+import json
+import os
+import time
+import zipfile
+
+import pytest
+
+import bulkImport
+from bulkImport import DirectorySource, ZipSource, importPapers, readManifest
+
+csvHeader = "Question,Solution,Board,Subject,Year,Session,Component,Level\n"
+
+
+def pdf():
+    return b'%PDF-1.4 ' + os.urandom(32)
+
+
+def makeZip(files):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+    buffer.seek(0)
+    return buffer
+
+
+def csvRow(question, solution, component, subject='Physics'):
+    return f"{question},{solution},CAIE,{subject},2024,May / June,{component},A Levels\n"
+
+
+def testReadCsvManifest():
+    data = ("\ufeff" + csvHeader + "q.pdf, s.pdf ,CAIE,Physics,2024,,12,A Levels\n").encode("utf-8")
+
+    entries = readManifest(io.BytesIO(data), "manifest.csv")
+
+    assert entries == [{
+        "question": "q.pdf", "solution": "s.pdf", "board": "CAIE", "subject": "Physics",
+        "year": "2024", "session": None, "component": "12", "level": "A Levels"
+    }]
+
+
+def testReadJsonManifest():
+    data = json.dumps([{"question": "q.pdf", "solution": "s.pdf", "Year": 2024, "component": 12}]).encode()
+
+    entry, = readManifest(io.BytesIO(data), "papers.JSON")
+
+    assert entry["year"] == "2024" and entry["component"] == "12"
+    assert entry["board"] is None and entry["session"] is None
+
+
+def testJsonManifestMustBeAList():
+    with pytest.raises(ValueError):
+        readManifest(io.BytesIO(b'{"question": "q.pdf"}'), "manifest.json")
+
+
+def testZipSourceFindsItsManifest():
+    source = ZipSource(makeZip({
+        "q.pdf": b"question",
+        "manifest.json": json.dumps([{"question": "q.pdf"}])
+    }))
+    try:
+        assert source.exists("q.pdf") and not source.exists("s.pdf")
+        with source.open("q.pdf") as file:
+            assert file.read() == b"question"
+        assert source.manifest()[0]["question"] == "q.pdf"
+    finally:
+        source.close()
+
+
+def testDirectorySourceStaysInsideItsFolder(tmp_path):
+    (tmp_path / "season").mkdir()
+    (tmp_path / "season" / "manifest.csv").write_text(csvHeader + csvRow("q.pdf", "s.pdf", "12"))
+    (tmp_path / "outside.pdf").write_bytes(b"secret")
+    source = DirectorySource(tmp_path / "season")
+
+    assert source.manifest()[0]["component"] == "12"
+    assert not source.exists("../outside.pdf")
+    with pytest.raises(ValueError):
+        source.open("../outside.pdf")
+
+
+def testDuplicatesInTheBatchAreRejected(database, tmp_path):
+    question = pdf()
+    (tmp_path / "q1.pdf").write_bytes(question)
+    (tmp_path / "q2.pdf").write_bytes(question)
+    (tmp_path / "s1.pdf").write_bytes(pdf())
+    (tmp_path / "s2.pdf").write_bytes(pdf())
+    entries = readManifest(io.BytesIO((csvHeader + csvRow("q1.pdf", "s1.pdf", "11") + csvRow("q2.pdf", "s2.pdf", "21")
+                                       + csvRow("gone.pdf", "s1.pdf", "31")).encode()), "manifest.csv")
+
+    results = importPapers(DirectorySource(tmp_path), entries, "admin", "127.0.0.1", approve=True)
+
+    first, second, missing = results
+    assert first["status"] == "approved" and database.get_paper(first["uuid"], includeFiles=False)["approved"]
+    assert second["status"] == "duplicate" and second["uuid"] is None and second["error"] == "same question paper as row 1"
+    assert missing["status"] == "invalid" and missing["error"] == "question file gone.pdf not found"
+
+
+def testApprovalWaitsOnOneDeadline(database, tmp_path, monkeypatch):
+    rows = ""
+    for index in range(3):
+        (tmp_path / f"q{index}.pdf").write_bytes(pdf())
+        (tmp_path / f"s{index}.pdf").write_bytes(pdf())
+        rows += csvRow(f"q{index}.pdf", f"s{index}.pdf", str(41 + index))
+    timeouts = []
+
+    def slowWait(table, uuidStr, timeout):
+        timeouts.append(timeout)
+        time.sleep(0.05)
+        return 'ready'
+
+    monkeypatch.setattr(bulkImport, 'waitForFiles', slowWait)
+    importPapers(DirectorySource(tmp_path), readManifest(io.BytesIO((csvHeader + rows).encode()), "manifest.csv"),
+                 "admin", "127.0.0.1", approve=True, waitTimeout=5)
+
+    assert len(timeouts) == 3
+    assert 5 >= timeouts[0] > timeouts[1] + 0.04 > timeouts[2] + 0.08
+
+
+def waitForImport(adminClient, status):
+    for _ in range(100):
+        job = adminClient.get(status).get_json()
+        if job["state"] != "running":
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"import {status} still running")
+
+
+def testAdminImportRunsInTheBackground(adminClient, database):
+    archive = makeZip({
+        "q.pdf": pdf(),
+        "s.pdf": pdf(),
+        "manifest.csv": csvHeader + csvRow("q.pdf", "s.pdf", "12", subject="Chemistry")
+    })
+
+    response = adminClient.post('/admin/import', data={"archive": (archive, "season.zip")}, content_type='multipart/form-data')
+
+    assert response.status_code == 202
+    job = waitForImport(adminClient, response.get_json()["status"])
+    assert job["state"] == "finished" and job["summary"] == {"submitted": 1}
+    assert not database.get_paper(job["results"][0]["uuid"], includeFiles=False)["approved"]
+
+
+@pytest.mark.parametrize("files, error", [
+    ({"archive": (io.BytesIO(b"not a zip"), "season.zip")}, "The archive is not a ZIP file"),
+    ({"archive": (makeZip({"q.pdf": b"question"}), "season.zip")}, "No manifest uploaded or found in the archive"),
+    ({"archive": (makeZip({"q.pdf": b"question"}), "season.zip"),
+      "manifest": (io.BytesIO(b'{"question": "q.pdf"}'), "manifest.json")}, "Invalid manifest: A JSON manifest must be a list of papers"),
+    ({}, "No archive uploaded")
+])
+def testAdminImportRejectsBadUploads(adminClient, files, error):
+    response = adminClient.post('/admin/import', data=files, content_type='multipart/form-data')
+
+    assert response.status_code == 400
+    assert response.get_json() == {"error": error}
+
+
+def testUnknownImportIsNotFound(adminClient):
+    assert adminClient.get('/admin/import/missing').status_code == 404
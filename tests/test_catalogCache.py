@@ -0,0 +1,98 @@
+import pytest
+
+from catalogCache import CatalogCache
+
+
+class Versions:
+    """Stands in for the meta table, counting the reads"""
+
+    def __init__(self):
+        self.values = {}
+        self.reads = 0
+
+    def __call__(self, table):
+        self.reads += 1
+        return self.values.get(table, 0)
+
+
+@pytest.fixture
+def versions():
+    return Versions()
+
+
+def makeLookup(cache, table, calls):
+    @cache.memoize(lambda subject: (table, "a-level", subject, None))
+    def lookup(subject):
+        calls.append(subject)
+        return [subject]
+    return lookup
+
+
+def testHitsReuseTheVersionRead(versions):
+    cache = CatalogCache(versionFunction=versions, versionInterval=60)
+    calls = []
+    lookup = makeLookup(cache, "papers", calls)
+
+    for _ in range(5):
+        assert lookup("Physics") == ["Physics"]
+    assert calls == ["Physics"]
+    assert versions.reads == 1
+
+
+def testOtherTablesDontDropEntries(versions):
+    cache = CatalogCache(versionFunction=versions, versionInterval=0)
+    calls = []
+    papers = makeLookup(cache, "papers", calls)
+
+    papers("Physics")
+    versions.values["topicals"] = 1
+    papers("Physics")
+    assert calls == ["Physics"]
+
+    versions.values["papers"] = 1
+    papers("Physics")
+    assert calls == ["Physics", "Physics"]
+    assert cache.stats()["staleVersions"] == 1
+
+
+def testOtherWorkersChangesShowAfterTheInterval(versions, monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("catalogCache.time.monotonic", lambda: now[0])
+    cache = CatalogCache(versionFunction=versions, versionInterval=1)
+    calls = []
+    lookup = makeLookup(cache, "papers", calls)
+
+    lookup("Physics")
+    versions.values["papers"] = 1
+    now[0] += 0.5
+    lookup("Physics")
+    assert calls == ["Physics"]
+
+    now[0] += 1
+    lookup("Physics")
+    assert calls == ["Physics", "Physics"]
+
+
+def testInvalidateReadsTheVersionAgain(versions):
+    cache = CatalogCache(versionFunction=versions, versionInterval=60)
+    calls = []
+    lookup = makeLookup(cache, "papers", calls)
+
+    lookup("Physics")
+    versions.values["papers"] = 1
+    cache.invalidate("papers", "Physics")
+    lookup("Physics")
+    lookup("Physics")
+
+    assert calls == ["Physics", "Physics"]
+    assert versions.reads == 2
+
+
+def testNothingIsCachedWithoutAVersion():
+    cache = CatalogCache(versionFunction=lambda table: None)
+    calls = []
+    lookup = makeLookup(cache, "papers", calls)
+
+    lookup("Physics")
+    lookup("Physics")
+    assert calls == ["Physics", "Physics"]
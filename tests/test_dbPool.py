@@ -0,0 +1,149 @@
+import os
+import sqlite3
+import threading
+
+import pytest
+
+from dbPool import ConnectionPool
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "pool.db"), size=2, timeout=0.2)
+    with pool.connection() as connection:
+        connection.execute("CREATE TABLE items (name TEXT)")
+    yield pool
+    pool.close()
+
+
+def names(pool):
+    with pool.connection() as connection:
+        return [row[0] for row in connection.execute("SELECT name FROM items ORDER BY rowid")]
+
+
+def testNestedBlocksShareTheConnection(pool):
+    with pool.connection() as outer:
+        with pool.connection(rowFactory=sqlite3.Row) as inner:
+            assert inner is outer
+            assert inner.row_factory is sqlite3.Row
+        assert outer.row_factory is None
+    assert pool.stats()["checkouts"] == 2  # the fixture's block and the outer one
+
+
+def testOuterBlockCommitsNestedWrites(pool):
+    with pool.connection() as outer:
+        with pool.connection() as inner:
+            inner.execute("INSERT INTO items VALUES ('nested')")
+        # The nested block left the transaction open for the outer one
+        assert outer.in_transaction
+    assert names(pool) == ["nested"]
+
+
+def testErrorRollsBackTheWholeBlock(pool):
+    with pytest.raises(RuntimeError):
+        with pool.connection() as outer:
+            outer.execute("INSERT INTO items VALUES ('outer')")
+            with pool.connection() as inner:
+                inner.execute("INSERT INTO items VALUES ('inner')")
+                raise RuntimeError("failed")
+    assert names(pool) == []
+
+
+def testThreadsGetTheirOwnConnection(pool):
+    seen = []
+
+    def check():
+        with pool.connection() as connection:
+            seen.append(connection)
+
+    with pool.connection() as mine:
+        thread = threading.Thread(target=check)
+        thread.start()
+        thread.join()
+        assert seen[0] is not mine
+    assert pool.stats()["open"] == 2
+
+
+def testExhaustedPoolTimesOut(pool):
+    release = threading.Event()
+    holding = threading.Barrier(3)
+
+    def hold():
+        with pool.connection():
+            holding.wait()
+            release.wait()
+
+    threads = [threading.Thread(target=hold) for _ in range(pool.size)]
+    for thread in threads:
+        thread.start()
+    holding.wait()
+
+    with pytest.raises(sqlite3.OperationalError, match="Timed out"):
+        with pool.connection():
+            pass
+    assert pool.stats()["timeouts"] == 1
+
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert names(pool) == []
+    assert pool.stats()["open"] == pool.size
+
+
+def testWaiterGetsTheReleasedConnection(pool):
+    pool.timeout = 5
+    holding = threading.Barrier(3)
+    release = threading.Event()
+
+    def hold():
+        with pool.connection():
+            holding.wait()
+            release.wait(0.1)
+
+    threads = [threading.Thread(target=hold) for _ in range(pool.size)]
+    for thread in threads:
+        thread.start()
+    holding.wait()
+
+    assert names(pool) == []
+    for thread in threads:
+        thread.join()
+    assert pool.stats()["waits"] == 1
+
+
+def testBrokenConnectionIsReplaced(pool):
+    with pool.connection() as connection:
+        broken = connection
+    broken.close()
+
+    with pool.connection() as connection:
+        assert connection is not broken
+        connection.execute("INSERT INTO items VALUES ('after')")
+    assert pool.stats()["reconnects"] == 1
+    assert names(pool) == ["after"]
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def testForkedChildOpensItsOwnConnections(pool):
+    with pool.connection() as connection:
+        parentConnection = connection
+
+    readEnd, writeEnd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            with pool.connection() as connection:
+                connection.execute("INSERT INTO items VALUES ('child')")
+                ok = connection is not parentConnection and pool.stats()["opened"] == 1
+        except BaseException:
+            ok = False
+        os.write(writeEnd, b"1" if ok else b"0")
+        os._exit(0)
+
+    os.close(writeEnd)
+    result = os.read(readEnd, 1)
+    os.close(readEnd)
+    os.waitpid(pid, 0)
+
+    assert result == b"1"
+    assert names(pool) == ["child"]
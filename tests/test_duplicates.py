@@ -0,0 +1,73 @@
+import hashlib
+import os
+
+
+def uniqueFile(prefix):
+    return prefix + os.urandom(16)
+
+
+def countRows(database, table):
+    with database.pool.connection() as connection:
+        return connection.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+
+def testResubmittedPaperIsTurnedAway(database):
+    questionFile = uniqueFile(b'%PDF-1.4 paper ')
+    ok, paperUuid = database.insertPaper('CAIE', 'Physics', '2023', 'A Levels', '12', questionFile, uniqueFile(b'%PDF-1.4 '), 'tester', '127.0.0.1')
+    assert ok
+    rows = countRows(database, 'papers')
+
+    ok, duplicate = database.insertPaper('CAIE', 'Physics', '2021', 'A Levels', '22', questionFile, uniqueFile(b'%PDF-1.4 '), 'tester', '127.0.0.1')
+    assert not ok
+    assert duplicate['uuid'] == paperUuid
+    assert (str(duplicate['year']), duplicate['component']) == ('2023', '12')
+    assert countRows(database, 'papers') == rows
+    assert os.listdir(database.uploadSpoolPath) == []
+
+
+def testResubmittedQuestionAndTopicalAreTurnedAway(database):
+    questionFile = uniqueFile(b'\x89PNG question ')
+    ok, questionUuid = database.insertQuestion('CAIE', 'Physics', 'waves', '2', 'A Levels', '1', questionFile, uniqueFile(b'\x89PNG '), 'tester', '127.0.0.1')
+    assert ok
+    ok, duplicate = database.insertQuestion('CAIE', 'Physics', 'optics', '4', 'A Levels', '2', questionFile, uniqueFile(b'\x89PNG '), 'tester', '127.0.0.1')
+    assert not ok and duplicate['uuid'] == questionUuid
+
+    topicalFile = uniqueFile(b'%PDF-1.4 topical ')
+    ok, topicalUuid = database.insertTopical('CAIE', 'Physics', 'waves', topicalFile, uniqueFile(b'%PDF-1.4 '), 'tester', '127.0.0.1')
+    assert ok
+    ok, duplicate = database.insertTopical('CAIE', 'Physics', 'optics', topicalFile, uniqueFile(b'%PDF-1.4 '), 'tester', '127.0.0.1')
+    assert not ok and duplicate['uuid'] == topicalUuid
+
+
+def testSharedSolutionIsNotADuplicate(database):
+    solutionFile = uniqueFile(b'%PDF-1.4 mark scheme ')
+    for component in ('11', '12'):
+        ok, _ = database.insertPaper('CAIE', 'Chemistry', '2023', 'A Levels', component, uniqueFile(b'%PDF-1.4 '), solutionFile, 'tester', '127.0.0.1')
+        assert ok
+
+
+def testFindDuplicateFile(database):
+    questionFile = uniqueFile(b'\x89PNG question ')
+    questionHash = hashlib.sha256(questionFile).hexdigest()
+    assert database.findDuplicateFile('questions', questionHash) is None
+    assert database.findDuplicateFile('questions', None) is None
+
+    ok, questionUuid = database.insertQuestion('CAIE', 'Biology', 'cells', '1', 'A Levels', '1', questionFile, uniqueFile(b'\x89PNG '), 'tester', '127.0.0.1')
+    assert ok
+    assert database.findDuplicateFile('questions', questionHash)['uuid'] == questionUuid
+    assert database.findDuplicateFile('questions', questionHash, exclude=questionUuid) is None
+    assert database.findDuplicateFile('topicals', questionHash) is None
+
+
+def testApprovingACopyOfAnApprovedFileFails(database):
+    # Rows from before the hashes were recorded can share a file, insert never lets that happen
+    first = database.insertQuestion('CAIE', 'Biology', 'genes', '2', 'A Levels', '1', uniqueFile(b'\x89PNG '), uniqueFile(b'\x89PNG '), 'tester', '127.0.0.1')[1]
+    second = database.insertQuestion('CAIE', 'Biology', 'genes', '2', 'A Levels', '2', uniqueFile(b'\x89PNG '), uniqueFile(b'\x89PNG '), 'tester', '127.0.0.1')[1]
+    with database.pool.connection() as connection:
+        connection.execute('UPDATE questions SET questionHash = (SELECT questionHash FROM questions WHERE uuid = ?) WHERE uuid = ?', (first, second))
+        connection.commit()
+
+    # Either one can be approved while the other is waiting, approved rows are found first
+    assert database.approve_question('admin', first)
+    assert database.findDuplicateFile('questions', database.get_question(second, includeFiles=False)['questionHash'])['uuid'] == first
+    assert not database.approve_question('admin', second)
@@ -0,0 +1,65 @@
+import hashlib
+import os
+
+import pytest
+
+from fileCodecs import availableCodecs, getCodec
+
+# Text compresses well, random bytes stand in for an already compressed PDF
+sampleFiles = {
+    "empty": b"",
+    "text": b"%PDF-1.4 question paper " * 5000,
+    "random": os.urandom(300_000)
+}
+
+
+@pytest.mark.parametrize("codecName", availableCodecs())
+@pytest.mark.parametrize("fileName", sampleFiles)
+def testRoundTrip(codecName, fileName):
+    codec = getCodec(codecName)
+    data = sampleFiles[fileName]
+    assert codec.decompress(codec.compress(data)) == data
+
+
+@pytest.mark.parametrize("codecName", availableCodecs())
+def testStreamingRoundTrip(codecName):
+    codec = getCodec(codecName)
+    data = sampleFiles["text"] + sampleFiles["random"]
+
+    compressor = codec.compressor()
+    stored = b"".join(compressor.compress(data[start:start + 4096]) for start in range(0, len(data), 4096)) + compressor.flush()
+    decompressor = codec.decompressor()
+    restored = b"".join(decompressor.decompress(stored[start:start + 1000]) for start in range(0, len(stored), 1000)) + decompressor.flush()
+
+    assert restored == data
+
+
+def testZlibIsTheDefault():
+    assert getCodec(None).name == "zlib"
+    assert "zlib" in availableCodecs() and "none" in availableCodecs()
+
+
+def testUnknownCodecIsRejected():
+    with pytest.raises(ValueError):
+        getCodec("lzma")
+
+
+@pytest.mark.parametrize("codecName", availableCodecs())
+def testHashOfStoredFile(database, codecName):
+    data = sampleFiles["text"]
+    stored = getCodec(codecName).compress(data)
+    assert database.getHash(stored, codecName) == hashlib.sha256(data).hexdigest()
+
+
+@pytest.mark.parametrize("codecName", availableCodecs())
+def testStoredUploadReadsBack(database, monkeypatch, codecName):
+    monkeypatch.setattr(database.ingestQueue, "codec", getCodec(codecName))
+    questionFile = b"\x89PNG question " + os.urandom(8) + sampleFiles["text"]
+    ok, questionUuid = database.insertQuestion('CAIE', 'Physics', 'waves', '2', 'A Levels', '1',
+                                               questionFile, b"\x89PNG solution " + os.urandom(8), 'tester', '127.0.0.1')
+    assert ok
+
+    question = database.get_question(questionUuid)
+    assert question['fileState'] == 'ready'
+    assert question['questionCodec'] == codecName
+    assert getCodec(question['questionCodec']).decompress(question['questionFile']) == questionFile
@@ -0,0 +1,83 @@
+import pytest
+from flask import Flask
+from flask_login import LoginManager, UserMixin, login_user
+
+
+class Visitor(UserMixin):
+    id = "1"
+
+
+@pytest.fixture
+def client(database):
+    import httpCache
+
+    app = Flask(__name__)
+    app.secret_key = "test"
+    loginManager = LoginManager(app)
+    loginManager.user_loader(lambda userId: Visitor() if userId == Visitor.id else None)
+    renders = []
+
+    @app.route("/page/<name>")
+    @httpCache.conditionalPage()
+    def page(name):
+        renders.append(name)
+        return f"page {name}"
+
+    @app.route("/login")
+    def login():
+        login_user(Visitor())
+        return "ok"
+
+    client = app.test_client()
+    client.renders = renders
+    return client
+
+
+def testRepeatedRequestGets304(client):
+    first = client.get("/page/a")
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    assert etag.startswith('W/"')
+
+    second = client.get("/page/a", headers={"If-None-Match": etag})
+    assert second.status_code == 304
+    assert second.data == b""
+    assert second.headers["ETag"] == etag
+    assert client.renders == ["a"]
+
+
+def testEtagDependsOnRouteArguments(client):
+    etag = client.get("/page/a").headers["ETag"]
+    response = client.get("/page/b", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def testContentVersionBumpInvalidatesEtag(client, database):
+    etag = client.get("/page/a").headers["ETag"]
+    with database.pool.connection() as connection:
+        database.bumpContentVersion(connection)
+        connection.commit()
+
+    response = client.get("/page/a", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def testOtherVersionKeysDontInvalidateEtag(client, database):
+    etag = client.get("/page/a").headers["ETag"]
+    with database.pool.connection() as connection:
+        database.bumpContentVersion(connection, 'submissionVersion')
+        connection.commit()
+
+    assert client.get("/page/a", headers={"If-None-Match": etag}).status_code == 304
+
+
+def testLoggedInPagesAreNeverCached(client):
+    etag = client.get("/page/a").headers["ETag"]
+    client.get("/login")
+
+    response = client.get("/page/a", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert "ETag" not in response.headers
+    assert response.cache_control.private and response.cache_control.no_cache
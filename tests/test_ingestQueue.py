@@ -0,0 +1,52 @@
+import os
+
+import pytest
+
+from fileCodecs import getCodec
+from ingestQueue import runWorker
+
+
+def uniqueFile(prefix):
+    return prefix + os.urandom(16)
+
+
+def testWorkerProcessRoundTrip(tmp_path):
+    data = b"%PDF-1.4 question paper " * 5000
+    path = tmp_path / "upload.pdf"
+    path.write_bytes(data)
+
+    results, seconds = runWorker(([str(path), str(tmp_path / "gone.pdf")], 65536, 'zlib', None, 0.0))
+
+    (storedPath, codecName, rawSize, storedSize), missing = results
+    assert codecName == 'zlib' and rawSize == len(data) and storedSize < rawSize
+    with open(storedPath, 'rb') as stored:
+        assert getCodec('zlib').decompress(stored.read()) == data
+    assert missing == (None, None, 0, 0)
+    assert seconds >= 0
+
+
+def testWorkerProcessFailureIsRaised():
+    with pytest.raises(RuntimeError):
+        runWorker(([], 65536, 'no-such-codec', None, 0.0))
+
+
+def testAdminUploadIsApprovedOnceStored(database, monkeypatch):
+    approved = []
+    monkeypatch.setattr(database, 'paperApprovedListeners', [approved.append])
+
+    ok, paperUuid = database.insertPaper('CAIE', 'Biology', '2022', 'A Levels', '31', uniqueFile(b'%PDF-1.4 '), uniqueFile(b'%PDF-1.4 '), 'admin', '127.0.0.1', approveBy='admin')
+
+    assert ok
+    paper = database.get_paper(paperUuid, includeFiles=False)
+    assert paper['fileState'] == 'ready' and paper['approved']
+    assert approved == [paperUuid]
+    # The request is used up, a later ingestion of the same row does not approve it again
+    assert not database.approvePendingPaper(paperUuid)
+
+
+def testUploadWithoutApproveByWaitsForAnAdmin(database):
+    ok, paperUuid = database.insertPaper('CAIE', 'Biology', '2022', 'A Levels', '32', uniqueFile(b'%PDF-1.4 '), uniqueFile(b'%PDF-1.4 '), 'tester', '127.0.0.1')
+
+    assert ok
+    assert not database.get_paper(paperUuid, includeFiles=False)['approved']
+    assert not database.approvePendingPaper(paperUuid)
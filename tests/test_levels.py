@@ -0,0 +1,91 @@
+import pytest
+
+from dbPool import ConnectionPool
+
+
+@pytest.mark.parametrize("level, board, expected", [
+    ("A Levels", None, "a-level"),
+    ("A level", None, "a-level"),
+    ("AS Level", None, "a-level"),
+    ("AS Levels", None, "a-level"),
+    ("A-Level", None, "a-level"),
+    ("as-level", None, "a-level"),
+    ("  a LEVELS ", None, "a-level"),
+    ("11", "A Levels", "a-level"),
+    ("11", "NEB", "11"),
+    (" 12 ", None, "12"),
+    (11, None, "11"),
+    (11.0, None, "11"),
+    ("IGCSE", "CAIE", "IGCSE"),
+    ("O Level", None, "O Level"),
+    ("", None, None),
+    (None, None, None)
+])
+def testNormalizeLevel(database, level, board, expected):
+    assert database.normalizeLevel(level, board) == expected
+
+
+@pytest.fixture
+def oldDatabase(database, tmp_path, monkeypatch):
+    """A database from before levelKey existed, swapped in for the module's own"""
+    import dbMigrations
+
+    pool = ConnectionPool(str(tmp_path / "old.db"))
+    with pool.connection() as connection:
+        connection.executescript('''
+            CREATE TABLE papers (id INTEGER PRIMARY KEY, uuid TEXT, subject TEXT, year TEXT, board TEXT, level TEXT, component TEXT, approved BOOLEAN);
+            CREATE TABLE questions (id INTEGER PRIMARY KEY, uuid TEXT, subject TEXT, topic TEXT, difficulty INTEGER, board TEXT, level TEXT, component TEXT, approved BOOLEAN);
+            CREATE TABLE topicals (id INTEGER PRIMARY KEY, uuid TEXT, subject TEXT, topic TEXT, board TEXT, approved BOOLEAN);
+            INSERT INTO papers (uuid, subject, year, board, level, component, approved) VALUES
+                ('p1', 'Physics', '2023', 'CAIE', 'A Levels', '12', 1),
+                ('p2', 'Physics', '2022', 'CAIE', 'AS Level', '12', 1),
+                ('p3', 'Physics', '2021', 'CAIE', 'A-level', '22', 0),
+                ('p4', 'Science', '2080', 'NEB', '11', '1', 1);
+            INSERT INTO questions (uuid, subject, topic, difficulty, board, level, component, approved) VALUES
+                ('q1', 'Physics', 'waves', 3, 'CAIE', 'a level', '1', 1);
+            INSERT INTO topicals (uuid, subject, topic, board, approved) VALUES
+                ('t1', 'Physics', 'waves', 'A Levels', 1);
+        ''')
+
+    monkeypatch.setattr(database, "pool", pool)
+    monkeypatch.setattr(dbMigrations, "pool", pool)
+    database.catalogCache.clear()
+    yield pool
+    database.catalogCache.clear()
+    pool.close()
+
+
+def levelKeys(pool, table):
+    with pool.connection() as connection:
+        return dict(connection.execute(f"SELECT uuid, levelKey FROM {table}").fetchall())
+
+
+def testSchemaUpgradeFillsLevelKeys(database, oldDatabase):
+    database.createDatabase()
+
+    assert levelKeys(oldDatabase, "papers") == {"p1": "a-level", "p2": "a-level", "p3": "a-level", "p4": "11"}
+    assert levelKeys(oldDatabase, "questions") == {"q1": "a-level"}
+    assert levelKeys(oldDatabase, "topicals") == {"t1": "a-level"}
+
+    # Every A / AS level spelling is browsed and counted as one level
+    assert database.getYears("AS Level", "Physics") == [2023, 2022]
+    assert database.getYears("A Levels", "Physics") == [2023, 2022]
+    with oldDatabase.connection() as connection:
+        counters = connection.execute(
+            "SELECT approved, count FROM stats_counters WHERE tableName = 'papers' AND level = 'a-level' ORDER BY approved"
+        ).fetchall()
+    assert counters == [(0, 1), (1, 2)]
+
+
+def testBackfillLevelsRepairsKeys(database, oldDatabase):
+    import dbMigrations
+
+    database.createDatabase()
+    with oldDatabase.connection() as connection:
+        # Rows written by an older worker around the upgrade
+        connection.execute("UPDATE papers SET levelKey = 'AS Level' WHERE uuid = 'p2'")
+        connection.execute("UPDATE papers SET levelKey = NULL WHERE uuid = 'p4'")
+
+    assert dbMigrations.backfillLevels(batchSize=2) == 2
+    assert levelKeys(oldDatabase, "papers") == {"p1": "a-level", "p2": "a-level", "p3": "a-level", "p4": "11"}
+    assert dbMigrations.backfillLevels() == 0
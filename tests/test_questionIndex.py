@@ -0,0 +1,77 @@
+from array import array
+from collections import Counter
+
+import pytest
+
+from questionIndex import QuestionIndex, fillQuotas, maxFlow
+
+
+def makeBuckets(counts):
+    """Buckets holding counts[(topic, difficulty)] questions each, ids numbered from 1"""
+    buckets = []
+    nextId = 1
+    for (topic, difficulty), count in sorted(counts.items()):
+        key = ("CAIE", "Physics", "a-level", topic, "1", difficulty)
+        buckets.append((key, array("q", range(nextId, nextId + count))))
+        nextId += count
+    return buckets
+
+
+def cellsOf(buckets, questionIds):
+    cellById = {questionId: (key[3], key[5]) for key, ids in buckets for questionId in ids}
+    return Counter(cellById[questionId] for questionId in questionIds)
+
+
+@pytest.fixture
+def index():
+    return QuestionIndex(None, lambda: None)
+
+
+def testMaxFlowFindsTheMaximum():
+    # Both units only fit when a sends its unit through d, b has no other way to the sink
+    flow = maxFlow({
+        ("s", "a"): 1, ("s", "b"): 1,
+        ("a", "c"): 1, ("a", "d"): 1, ("b", "c"): 1,
+        ("c", "t"): 1, ("d", "t"): 1
+    }, "s", "t")
+    assert flow[("s", "a")] + flow[("s", "b")] == 2
+
+
+def testFillQuotasSplitsTheRestEvenly():
+    assert fillQuotas({"a": 4, "missing": 3}, ["a", "b", "c"], 10) == {"a": 4, "b": 3, "c": 3}
+    assert fillQuotas(None, ["a", "b", "c"], 5) == {"a": 2, "b": 2, "c": 1}
+
+
+def testQuotasAreMetWhenPossible(index):
+    # Only one topic has hard questions, so the difficulty quota forces the topic mix
+    buckets = makeBuckets({("mechanics", "1"): 20, ("mechanics", "5"): 20, ("waves", "1"): 20})
+    sampled = index.sampleBalanced(buckets, 10, topicQuotas={"mechanics": 5, "waves": 5},
+                                   difficultyQuotas={"1": 5, "5": 5}, seed=1)
+
+    assert len(sampled) == len(set(sampled)) == 10
+    assert cellsOf(buckets, sampled) == {("mechanics", "5"): 5, ("waves", "1"): 5}
+
+
+def testUnmetQuotasAreFilledFromTheRest(index):
+    buckets = makeBuckets({("mechanics", "1"): 2, ("waves", "1"): 20})
+    sampled = index.sampleBalanced(buckets, 10, topicQuotas={"mechanics": 8}, seed=2)
+
+    cells = cellsOf(buckets, sampled)
+    assert len(sampled) == len(set(sampled)) == 10
+    assert cells[("mechanics", "1")] == 2
+    assert cells[("waves", "1")] == 8
+
+
+def testSameSeedSameQuestions(index):
+    buckets = makeBuckets({("mechanics", "1"): 30, ("waves", "3"): 30, ("optics", "5"): 30})
+    first = index.sampleBalanced(buckets, 12, seed=7)
+
+    assert first == index.sampleBalanced(buckets, 12, seed=7)
+    assert first != index.sampleBalanced(buckets, 12, seed=8)
+    assert cellsOf(buckets, first) == {("mechanics", "1"): 4, ("waves", "3"): 4, ("optics", "5"): 4}
+
+
+def testNeverReturnsMoreThanAvailable(index):
+    buckets = makeBuckets({("mechanics", "1"): 3})
+    assert sorted(index.sampleBalanced(buckets, 10, seed=3)) == [1, 2, 3]
+    assert index.sampleBalanced([], 10, seed=3) == []
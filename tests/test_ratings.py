@@ -0,0 +1,92 @@
+import os
+import uuid
+
+import pytest
+
+
+@pytest.fixture
+def questionUuid(database):
+    ok, questionUuid = database.insertQuestion(
+        'CAIE', 'Physics', 'mechanics', '3', 'A Levels', '1',
+        b'\x89PNG question ' + os.urandom(16), b'\x89PNG solution ' + os.urandom(16), 'tester', '127.0.0.1'
+    )
+    assert ok
+    return questionUuid
+
+
+def histogram(database, questionUuid):
+    with database.pool.connection() as connection:
+        return connection.execute(
+            'SELECT one, two, three, four, five FROM questions WHERE uuid = ?', (questionUuid,)
+        ).fetchone()
+
+
+def ratingsOf(database, questionUuid):
+    with database.pool.connection() as connection:
+        return dict(connection.execute(
+            'SELECT user_id, rating FROM ratings WHERE question_UUID = ?', (questionUuid,)
+        ).fetchall())
+
+
+def testRatingsAreCounted(database, questionUuid):
+    assert database.applyRatings([('1', questionUuid, 5), ('2', questionUuid, 4), ('3', questionUuid, 5)]) == 3
+    assert ratingsOf(database, questionUuid) == {'1': 5, '2': 4, '3': 5}
+    assert histogram(database, questionUuid) == (0, 0, 0, 1, 2)
+
+
+def testRatingAgainReplacesTheVote(database, questionUuid):
+    database.applyRatings([('1', questionUuid, 2)])
+    assert database.applyRatings([('1', questionUuid, 4)]) == 1
+
+    assert ratingsOf(database, questionUuid) == {'1': 4}
+    assert histogram(database, questionUuid) == (0, 0, 0, 1, 0)
+
+
+def testSameRatingTwiceCountsOnce(database, questionUuid):
+    database.applyRatings([('1', questionUuid, 3)])
+    database.applyRatings([('1', questionUuid, 3)])
+    assert histogram(database, questionUuid) == (0, 0, 1, 0, 0)
+
+
+def testLastRatingInABatchWins(database, questionUuid):
+    assert database.applyRatings([('1', questionUuid, 1), ('1', questionUuid, 2), ('1', questionUuid, 5)]) == 1
+    assert ratingsOf(database, questionUuid) == {'1': 5}
+    assert histogram(database, questionUuid) == (0, 0, 0, 0, 1)
+
+
+def testInvalidRatingsAreSkipped(database, questionUuid):
+    assert database.applyRatings([('1', questionUuid, 0), ('2', questionUuid, 6), ('3', str(uuid.uuid4()), 4)]) == 0
+    assert database.applyRatings([]) == 0
+    assert ratingsOf(database, questionUuid) == {}
+
+
+def testScoreFollowsTheRatings(database, questionUuid):
+    with database.pool.connection() as connection:
+        before = connection.execute('SELECT ratingScore FROM questions WHERE uuid = ?', (questionUuid,)).fetchone()[0]
+    database.applyRatings([(str(user), questionUuid, 5) for user in range(1, 11)])
+    with database.pool.connection() as connection:
+        after = connection.execute('SELECT ratingScore FROM questions WHERE uuid = ?', (questionUuid,)).fetchone()[0]
+
+    assert before == pytest.approx(3)
+    assert 3 < after < 5
+
+
+def testRatingInsideAnOpenTransaction(database, questionUuid):
+    with database.pool.connection() as connection:
+        connection.execute("UPDATE questions SET topic = 'kinematics' WHERE uuid = ?", (questionUuid,))
+        assert connection.in_transaction
+
+        assert database.applyRatings([('1', questionUuid, 4)]) == 1
+        # The caller's transaction is still open, the ratings are committed with it
+        assert connection.in_transaction
+    assert ratingsOf(database, questionUuid) == {'1': 4}
+
+
+def testRatingsRollBackWithTheCaller(database, questionUuid):
+    with pytest.raises(RuntimeError):
+        with database.pool.connection() as connection:
+            connection.execute("UPDATE questions SET topic = 'kinematics' WHERE uuid = ?", (questionUuid,))
+            assert database.applyRatings([('1', questionUuid, 4)]) == 1
+            raise RuntimeError("failed")
+    assert ratingsOf(database, questionUuid) == {}
+    assert histogram(database, questionUuid) == (0, 0, 0, 0, 0)
@@ -0,0 +1,49 @@
+import os
+
+
+def uniqueFile(prefix):
+    return prefix + os.urandom(16)
+
+
+def submitPaper(database, component):
+    ok, paperUuid = database.insertPaper('CAIE', 'Economics', '2021', 'A Levels', component, uniqueFile(b'%PDF-1.4 '), uniqueFile(b'%PDF-1.4 '), 'tester', '127.0.0.1')
+    assert ok
+    return paperUuid
+
+
+def testUnapprovedFileIsNotCached(adminClient, database):
+    paperUuid = submitPaper(database, '11')
+
+    response = adminClient.get(f'/files/{paperUuid}/question')
+
+    assert response.status_code == 200
+    assert response.cache_control.private and response.cache_control.no_cache
+    assert not response.cache_control.public and not response.cache_control.max_age
+
+
+def testApprovedFileIsCachedForAMonth(adminClient, database):
+    paperUuid = submitPaper(database, '12')
+    assert database.approve_paper('admin', paperUuid)
+
+    response = adminClient.get(f'/files/{paperUuid}/question')
+
+    assert response.status_code == 200
+    assert response.cache_control.public and response.cache_control.max_age == 60 * 60 * 24 * 30
+    assert not response.cache_control.no_cache
+
+
+def testInlineFileIsHashedWithoutWriting(database):
+    paperUuid = submitPaper(database, '13')
+    data = b'%PDF-1.4 stored before the blob store'
+    # A row from before the blob store, its file inline and no hash recorded
+    with database.pool.connection() as connection:
+        connection.execute(
+            "UPDATE papers SET questionFile = ?, questionHash = NULL, questionCodec = 'none' WHERE uuid = ?",
+            (data, paperUuid)
+        )
+
+    reference = database.getFileReference(paperUuid, 'question')
+
+    assert reference["hash"] == database.getHash(data, 'none')
+    with database.pool.connection() as connection:
+        assert connection.execute('SELECT questionHash FROM papers WHERE uuid = ?', (paperUuid,)).fetchone()[0] is None
@@ -0,0 +1,62 @@
+import uuid
+
+import pytest
+
+
+@pytest.mark.parametrize("label, expected", [
+    ("2023 (May / June)", (2023, "may-june")),
+    ("2021 (Oct / Nov)", (2021, "oct-nov")),
+    ("2019 (feb / mar)", (2019, "feb-mar")),
+    ("Specimen 2020", (2020, "specimen")),
+    ("2023", (2023, None)),
+    (2023, (2023, None)),
+    ("2023 (Summer)", (2023, None)),
+    ("n/a", (None, None)),
+    ("", (None, None)),
+    (None, (None, None))
+])
+def testParseYear(database, label, expected):
+    assert database.parseYear(label) == expected
+
+
+def testFormatYear(database):
+    assert database.formatYear(2023, "may-june") == "2023 (May / June)"
+    assert database.formatYear(2023) == "2023"
+    assert database.formatYear(2023, "unknown") == "2023"
+
+
+@pytest.mark.parametrize("session", [None, "specimen", "feb-mar", "may-june", "oct-nov"])
+def testFormattedYearParsesBack(database, session):
+    assert database.parseYear(database.formatYear(2024, session)) == (2024, session)
+
+
+def testBackfillYears(database):
+    import dbMigrations
+
+    subject = "History (0470)"
+    labels = ["2023 (May / June)", "2023 (Oct / Nov)", "2022", "unknown"]
+    uuids = [str(uuid.uuid4()) for _ in labels]
+    with database.pool.connection() as connection:
+        for uuidStr, label in zip(uuids, labels):
+            # Rows from before the yearNumber / session columns existed
+            connection.execute('''
+                INSERT INTO papers (uuid, subject, year, board, level, levelKey, component, approved, fileState)
+                VALUES (?, ?, ?, 'CAIE', 'IGCSE', 'IGCSE', '12', 1, 'ready')
+            ''', (uuidStr, subject, label))
+
+    assert dbMigrations.backfillYears(batchSize=2) == 3
+    with database.pool.connection() as connection:
+        rows = dict((row[0], row[1:]) for row in connection.execute(
+            f"SELECT uuid, yearNumber, session FROM papers WHERE uuid IN ({', '.join('?' for _ in uuids)})", uuids
+        ))
+    assert [rows[uuidStr] for uuidStr in uuids] == [(2023, "may-june"), (2023, "oct-nov"), (2022, None), (None, None)]
+
+    # A second run finds nothing left it can parse
+    assert dbMigrations.backfillYears() == 0
+
+    # Browsing groups both 2023 sessions under one year and lists them by their labels
+    assert database.getYears("IGCSE", subject) == [2023, 2022]
+    assert sorted(database.getQuestions("IGCSE", subject, "2023")) == [
+        f"{subject}, 12, Year: 2023 (May / June) question paper",
+        f"{subject}, 12, Year: 2023 (Oct / Nov) question paper"
+    ]
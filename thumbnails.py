@@ -0,0 +1,180 @@
+import io
+import os
+import re
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from paperGuidesDB import pool, blobStore, bumpContentVersion, getFileReference, getCachedFilePath, detectMimeType
+from logHandler import getCustomLogger
+
+logger = getCustomLogger(__name__)
+
+# Pillow does the WebP encoding, PyMuPDF or poppler's pdftoppm rasterize the PDFs. All optional,
+# without them pages simply fall back to embedding the PDF.
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+try:
+    import pymupdf
+except ImportError:
+    pymupdf = None
+
+thumbnailWidths = sorted(int(width) for width in os.getenv('THUMBNAIL_WIDTHS', '320,640,1280').split(','))
+thumbnailMaxPages = int(os.getenv('THUMBNAIL_MAX_PAGES', 40))
+thumbnailQuality = int(os.getenv('THUMBNAIL_QUALITY', 75))
+
+# Rendering is slow compared to a request, approvals hand it to this executor and return straight away
+executor = ThreadPoolExecutor(max_workers=int(os.getenv('THUMBNAIL_WORKERS', 1)), thread_name_prefix="thumbnails")
+
+
+def thumbnailKey(contentHash, page, width):
+    """Blob store key of one rendered page, starts with the file hash so it fans out next to it"""
+    return f"{contentHash}-p{page}-w{width}.webp"
+
+
+def getRasterizer():
+    """Pick the PDF rasterizer from THUMBNAIL_RASTERIZER (auto, pymupdf, pdftoppm or none)"""
+    choice = os.getenv('THUMBNAIL_RASTERIZER', 'auto').lower()
+
+    if Image is None or choice == 'none':
+        return None
+    if choice in ('auto', 'pymupdf') and pymupdf is not None:
+        return 'pymupdf'
+    if choice in ('auto', 'pdftoppm') and shutil.which('pdftoppm'):
+        return 'pdftoppm'
+    return None
+
+
+def rasterize(path, rasterizer):
+    """
+    Yield (page number, PIL image) for the first pages of a PDF or the single page of an image.
+
+    Pages are rendered at the largest thumbnail width, smaller widths are scaled down from that.
+    """
+    mimetype = detectMimeType(path)
+    maxWidth = thumbnailWidths[-1]
+
+    if mimetype.startswith('image/'):
+        with Image.open(path) as image:
+            yield 1, image.convert('RGB')
+        return
+
+    if rasterizer == 'pymupdf':
+        with pymupdf.open(path) as document:
+            for index, page in enumerate(document):
+                if index >= thumbnailMaxPages:
+                    break
+                zoom = maxWidth / page.rect.width
+                pixmap = page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom), alpha=False)
+                yield index + 1, Image.frombytes('RGB', (pixmap.width, pixmap.height), pixmap.samples)
+
+    elif rasterizer == 'pdftoppm':
+        with tempfile.TemporaryDirectory() as directory:
+            subprocess.run(
+                ['pdftoppm', '-png', '-l', str(thumbnailMaxPages), '-scale-to-x', str(maxWidth), '-scale-to-y', '-1',
+                 path, os.path.join(directory, 'page')],
+                check=True, capture_output=True, timeout=300
+            )
+            # pdftoppm names the pages page-1.png or page-01.png depending on the page count
+            for name in sorted(os.listdir(directory), key=lambda name: int(re.findall(r'\d+', name)[-1])):
+                with Image.open(os.path.join(directory, name)) as image:
+                    yield int(re.findall(r'\d+', name)[-1]), image.convert('RGB')
+
+
+def renderThumbnails(contentHash, path):
+    """
+    Render the WebP thumbnails of one file into the blob store.
+
+    Returns:
+        int: Number of pages rendered, 0 when they already exist or no rasterizer is available
+    """
+    rasterizer = getRasterizer()
+    if Image is None or (rasterizer is None and not detectMimeType(path).startswith('image/')):
+        logger.debug(f"No rasterizer available, skipping thumbnails for {contentHash}")
+        return 0
+
+    with pool.connection() as connection:
+        if connection.execute('SELECT 1 FROM thumbnails WHERE contentHash = ? LIMIT 1', (contentHash,)).fetchone():
+            return 0
+
+    rows = []
+    for page, image in rasterize(path, rasterizer):
+        for width in thumbnailWidths:
+            resized = image.copy()
+            resized.thumbnail((width, width * 4))
+
+            output = io.BytesIO()
+            resized.save(output, 'WEBP', quality=thumbnailQuality, method=6)
+            data = output.getvalue()
+
+            blobStore.put(thumbnailKey(contentHash, page, width), data)
+            rows.append((contentHash, page, width, len(data)))
+
+    # Rows go in last so a page is only ever listed once all of its blobs exist
+    with pool.connection() as connection:
+        connection.executemany(
+            'INSERT OR IGNORE INTO thumbnails (contentHash, page, width, size) VALUES (?, ?, ?, ?)', rows
+        )
+        # Only the paper / topical pages embed thumbnails, they alone check this counter
+        bumpContentVersion(connection, 'thumbnailVersion')
+        connection.commit()
+
+    pages = len({row[1] for row in rows})
+    logger.info(f"Rendered {pages} thumbnail pages for {contentHash}")
+    return pages
+
+
+def generateThumbnails(uuid):
+    """Render the thumbnails of both files of a paper or topical"""
+    rendered = 0
+    for fileType in ('question', 'solution'):
+        reference = getFileReference(uuid, fileType)
+        if reference is None or reference['hash'] is None:
+            continue
+
+        path = getCachedFilePath(reference)
+        if path is None:
+            continue
+
+        try:
+            rendered += renderThumbnails(reference['hash'], path)
+        except Exception as e:
+            logger.error(f"Error rendering {fileType} thumbnails for {uuid}: {e}")
+    return rendered
+
+
+def queueThumbnails(uuid):
+    """Render the thumbnails of an approved paper / topical in the background"""
+    if Image is None:
+        return None
+    return executor.submit(generateThumbnails, uuid)
+
+
+def getThumbnails(contentHash):
+    """
+    List the rendered pages of a file.
+
+    Returns:
+        list: (page, [widths]) pairs in page order, empty when nothing was rendered yet
+    """
+    if not contentHash:
+        return []
+
+    try:
+        with pool.connection() as connection:
+            rows = connection.execute(
+                'SELECT page, width FROM thumbnails WHERE contentHash = ? ORDER BY page, width', (contentHash,)
+            ).fetchall()
+    except sqlite3.Error as e:
+        logger.error(f"Error listing thumbnails for {contentHash}: {e}")
+        return []
+
+    pages = {}
+    for page, width in rows:
+        pages.setdefault(page, []).append(width)
+    return list(pages.items())